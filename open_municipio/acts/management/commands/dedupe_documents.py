@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+from optparse import make_option
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db.models import FileField, get_models
+
+from open_municipio.om_utils.storage import content_addressed_storage
+
+
+class Command(BaseCommand):
+    """
+    Move the files of documents (attachments, speeches' audio files) saved
+    before the content-addressed storage was adopted into its layout, so that each
+    unique file is stored once, then remove the files that are not referenced anymore.
+    """
+    help = "Deduplicate the files of documents, storing them by content"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run',
+                    action='store_true',
+                    dest='dry_run',
+                    default=False,
+                    help='Only show what would be done'),
+        make_option('--collect-garbage',
+                    action='store_true',
+                    dest='collect_garbage',
+                    default=False,
+                    help='Only remove the stored files not referenced anymore'),
+        make_option('--min-age',
+                    type='int',
+                    dest='min_age',
+                    default=60 * 60,
+                    help='Do not remove files newer than this number of seconds'),
+        )
+
+    logger = logging.getLogger('import')
+
+    def handle(self, **options):
+        # fix logger level according to verbosity
+        verbosity = options['verbosity']
+        if verbosity == '0':
+            self.logger.setLevel(logging.ERROR)
+        elif verbosity == '1':
+            self.logger.setLevel(logging.WARNING)
+        elif verbosity == '2':
+            self.logger.setLevel(logging.INFO)
+        elif verbosity == '3':
+            self.logger.setLevel(logging.DEBUG)
+
+        storage = content_addressed_storage
+        dry_run = options['dry_run']
+
+        if not options['collect_garbage']:
+            old_names = set()
+            for model in get_models():
+                for field in model._meta.fields:
+                    if isinstance(field, FileField) and field.storage is storage:
+                        old_names.update(self.migrate(model, field, dry_run))
+
+            # remove the old copies, unless still referenced
+            referenced = storage.referenced_names()
+            n_removed = 0
+            for name in old_names - referenced:
+                if not dry_run:
+                    os.remove(storage.path(name))
+                n_removed += 1
+            self.logger.info("%d old files removed" % n_removed)
+
+        removed = storage.collect_garbage(min_age=options['min_age'], dry_run=dry_run)
+        for name in removed:
+            self.logger.debug("%s not referenced anymore, removed" % name)
+        self.logger.info("%d unreferenced files removed" % len(removed))
+
+    def migrate(self, model, field, dry_run=False):
+        """
+        Move the files of ``field`` into the content-addressed layout.
+        Return the set of the old names of the moved files.
+        """
+        storage = field.storage
+        old_names = set()
+        n_moved = 0
+        rows = model._default_manager.exclude(**{field.name: ''}).values_list('pk', field.name)
+        for (pk, name) in rows:
+            if storage.is_content_name(name):
+                continue
+            if not storage.exists(name):
+                self.logger.warning("%s #%s: file %s does not exist. Skipping." %
+                                    (model.__name__, pk, name))
+                continue
+
+            f = open(storage.path(name), 'rb')
+            try:
+                if dry_run:
+                    new_name = storage.content_name(name, File(f))
+                else:
+                    new_name = storage.save(name, File(f))
+                    model._default_manager.filter(pk=pk).update(**{field.name: new_name})
+            finally:
+                f.close()
+            self.logger.debug("%s #%s: %s -> %s" % (model.__name__, pk, name, new_name))
+            old_names.add(name)
+            n_moved += 1
+
+        self.logger.info("%s.%s: %d files moved" % (model.__name__, field.name, n_moved))
+        return old_names
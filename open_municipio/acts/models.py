@@ -20,8 +20,10 @@ from model_utils.models import TimeStampedModel
 from model_utils.fields import StatusField
 
 from open_municipio.newscache.models import News, NewsTargetMixin
+from open_municipio.acts import news as deferred_news
 
 from open_municipio.people.models import Institution, InstitutionCharge, Person
+from open_municipio.om_utils.storage import content_addressed_storage
 from open_municipio.taxonomy.managers import TopicableManager
 from open_municipio.monitoring.models import MonitorizedItem, Monitoring
 
@@ -621,7 +623,8 @@ class Document(TimeStampedModel):
     text = models.TextField(blank=True)
     text_url = models.URLField(blank=True)
     file_url = models.URLField(blank=True)
-    file = models.FileField(upload_to="attached_documents/%Y%m%d", blank=True, max_length=255)
+    # files are stored once, by content (see ``om_utils.storage``)
+    file = models.FileField(upload_to="attached_documents/%Y%m%d", storage=content_addressed_storage, blank=True, max_length=255)
     
     class Meta:
         abstract = True
@@ -661,7 +664,7 @@ class Speech(Document):
     related_act_set = models.ManyToManyField('Act', through='ActHasSpeech')
     seq_order = models.IntegerField(default=0)
     audio_url = models.URLField(blank=True)
-    audio_file = models.FileField(upload_to="attached_audio/%Y%m%d", blank=True, max_length=255)
+    audio_file = models.FileField(upload_to="attached_audio/%Y%m%d", storage=content_addressed_storage, blank=True, max_length=255)
 
     class Meta(Document.Meta):
         verbose_name = _('speech')
@@ -728,6 +731,10 @@ def new_signature(**kwargs):
     # for signatures after presentation_date
     if not kwargs.get('raw', False):
         signature = kwargs['instance']
+        # see ``acts.news.news_generation_deferred``
+        if deferred_news.is_deferred():
+            deferred_news.defer_signature(signature)
+            return
         act = signature.act.downcast()
         signer = signature.charge
         # define context for textual representation of the news
@@ -754,7 +761,8 @@ def new_signature(**kwargs):
                 related_object_pk=act.pk,
                 related_content_type=ContentType.objects.get_for_model(act),
                 priority=3,
-                text=News.get_text_for_news(ctx, 'newscache/act_signed_after_presentation.html')
+                text=News.get_text_for_news(ctx, 'newscache/act_signed_after_presentation.html'),
+                defaults={'news_date': signature.support_date}
             )
             if created:
                 logger.debug("  act was signed after presentation news created")
@@ -769,7 +777,8 @@ def new_signature(**kwargs):
             related_object_pk=signer.pk,
             related_content_type=ContentType.objects.get_for_model(signer),
             priority=2,
-            text=News.get_text_for_news(ctx, 'newscache/person_signed.html')
+            text=News.get_text_for_news(ctx, 'newscache/person_signed.html'),
+            defaults={'news_date': signature.support_date}
         )
         if created:
             logger.debug("  user signed act news created")
@@ -797,6 +806,10 @@ def delete_signature(**kwargs):
 def new_transition(**kwargs):
     if not kwargs.get('raw', False):
         transition = kwargs['instance']
+        # see ``acts.news.news_generation_deferred``
+        if deferred_news.is_deferred():
+            deferred_news.defer_transition(transition, created=kwargs.get('created', False))
+            return
         act = transition.act.downcast()
 
         # modify act's status only when transition is created
@@ -824,7 +837,8 @@ def new_transition(**kwargs):
                 related_object_pk=act.pk,
                 related_content_type=ContentType.objects.get_for_model(act),
                 priority=1,
-                text=News.get_text_for_news(ctx, 'newscache/act_presented.html')
+                text=News.get_text_for_news(ctx, 'newscache/act_presented.html'),
+                defaults={'news_date': transition.transition_date}
             )
             if created:
                 logger.debug("  act presentation news created")
@@ -839,7 +853,8 @@ def new_transition(**kwargs):
                 related_object_pk=act.pk,
                 related_content_type=ContentType.objects.get_for_model(act),
                 priority=1,
-                text=News.get_text_for_news(ctx, 'newscache/act_changed_status.html')
+                text=News.get_text_for_news(ctx, 'newscache/act_changed_status.html'),
+                defaults={'news_date': transition.transition_date}
             )
             if created:
                 logger.debug("  act changed status news created")
@@ -0,0 +1,193 @@
+"""
+Deferred, batched generation of the news of acts' signatures and transitions.
+
+Normally, the ``new_signature`` and ``new_transition`` signal handlers
+generate the news of each ``ActSupport`` and ``Transition`` as soon as it is saved.
+Within a ``news_generation_deferred()`` block (e.g. an import run), the handlers
+just take note of the saved records; on exit, all pending news are generated
+in a single pass:
+
+* records, their acts and charges are fetched with a few queries
+* each news template is loaded once, and rendered for every record
+* news that already exist are skipped, the others are inserted in bulk
+* the status of each act with new transitions is updated once, from its last new transition
+
+Usage::
+
+    with news_generation_deferred():
+        # save signatures and transitions
+        ...
+"""
+from contextlib import contextmanager
+import logging
+import re
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.db.models import Q
+from django.template.context import Context
+from django.template.loader import get_template
+
+
+logger = logging.getLogger('import')
+
+# the pending records, within a ``news_generation_deferred`` block
+_pending = None
+
+
+def is_deferred():
+    """
+    Return ``True`` within a ``news_generation_deferred`` block.
+    """
+    return _pending is not None
+
+
+def defer_signature(signature):
+    _pending['signatures'].add(signature.pk)
+
+
+def defer_transition(transition, created=False):
+    _pending['transitions'].add(transition.pk)
+    if created:
+        _pending['created_transitions'].add(transition.pk)
+
+
+def defer_act(act):
+    """
+    Take note of all the signatures and transitions of ``act``, so that
+    their news are (re-)generated on exit (e.g. after the news of the act have been removed).
+    """
+    _pending['signatures'].update(act.actsupport_set.values_list('pk', flat=True))
+    _pending['transitions'].update(act.transition_set.values_list('pk', flat=True))
+
+
+@contextmanager
+def news_generation_deferred(lock=None):
+    """
+    Defer the generation of the news of signatures and transitions
+    saved within the block, to its exit. Nested blocks are merged into the outer one.
+
+    ``lock`` is an optional context manager, held while generating the news.
+    """
+    global _pending
+    if _pending is not None:
+        yield
+        return
+
+    _pending = {'signatures': set(), 'transitions': set(), 'created_transitions': set()}
+    try:
+        yield
+    finally:
+        pending, _pending = _pending, None
+        if lock is None:
+            generate_pending_news(**pending)
+        else:
+            with lock:
+                generate_pending_news(**pending)
+
+
+def generate_pending_news(signatures=(), transitions=(), created_transitions=()):
+    """
+    Generate the news of the given signatures and transitions (primary keys),
+    and update the status of the acts of the given created transitions.
+    """
+    from open_municipio.acts.models import Act, ActSupport, Transition
+    from open_municipio.newscache.models import News
+    from open_municipio.newscache.timeline import fan_out
+    from open_municipio.taxonomy.news import invalidate_act_topic_news, is_act_content_type
+
+    if not (signatures or transitions):
+        return
+
+    site = Site.objects.get(id=settings.SITE_ID)
+    signature_type = ContentType.objects.get_for_model(ActSupport)
+    transition_type = ContentType.objects.get_for_model(Transition)
+    templates = {}
+
+    def render(template_file, context):
+        if template_file not in templates:
+            templates[template_file] = get_template(template_file)
+        # as in ``News.get_text_for_news``
+        return re.sub("\s+", " ", templates[template_file].render(Context(context)).strip())
+
+    signatures = list(ActSupport.objects.filter(pk__in=list(signatures)).select_related('charge__person'))
+    transitions = list(Transition.objects.filter(pk__in=list(transitions)).order_by('pk'))
+
+    # downcasted acts, fetched at once
+    act_ids = set(s.act_id for s in signatures) | set(t.act_id for t in transitions)
+    acts = dict((act.pk, act) for act in Act.objects.filter(pk__in=list(act_ids)).select_subclasses())
+
+    # update acts' status, from their last created transition
+    last_transitions = {}
+    for t in transitions:
+        if t.pk in created_transitions:
+            last_transitions[t.act_id] = t
+    for (act_id, t) in last_transitions.items():
+        act = acts[act_id]
+        act.status = t.final_status
+        act.save()
+        if act.is_final_status(act.status):
+            act.act_ptr.status_is_final = True
+            act.act_ptr.save()
+
+    # build the news, as in the ``new_signature`` and ``new_transition`` handlers
+    news = []
+    for s in signatures:
+        act = acts[s.act_id]
+        act_type = ContentType.objects.get_for_model(act)
+        ctx = {'current_site': site, 'signature': s, 'act': act, 'signer': s.charge}
+        if s.support_date and act.presentation_date and s.support_date > act.presentation_date:
+            news.append(News(
+                generating_object_pk=s.pk, generating_content_type=signature_type,
+                related_object_pk=act.pk, related_content_type=act_type, priority=3,
+                text=render('newscache/act_signed_after_presentation.html', ctx), news_date=s.support_date
+            ))
+        news.append(News(
+            generating_object_pk=s.pk, generating_content_type=signature_type,
+            related_object_pk=s.charge.pk, related_content_type=ContentType.objects.get_for_model(s.charge),
+            priority=2, text=render('newscache/person_signed.html', ctx), news_date=s.support_date
+        ))
+    for t in transitions:
+        act = acts[t.act_id]
+        ctx = {'current_site': site, 'transition': t, 'act': act}
+        if t.final_status == 'PRESENTED':
+            template_file = 'newscache/act_presented.html'
+        else:
+            template_file = 'newscache/act_changed_status.html'
+        news.append(News(
+            generating_object_pk=t.pk, generating_content_type=transition_type,
+            related_object_pk=act.pk, related_content_type=ContentType.objects.get_for_model(act),
+            priority=1, text=render(template_file, ctx), news_date=t.transition_date
+        ))
+
+    # skip the news that already exist
+    def key(n):
+        return (n.generating_content_type_id, n.generating_object_pk,
+                n.related_content_type_id, n.related_object_pk, n.priority, n.text)
+    existing = set()
+    for (content_type, pks) in ((signature_type, [s.pk for s in signatures]),
+                                (transition_type, [t.pk for t in transitions])):
+        if pks:
+            existing.update(News.objects.filter(
+                generating_content_type=content_type, generating_object_pk__in=pks
+            ).values_list('generating_content_type', 'generating_object_pk',
+                          'related_content_type', 'related_object_pk', 'priority', 'text'))
+    news = [n for n in news if key(n) not in existing]
+
+    # insert in batches, to stay within the DB limits on query parameters
+    for start in range(0, len(news), 100):
+        News.objects.bulk_create(news[start:start + 100])
+
+    # bulk inserts send no signals: copy the news into the feeds' timelines,
+    # and invalidate the cached feeds of topics
+    if news:
+        fan_out(News.objects.filter(
+            Q(generating_content_type=signature_type, generating_object_pk__in=[s.pk for s in signatures]) |
+            Q(generating_content_type=transition_type, generating_object_pk__in=[t.pk for t in transitions])
+        ))
+        invalidate_act_topic_news(set(n.related_object_pk for n in news
+                                      if is_act_content_type(n.related_content_type_id)))
+
+    logger.info("%d news generated for %d signatures and %d transitions" %
+                (len(news), len(signatures), len(transitions)))
@@ -17,6 +17,7 @@ from open_municipio.acts.forms import ActDescriptionForm, ActTransitionForm, Act
 from open_municipio.locations.models import Location
 
 from open_municipio.monitoring.forms import MonitoringForm
+from open_municipio.monitoring.membership import is_monitoring
 
 from open_municipio.om_search.forms import RangeFacetedSearchForm
 from open_municipio.om_search.mixins import FacetRangeDateIntervalsMixin
@@ -262,7 +263,7 @@ class ActDetailView(DetailView):
                     'user_id': self.request.user.id
                 })
                 
-                if act in self.request.user.get_profile().monitored_objects:
+                if is_monitoring(self.request.user, act):
                     context['is_user_monitoring'] = True
         except ObjectDoesNotExist:
             context['is_user_monitoring'] = False
@@ -7,6 +7,13 @@ class FileImportAdmin(admin.ModelAdmin):
     list_filter = ('import_type', 'import_started_at')
     search_fields = ('file_path',)
 
+class TextExtractionAdmin(admin.ModelAdmin):
+    list_display = ('attach', 'status', 'n_attempts', 'created_at', 'updated_at')
+    list_filter = ('status', 'is_proposal')
+    search_fields = ('sha1',)
+    raw_id_fields = ('attach',)
+
 
 admin.site.register(FileImport, FileImportAdmin)
+admin.site.register(TextExtraction, TextExtractionAdmin)
 
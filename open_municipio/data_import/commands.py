@@ -1,22 +1,26 @@
 # -*- coding: utf-8 -*-
 from optparse import make_option
+import hashlib
 import os
 import re
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 from django.core.management.base import LabelCommand, CommandError, BaseCommand
 from django.core.files import File
 
-from lxml import etree, html
+from lxml import etree
 from os import path
 
-from haystack.backends.solr_backend import SolrSearchBackend
-from pysolr import SolrError
 from open_municipio.people.models import Person, municipality
 from open_municipio.acts.models import *
+from open_municipio.acts.news import defer_act, news_generation_deferred
 
 import logging
 
 from open_municipio.data_import import conf
+from open_municipio.data_import.extraction import enqueue_extraction
+from open_municipio.data_import.models import ImportFingerprint
+from open_municipio.data_import.parallel import import_labels, import_lock
+from open_municipio.data_import.utils import PeopleMapping, file_sha1
 
 # configure xml namespaces
 NS = {
@@ -40,6 +44,24 @@ class ImportVotationsCommand(LabelCommand):
                     default=False,
                     help='Execute without actually writing into the DB'
         ),
+        make_option('--bulk',
+                    action='store_true',
+                    dest='bulk',
+                    default=False,
+                    help='Write the votes of each sitting in bulk, within a single transaction, and report rows/s'
+        ),
+        make_option('--streaming',
+                    action='store_true',
+                    dest='streaming',
+                    default=False,
+                    help='Read and write one sitting at a time, keeping memory usage flat'
+        ),
+        make_option('--workers',
+                    type='int',
+                    dest='workers',
+                    default=1,
+                    help='Import the files with a pool of N worker processes'
+        ),
     )
 
     args = "<filename filename ...>"
@@ -51,20 +73,33 @@ class ImportVotationsCommand(LabelCommand):
     logger = logging.getLogger('import')
 
     people_tree = None
+    people_mapping = None
 
     def handle_label(self, filename, **options):
         raise Exception("Not implemented")
 
-    def handle(self, *labels, **options):
-        if not labels:
-            raise CommandError('Enter at least one %s.' % self.label)
+    def read_sittings(self, reader, **options):
+        """
+        Return the sittings read by ``reader``, to be passed to a votation writer:
+        a generator yielding one sitting at a time, with ``--streaming``,
+        the whole list of sittings otherwise.
+        """
+        if options.get('streaming'):
+            return reader.iter_sittings()
+        return reader.read()
 
+    def setup_import(self, **options):
+        """
+        Set up the command (people mapping, options and logger level) before importing;
+        called once by the command, or once by each worker, with ``--workers``.
+        """
         # parse people xml file into an lxml.etree
         people_file = options['people_file']
         if not path.isfile(people_file):
             raise IOError("File %s does not exist" % people_file)
 
         self.people_tree = etree.parse(people_file)
+        self.people_mapping = PeopleMapping.for_tree(self.people_tree)
 
         self.dry_run = options['dry_run']
 
@@ -79,10 +114,14 @@ class ImportVotationsCommand(LabelCommand):
         elif verbosity == '3':
             self.logger.setLevel(logging.DEBUG)
 
+    def handle(self, *labels, **options):
+        if not labels:
+            raise CommandError('Enter at least one %s.' % self.label)
+
+        self.setup_import(**options)
 
         # parse passed votations
-        for label in labels:
-            self.handle_label(label, **options)
+        import_labels(self, labels, **options)
         return 'done'
 
 
@@ -116,6 +155,24 @@ class ImportActsCommand(LabelCommand):
                     default=False,
                     help="Remove act's presenters before importing."
         ),
+        make_option('--incremental',
+                    action='store_true',
+                    dest='incremental',
+                    default=False,
+                    help="Skip acts whose XML and attachments did not change since the last import."
+        ),
+        make_option('--streaming',
+                    action='store_true',
+                    dest='streaming',
+                    default=False,
+                    help="Parse files incrementally, handling one act at a time, to keep memory usage constant."
+        ),
+        make_option('--workers',
+                    type='int',
+                    dest='workers',
+                    default=1,
+                    help='Import the files with a pool of N worker processes'
+        ),
     )
 
     args = "<filename filename ...>"
@@ -127,59 +184,26 @@ class ImportActsCommand(LabelCommand):
     logger = logging.getLogger('import')
 
     people_tree = None
+    people_mapping = None
+
+    incremental = False
+    streaming = False
+
+    # fingerprints of the act being imported, and those stored in the DB
+    act_key = None
+    fingerprints = {}
+    stored_fingerprints = {}
 
     def lookupCharge(self, xml_chargexref, institution=None, moment=None):
         """
         look for the correct open municipio charge, or return None
         if the date parameter is not passed, then current charges are looked up
-        """
-        try:
-            file, charge_id = xml_chargexref.get(XLINK+"href").split("#")
-            people_charges = self.people_tree.xpath(
-                '//om:Person[@id="%s"]' % charge_id,
-                namespaces=NS
-            )
-            if len(people_charges):
-                om_id = people_charges[0].get('om_id')
-                if om_id is None:
-                    self.logger.warning("charge with id %s has no om_id (past charge?). Skipping." % charge_id)
-                    return None
-                charge_type = people_charges[0].get('charge')
-                if charge_type is None:
-                    self.logger.warning("charge with id %s has no charge attribute. Skipping." % charge_id)
-                    return None
-
-                # institution is grabbed from charge attribute, in acts import
-                # since mayor and deputies may sign acts, not only counselor
-                if charge_type == 'counselor':
-                    institution = municipality.council.as_institution
-                elif charge_type == 'deputy' or charge_type == 'firstdeputy':
-                    institution = municipality.gov.as_institution
-                elif charge_type == 'mayor':
-                    institution = municipality.mayor.as_institution
-                else:
-                    self.logger.error("Warning: charge with id %s has wrong charge attribute %s. Skipping." %
-                                      (charge_id, charge_type))
-                    return None
 
-                try:
-                    person = Person.objects.get(pk=int(om_id))
-                    charge = person.get_current_charge_in_institution(institution, moment=moment)
-                    self.logger.debug("id %s (%s) mapped to %s (%s)" %
-                                      (charge_id, charge_type, person, charge))
-                    return charge
-                except ObjectDoesNotExist:
-                    self.logger.warning("could not find person or charge for id = %s in open municipio DB. Skipping." % charge_id)
-                    return None
-                except MultipleObjectsReturned:
-                    self.logger.error("found more than one person or charge for id %s in open municipio db. Skipping." % charge_id)
-                    return None
-            else:
-                self.logger.warning("could not find person for id %s in people XML file. Skipping." % charge_id)
-                return None
-        except ObjectDoesNotExist:
-            self.logger.warning("could not find charge for %s in Open Municipio DB. Skipping." % xml_chargexref)
-            return None
+        the institution is always grabbed from the charge attribute in the people file,
+        since mayor and deputies may sign acts, not only counselor
+        """
+        file, charge_id = xml_chargexref.get(XLINK+"href").split("#")
+        return self.people_mapping.lookup_charge(charge_id, moment=moment)
 
     def fetch_signers(self, om_act, xml_subscribers_set, support_type, charge_lookup_institution):
         """
@@ -215,6 +239,119 @@ class ImportActsCommand(LabelCommand):
             if not self.dry_run:
                 om_as.save()
 
+    def iter_xml_acts(self, filename, act_tag):
+        """
+        Generate the act elements (om:<act_tag>) contained in an XML file.
+
+        Each act is handled within the import lock of its id, so that
+        two workers never write the same act (and its news) at the same time.
+        """
+        for xml_act in self.parse_xml_acts(filename, act_tag):
+            with import_lock("act:%s:%s" % (act_tag, xml_act.get("id"))):
+                yield xml_act
+
+    def parse_xml_acts(self, filename, act_tag):
+        """
+        Generate the act elements (om:<act_tag>) contained in an XML file.
+
+        In streaming mode, the file is parsed incrementally: each element is yielded
+        as soon as it is completed, and cleared from the tree as soon as it has been handled.
+        Otherwise, the whole file is parsed, and the root element is yielded,
+        if it is an act of the given type.
+        """
+        if not self.streaming:
+            try:
+                tree = etree.parse(filename)
+            except etree.XMLSyntaxError:
+                self.logger.error("Syntax error while parsing %s. Skipping." % (filename,))
+                return
+
+            acts = tree.xpath("/om:%s" % act_tag, namespaces=NS)
+            self.logger.info("%d %s to import" % (len(acts), act_tag))
+            for xml_act in acts:
+                yield xml_act
+            return
+
+        context = etree.iterparse(filename, events=('end',), tag="{%s}%s" % (NS['om'], act_tag))
+        try:
+            for event, xml_act in context:
+                yield xml_act
+
+                # free the memory used by the act and by its already handled siblings
+                xml_act.clear()
+                while xml_act.getprevious() is not None:
+                    del xml_act.getparent()[0]
+        except etree.XMLSyntaxError:
+            self.logger.error("Syntax error while parsing %s. Skipping the rest of the file." % (filename,))
+        del context
+
+    def get_attach_file(self, filename, xml_attach):
+        """
+        Return the path of the file of an om:Attachment node,
+        or None if the node has no xlink:href attribute
+        """
+        attach_href = xml_attach.get(XLINK+"href")
+        if attach_href is None:
+            return None
+        return path.join(path.dirname(filename), attach_href).encode('utf8')
+
+    def attach_key(self, xml_attach):
+        """
+        Return the fingerprint key of an om:Attachment node of the act being imported:
+        the key of the act and the xlink:href attribute, which do not depend
+        on the path the XML file is read from
+        """
+        return u"%s:%s" % (self.act_key, xml_attach.get(XLINK+"href"))
+
+    def compute_fingerprints(self, filename, xml_act, act_key):
+        """
+        Compute the content hashes of the XML fragment of an act and of its attachments,
+        and fetch the ones stored at the previous import.
+
+        Return True if nothing changed since the previous import.
+        """
+        self.act_key = act_key
+        self.fingerprints = {
+            (ImportFingerprint.ITEM_TYPE.act, act_key): hashlib.sha1(etree.tostring(xml_act)).hexdigest()
+        }
+        for xml_attach in xml_act.xpath("./om:Attachment", namespaces=NS):
+            attach_file = self.get_attach_file(filename, xml_attach)
+            if attach_file is not None and path.isfile(attach_file):
+                self.fingerprints[(ImportFingerprint.ITEM_TYPE.attach, self.attach_key(xml_attach))] = \
+                    file_sha1(attach_file)
+
+        self.stored_fingerprints = dict(
+            ((f.item_type, f.key), f.sha1) for f in ImportFingerprint.objects.filter(
+                key__in=[key for (item_type, key) in self.fingerprints]
+            )
+        )
+        return all(
+            self.stored_fingerprints.get(item) == sha1 for (item, sha1) in self.fingerprints.items()
+        )
+
+    def attach_unchanged(self, xml_attach):
+        """
+        True if, in incremental mode, the file of the om:Attachment node did not change
+        since the previous import
+        """
+        if not self.incremental:
+            return False
+        item = (ImportFingerprint.ITEM_TYPE.attach, self.attach_key(xml_attach))
+        return item in self.fingerprints and \
+            self.stored_fingerprints.get(item) == self.fingerprints[item]
+
+    def store_fingerprints(self):
+        """
+        Store the fingerprints of the act just imported
+        """
+        if self.dry_run:
+            return
+        for ((item_type, key), sha1) in self.fingerprints.items():
+            if self.stored_fingerprints.get((item_type, key)) == sha1:
+                continue
+            ImportFingerprint.objects.filter(item_type=item_type, key=key).delete()
+            ImportFingerprint.objects.create(item_type=item_type, key=key, sha1=sha1)
+
     def fetch_attachments(self, filename, om_act, xml_act):
         """
         fetch all attachments for the act in the XML
@@ -241,7 +378,7 @@ class ImportActsCommand(LabelCommand):
                 continue
 
             attach_dir = attach_href.split('/')[-2]
-            attach_file = path.join(path.dirname(filename), attach_href).encode('utf8')
+            attach_file = self.get_attach_file(filename, xml_attach)
             if not path.isfile(attach_file):
                 self.stderr.write("File %s does not exist. Skipping!\n" % attach_file)
                 continue
@@ -251,27 +388,32 @@ class ImportActsCommand(LabelCommand):
                 act=om_act,
                 title=attach_title
             )
+
+            # unchanged files are neither rewritten nor extracted again
+            if not created and self.attach_unchanged(xml_attach):
+                self.logger.info(" attach %s unchanged" % (attach_file, ))
+                continue
             om_att.document_date = om_act.presentation_date
             if not self.dry_run:
                 om_att.save()
 
-            # remove old attach file to avoid _1 files whenb rewriting
-            if not self.dry_run:
-                try:
-                    old_attach_file = om_att.file.file
-                    os.remove(old_attach_file.name)
-                except ValueError:
-                    pass
-                except IOError:
-                    pass
-
-            # overwrite attach file and save it under media (/uploads)
+            # save attach file under media (/uploads);
+            # files are stored once, by content, so an unchanged file is neither
+            # written nor extracted again, and old files are never removed here,
+            # since they may be shared with other attachments
             attach_filename = path.basename(attach_file)
             attach_f = open(attach_file, 'r')
 
+            file_unchanged = False
             if not self.dry_run:
                 try:
-                    om_att.file.save("%s_%s" % (attach_dir, attach_filename.decode('utf8')), File(attach_f))
+                    attach_name = "%s_%s" % (attach_dir, attach_filename.decode('utf8'))
+                    storage_name = om_att.file.storage.content_name(
+                        om_att.file.field.generate_filename(om_att, attach_name), File(attach_f)
+                    )
+                    file_unchanged = om_att.file.name == storage_name
+                    if not file_unchanged:
+                        om_att.file.save(attach_name, File(attach_f))
                 except UnicodeDecodeError:
                     self.logger.error("Could not save attachment with unicode characters: %s. Skipping." % (attach_filename,))
 
@@ -281,71 +423,15 @@ class ImportActsCommand(LabelCommand):
             if not self.dry_run:
                 om_att.save()
 
-            # text extraction (using tika inside solr)
+            # text extraction is queued, and done asynchronously (see the ``extract_texts`` command)
             if 'testoproposta' in attach_filename.lower() or\
                'testodiscussione' in attach_filename.lower():
+                if not self.dry_run and om_att.file and not file_unchanged:
+                    # for proposals, text content goes into act's content field, as well
+                    enqueue_extraction(om_att, is_proposal='testoproposta' in attach_filename.lower())
+                    self.logger.info("  text extraction queued")
 
-                """
-                Streamlines content extraction from a doc (pdf, or other format file, as specified in Tika) within a solr request.
-                Requires Haystack 2.0.0.
-                Handles unicode characters, as well.
-
-                In settings, define this hash:
-                HAYSTACK_CONNECTIONS = {
-                    'default': {
-                        'ENGINE': 'haystack.backends.solr_backend.SolrEngine',
-                        'URL': 'http://127.0.0.1:8983/solr',
-                        'TIMEOUT': 60 * 5,
-                        'BATCH_SIZE': 100,
-                        'SEARCH_RESULTS_PER_PAGE': 10,
-                    }
-                }
-
-
-                from django.conf import settings
-                from haystack.backends.solr_backend import SolrSearchBackend
-                from lxml import html
-
-                file_path = '/Users/guglielmo/Workspace/open_municipio/test_data/acts/20120622_ATTI_2008/DC_2008401100013/TestoProposta.doc'
-                solr_backend = SolrSearchBackend('default', **settings.HAYSTACK_CONNECTIONS['default'])
-
-                attach_f = open(file_path)
-                file_content = solr_backend.extract_file_contents(attach_f)
-                html_content = html.fromstring(file_content['contents'].encode('utf-8'))
-                document_text = html_content.cssselect('body')[0].text_content()
-
-                print document_text
-                """
-
-
-                # reset attach file pointer
-                attach_f.seek(0)
-
-                # text extraction, through haystack-solr and lxml.html
-                solr_backend = SolrSearchBackend('default', **settings.HAYSTACK_CONNECTIONS['default'])
-
-                try:
-                    file_content = solr_backend.extract_file_contents(attach_f)
-                    html_content = html.fromstring(file_content['contents'].encode('utf-8'))
-                    document_text = html_content.cssselect('body')[0].text_content()
-
-                    self.logger.info("  textual content extracted from file")
-
-                    # text content saved into attachment's text
-                    om_att.text = document_text
-                    if not self.dry_run:
-                        om_att.save()
-
-                    # for proposale, text content goes into act's content field
-                    if 'testoproposta' in attach_filename.lower():
-                        self.logger.info("  textual version of proposal added to act")
-                        om_act.text = document_text
-                        if not self.dry_run:
-                            om_act.save()
-                except SolrError:
-                    self.logger.warning("  could not extract textual content with solr-tika")
-
-                attach_f.close()
+            attach_f.close()
 
     def remove_news(self, act):
         """
@@ -368,6 +454,9 @@ class ImportActsCommand(LabelCommand):
         ).delete()
         self.logger.debug("  news generated by ActSupport removed")
 
+        # re-generate the news of all signatures and transitions, at the end of the file
+        defer_act(act)
+
     def handle_deliberation(self, filename, **options):
         """
         handles both council deliberation and city government deliberation parsing
@@ -376,25 +465,17 @@ class ImportActsCommand(LabelCommand):
         # get act type: CouncilDeliberation or CGDeliberation
         act_type = options['act_type']
         if act_type == 'CouncilDeliberation':
-            deliberation_tag = "/om:CouncilDeliberation"
+            deliberation_tag = "CouncilDeliberation"
             initiative_types = Deliberation.INITIATIVE_TYPES
             deliberation_manager = Deliberation.objects
             emitting_institution = municipality.council.as_institution
         else:
-            deliberation_tag = "/om:CityGovernmentDeliberation"
+            deliberation_tag = "CityGovernmentDeliberation"
             initiative_types = CGDeliberation.INITIATIVE_TYPES
             deliberation_manager = CGDeliberation.objects
             emitting_institution = municipality.gov.as_institution
 
-        try:
-            tree = etree.parse(filename)
-        except etree.XMLSyntaxError:
-            self.logger.error("Syntax error while parsing %s. Skipping." % (filename,))
-            return
-
-        acts = tree.xpath(deliberation_tag, namespaces=NS)
-        self.logger.info("%d Deliberation to import" % len(acts))
-        for xml_act in acts:
+        for xml_act in self.iter_xml_acts(filename, deliberation_tag):
 
             # get important attributes
             id = xml_act.get("id")
@@ -404,6 +485,11 @@ class ImportActsCommand(LabelCommand):
                 )
                 continue
 
+            # skip unchanged acts, in incremental mode
+            if self.incremental and self.compute_fingerprints(filename, xml_act, "%s:%s" % (options['act_type'], id)):
+                self.logger.info("Act %s unchanged. Skipping." % id)
+                continue
+
             initiative = conf.XML_TO_OM_INITIATIVE[xml_act.get("initiative")]
             if initiative is None:
                 self.logger.error(
@@ -543,17 +629,12 @@ class ImportActsCommand(LabelCommand):
             if not self.dry_run:
                 om_act.act_ptr.save()
 
-    def handle_interrogation(self, filename, **options):
+            if self.incremental:
+                self.store_fingerprints()
 
-        try:
-            tree = etree.parse(filename)
-        except etree.XMLSyntaxError:
-            self.logger.error("Syntax error while parsing %s. Skipping." % (filename,))
-            return
+    def handle_interrogation(self, filename, **options):
 
-        acts = tree.xpath("/om:Interrogation",namespaces=NS)
-        self.logger.info("%d Interrogations/Interpellations to import" % len(acts))
-        for xml_act in acts:
+        for xml_act in self.iter_xml_acts(filename, "Interrogation"):
 
             # get important attributes
             id = xml_act.get("id")
@@ -563,6 +644,11 @@ class ImportActsCommand(LabelCommand):
                 )
                 continue
 
+            # skip unchanged acts, in incremental mode
+            if self.incremental and self.compute_fingerprints(filename, xml_act, "%s:%s" % (options['act_type'], id)):
+                self.logger.info("Act %s unchanged. Skipping." % id)
+                continue
+
             presentation_date = xml_act.get("presentation_date")
             if presentation_date is None:
                 self.stderr.write(
@@ -682,17 +768,12 @@ class ImportActsCommand(LabelCommand):
             if not self.dry_run:
                 om_act.act_ptr.save()
 
-    def handle_motion(self, filename, **options):
+            if self.incremental:
+                self.store_fingerprints()
 
-        try:
-            tree = etree.parse(filename)
-        except etree.XMLSyntaxError:
-            self.logger.error("Syntax error while parsing %s. Skipping." % (filename,))
-            return
+    def handle_motion(self, filename, **options):
 
-        acts = tree.xpath("/om:Motion",namespaces=NS)
-        self.logger.info("%d Motions to import" % len(acts))
-        for xml_act in acts:
+        for xml_act in self.iter_xml_acts(filename, "Motion"):
 
             # get important attributes
             id = xml_act.get("id")
@@ -702,6 +783,11 @@ class ImportActsCommand(LabelCommand):
                 )
                 continue
 
+            # skip unchanged acts, in incremental mode
+            if self.incremental and self.compute_fingerprints(filename, xml_act, "%s:%s" % (options['act_type'], id)):
+                self.logger.info("Act %s unchanged. Skipping." % id)
+                continue
+
             presentation_date = xml_act.get("presentation_date")
             if presentation_date is None:
                 self.stderr.write(
@@ -788,36 +874,43 @@ class ImportActsCommand(LabelCommand):
             if not self.dry_run:
                 om_act.act_ptr.save()
 
+            if self.incremental:
+                self.store_fingerprints()
+
     def handle_label(self, filename, **options):
         if not path.isfile(filename):
             raise IOError("File %s does not exist" % filename)
 
         act_type = options['act_type']
 
-        if act_type == 'CouncilDeliberation' or act_type == 'CGDeliberation':
-            self.handle_deliberation(filename, **options)
-        elif act_type == 'Interrogation':
-            self.handle_interrogation(filename, **options)
-        elif act_type == 'Motion':
-            self.handle_motion(filename, **options)
-        else:
-            raise IOError("Act type %s not known" % options['act_type'])
-
-    def handle(self, *labels, **options):
-        if not labels:
-            raise CommandError('Enter at least one %s.' % self.label)
+        # news of signatures and transitions are generated in bulk, at the end of the file
+        # (one worker at a time, with parallel imports)
+        with news_generation_deferred(lock=import_lock("news")):
+            if act_type == 'CouncilDeliberation' or act_type == 'CGDeliberation':
+                self.handle_deliberation(filename, **options)
+            elif act_type == 'Interrogation':
+                self.handle_interrogation(filename, **options)
+            elif act_type == 'Motion':
+                self.handle_motion(filename, **options)
+            else:
+                raise IOError("Act type %s not known" % options['act_type'])
 
+    def setup_import(self, **options):
+        """
+        Set up the command (people mapping, options and logger level) before importing;
+        called once by the command, or once by each worker, with ``--workers``.
+        """
         # parse people xml file into an lxml.etree
         people_file = options['people_file']
         if not path.isfile(people_file):
             raise IOError("File %s does not exist" % people_file)
 
-        if options['refresh_news'] and options['dry_run']:
-            raise CommandError("refresh-news and dry-run cannot be specified together")
-
         self.people_tree = etree.parse(people_file)
+        self.people_mapping = PeopleMapping.for_tree(self.people_tree)
 
         self.dry_run = options['dry_run']
+        self.incremental = options['incremental']
+        self.streaming = options['streaming']
 
         # fix logger level according to verbosity
         verbosity = options['verbosity']
@@ -830,8 +923,16 @@ class ImportActsCommand(LabelCommand):
         elif verbosity == '3':
             self.logger.setLevel(logging.DEBUG)
 
+    def handle(self, *labels, **options):
+        if not labels:
+            raise CommandError('Enter at least one %s.' % self.label)
+
+        if options['refresh_news'] and options['dry_run']:
+            raise CommandError("refresh-news and dry-run cannot be specified together")
+
+        self.setup_import(**options)
+
         # parse passed acts
-        for label in labels:
-            self.handle_label(label, **options)
+        import_labels(self, labels, **options)
         return 'done\n'
 
@@ -0,0 +1,242 @@
+"""
+Asynchronous extraction of the textual content of acts' attachments.
+
+Importers do not extract texts themselves: they queue the attachments
+(see ``enqueue_extraction``), and the ``extract_texts`` management command
+consumes the queue with a pool of worker processes (see ``run_extractions``).
+
+Workers only extract texts from files; all DB reads and writes are done by the
+coordinator, which fills in ``Attach.text`` (and ``Act.text``, for proposals).
+
+Extracted texts are cached in ``ExtractedText`` records, keyed on the SHA1 hash
+of the content of the files, so that identical files are never extracted twice.
+
+The extractor backend is set in ``settings.OM_TEXT_EXTRACTOR``, as the dotted path
+of a ``BaseExtractor`` subclass:
+
+* ``SolrTikaExtractor`` - extraction through the Tika handler of Solr (the default)
+* ``LocalExtractor`` - a local stand-in, reading plain text or HTML files, for tests
+"""
+import logging
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count
+from django.utils.importlib import import_module
+from lxml import html
+
+from open_municipio.data_import.models import ExtractedText, TextExtraction
+from open_municipio.data_import.utils import file_sha1
+
+
+logger = logging.getLogger('import')
+
+# the extractor of a worker process
+_extractor = None
+
+
+class ExtractionError(Exception):
+    pass
+
+
+class BaseExtractor(object):
+    """
+    Extract the textual content of a file.
+    """
+    def extract(self, file_path):
+        """
+        Return the text of the given file, or raise an ``ExtractionError``.
+        """
+        raise NotImplementedError
+
+
+class SolrTikaExtractor(BaseExtractor):
+    """
+    Extraction through the Tika extraction handler of Solr, using haystack
+    (requires Haystack 2.0.0), then lxml.html to get the text of the body.
+
+    The Solr instance is the one in ``settings.HAYSTACK_CONNECTIONS['default']``.
+    """
+    def __init__(self):
+        from haystack.backends.solr_backend import SolrSearchBackend
+        self.backend = SolrSearchBackend('default', **settings.HAYSTACK_CONNECTIONS['default'])
+
+    def extract(self, file_path):
+        from pysolr import SolrError
+        f = open(file_path, 'rb')
+        try:
+            file_content = self.backend.extract_file_contents(f)
+        except SolrError, e:
+            raise ExtractionError("could not extract textual content with solr-tika: %s" % e)
+        finally:
+            f.close()
+        if not file_content or not file_content.get('contents'):
+            raise ExtractionError("no textual content returned by solr-tika")
+        html_content = html.fromstring(file_content['contents'].encode('utf-8'))
+        return html_content.cssselect('body')[0].text_content()
+
+
+class LocalExtractor(BaseExtractor):
+    """
+    A local stand-in for a real extractor: the text of plain text files,
+    or of the body of HTML files.
+    """
+    def extract(self, file_path):
+        f = open(file_path, 'rb')
+        try:
+            content = f.read().decode('utf-8', 'replace')
+        finally:
+            f.close()
+        if file_path.lower().endswith(('.htm', '.html')):
+            return html.fromstring(content).text_content()
+        return content
+
+
+def get_extractor(extractor_path=None):
+    """
+    Return an instance of the given extractor class (by default, the one
+    set in ``settings.OM_TEXT_EXTRACTOR``).
+    """
+    module_name, class_name = (extractor_path or settings.OM_TEXT_EXTRACTOR).rsplit('.', 1)
+    return getattr(import_module(module_name), class_name)()
+
+
+def apply_text(task, text):
+    """
+    Fill in the text of the attachment of ``task`` (and of its act, for proposals),
+    and mark the task as done.
+    """
+    attach = task.attach
+    attach.text = text
+    attach.save()
+    if task.is_proposal:
+        act = attach.act.downcast()
+        act.text = text
+        act.save()
+    task.status = TextExtraction.STATUS.done
+    task.error = ''
+    task.save()
+
+
+def enqueue_extraction(attach, is_proposal=False):
+    """
+    Queue the extraction of the text of the file of ``attach``.
+
+    If a file with the same content has already been extracted,
+    the cached text is used at once, and nothing is queued.
+    """
+    sha1 = file_sha1(attach.file.path)
+
+    # a newer version of the file replaces any pending extraction
+    TextExtraction.objects.filter(attach=attach, status=TextExtraction.STATUS.pending).delete()
+    task = TextExtraction(attach=attach, is_proposal=is_proposal, sha1=sha1)
+
+    try:
+        cached = ExtractedText.objects.get(sha1=sha1)
+    except ExtractedText.DoesNotExist:
+        task.save()
+        return task
+    apply_text(task, cached.text)
+    return None
+
+
+def _init_worker(extractor_path):
+    global _extractor
+    _extractor = get_extractor(extractor_path)
+
+
+def _extract(args):
+    """
+    Extract the text of a file in a worker; return the tuple ``(sha1, text, error)``.
+    """
+    sha1, file_path = args
+    try:
+        return sha1, _extractor.extract(file_path), None
+    except Exception, e:
+        return sha1, None, "%s: %s" % (e.__class__.__name__, e)
+
+
+def queue_status():
+    """
+    Return a dictionary mapping each status to the number of tasks in the queue.
+    """
+    status = dict((s, 0) for (s, label) in TextExtraction.STATUS)
+    status.update(TextExtraction.objects.values_list('status').annotate(n=Count('id')).order_by())
+    return status
+
+
+def run_extractions(workers=1, limit=None, max_attempts=3):
+    """
+    Consume the queue of pending extractions, with a pool of ``workers`` processes.
+    Return the number of tasks done.
+    """
+    tasks = TextExtraction.objects.filter(
+        status=TextExtraction.STATUS.pending
+    ).select_related('attach').order_by('created_at')
+    if limit:
+        tasks = tasks[:limit]
+
+    # group the tasks by content hash, each file is extracted once
+    by_sha1 = {}
+    for task in tasks:
+        by_sha1.setdefault(task.sha1, []).append(task)
+    if not by_sha1:
+        logger.info("no pending text extractions")
+        return 0
+
+    # use the texts already extracted
+    n_done = 0
+    for (sha1, text) in ExtractedText.objects.filter(sha1__in=by_sha1.keys()).values_list('sha1', 'text'):
+        for task in by_sha1.pop(sha1):
+            apply_text(task, text)
+            n_done += 1
+
+    jobs = [(sha1, same_tasks[0].attach.file.path) for (sha1, same_tasks) in by_sha1.items()]
+    logger.info("%d files to extract, %d tasks served from the cache" % (len(jobs), n_done))
+    if not jobs:
+        return n_done
+
+    if workers > 1:
+        # workers are forked: they must not inherit an open connection
+        connection.close()
+        pool = multiprocessing.Pool(min(workers, len(jobs)), initializer=_init_worker,
+                                    initargs=(settings.OM_TEXT_EXTRACTOR,))
+        results = pool.imap_unordered(_extract, jobs)
+    else:
+        pool = None
+        _init_worker(settings.OM_TEXT_EXTRACTOR)
+        results = (_extract(job) for job in jobs)
+
+    start_time = time.time()
+    try:
+        for (n, (sha1, text, error)) in enumerate(results):
+            if error is None:
+                ExtractedText.objects.get_or_create(sha1=sha1, defaults={'text': text})
+                for task in by_sha1[sha1]:
+                    apply_text(task, text)
+                    n_done += 1
+            else:
+                logger.warning("text extraction of %s failed: %s" % (sha1, error))
+                for task in by_sha1[sha1]:
+                    task.n_attempts += 1
+                    task.error = error
+                    if task.n_attempts >= max_attempts:
+                        task.status = TextExtraction.STATUS.failed
+                    task.save()
+
+            elapsed = time.time() - start_time
+            logger.info("[%d/%d] files extracted (%.2f files/s)" %
+                        (n + 1, len(jobs), (n + 1) / elapsed if elapsed else n + 1))
+        if pool is not None:
+            pool.close()
+    except:
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        if pool is not None:
+            pool.join()
+
+    return n_done
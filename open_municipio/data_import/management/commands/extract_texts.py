@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from open_municipio.data_import.extraction import queue_status, run_extractions
+from open_municipio.data_import.models import TextExtraction
+
+
+class Command(BaseCommand):
+    """
+    Consume the queue of the attachments whose text must be extracted,
+    filled in by the acts importers, with a pool of worker processes.
+
+    Texts go into the attachments and, for proposals, into the acts.
+    """
+    help = "Extract the text of the queued attachments"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--workers',
+                    type='int',
+                    dest='workers',
+                    default=1,
+                    help='Extract texts with a pool of N worker processes'),
+        make_option('--limit',
+                    type='int',
+                    dest='limit',
+                    default=None,
+                    help='Only process the N oldest pending extractions'),
+        make_option('--max-attempts',
+                    type='int',
+                    dest='max_attempts',
+                    default=3,
+                    help='Mark an extraction as failed after N failed attempts'),
+        make_option('--retry-failed',
+                    action='store_true',
+                    dest='retry_failed',
+                    default=False,
+                    help='Queue failed extractions again'),
+        make_option('--status',
+                    action='store_true',
+                    dest='status',
+                    default=False,
+                    help='Only show the number of extractions in the queue, by status'),
+        )
+
+    logger = logging.getLogger('import')
+
+    def handle(self, **options):
+        # fix logger level according to verbosity
+        verbosity = options['verbosity']
+        if verbosity == '0':
+            self.logger.setLevel(logging.ERROR)
+        elif verbosity == '1':
+            self.logger.setLevel(logging.WARNING)
+        elif verbosity == '2':
+            self.logger.setLevel(logging.INFO)
+        elif verbosity == '3':
+            self.logger.setLevel(logging.DEBUG)
+
+        if options['status']:
+            for (status, n) in sorted(queue_status().items()):
+                self.stdout.write("%s: %d\n" % (status, n))
+            return
+
+        if options['retry_failed']:
+            n = TextExtraction.objects.filter(status=TextExtraction.STATUS.failed).\
+                update(status=TextExtraction.STATUS.pending, n_attempts=0)
+            self.logger.info("%d failed extractions queued again" % n)
+
+        self.logger.info("%d extractions pending" % queue_status()[TextExtraction.STATUS.pending])
+        n_done = run_extractions(workers=options['workers'], limit=options['limit'],
+                                 max_attempts=options['max_attempts'])
+        self.logger.info("%d extractions done, %d still pending" %
+                         (n_done, queue_status()[TextExtraction.STATUS.pending]))
@@ -6,7 +6,8 @@ from django.contrib.auth.models import User
 from django.core.management import BaseCommand
 from open_municipio.acts.models import Act
 from datetime import datetime, timedelta
-from django.core.mail import EmailMultiAlternatives
+from open_municipio.newsletter.models import OutboxMessage
+from open_municipio.newsletter.outbox import drain, queue_message
 
 
 class Command(BaseCommand):
@@ -63,13 +64,14 @@ class Command(BaseCommand):
             text_content += '\n{0}: {1}'.format(act.get_absolute_url(), act)
         message_html += '\n</ul>'
 
-        # prepare email
-        msg = EmailMultiAlternatives(subject, text_content, from_email, receivers)
-        msg.attach_alternative(message_html, "text/html")
+        # queue email and send it (see ``newsletter.outbox``)
+        message = queue_message(subject, text_content, from_email, receivers, message_html)
+        drain()
 
-        msg.send()
-
-        self.stdout.write('Email sent\n')
+        if OutboxMessage.objects.get(pk=message.pk).status == OutboxMessage.STATUS.sent:
+            self.stdout.write('Email sent\n')
+        else:
+            self.stdout.write('Email queued, it will be sent by the drain_outbox command\n')
 
 
 
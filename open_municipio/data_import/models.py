@@ -33,3 +33,81 @@ class FileImport(models.Model):
         verbose_name = _('File import')
         verbose_name_plural = _('Files import')
 
+
+
+class ImportFingerprint(models.Model):
+    """
+    Keep track of the content hash of an imported source item:
+    the XML fragment of an act, or an attachment file.
+
+    Used by incremental imports, to skip items that have not changed
+    since the last import.
+    """
+    ITEM_TYPE = Choices(
+        ('ACT', 'act', _('act')),
+        ('ATTACH', 'attach', _('attachment'))
+    )
+
+    item_type = models.CharField(choices=ITEM_TYPE, max_length=8)
+    key = models.CharField(_('key'), max_length=255,
+                           help_text=_("act type and id, for acts; act type and id, and link to file, for attachments"))
+    sha1 = models.CharField(_('SHA1 hash'), max_length=40)
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+
+    def __unicode__(self):
+        return "%s - %s (%s)" % (self.get_item_type_display(), self.key, self.sha1)
+
+    class Meta:
+        db_table = u'data_import_fingerprint'
+        unique_together = (('item_type', 'key'),)
+        verbose_name = _('Import fingerprint')
+        verbose_name_plural = _('Import fingerprints')
+
+
+class TextExtraction(models.Model):
+    """
+    An item of the queue of attachments whose textual content must be extracted
+    (see ``data_import.extraction``).
+
+    The text extracted from a proposal (``TestoProposta``) goes into the act's text, as well.
+    """
+    STATUS = Choices(
+        ('PENDING', 'pending', _('pending')),
+        ('DONE', 'done', _('done')),
+        ('FAILED', 'failed', _('failed'))
+    )
+
+    attach = models.ForeignKey('acts.Attach', related_name='text_extraction_set')
+    is_proposal = models.BooleanField(default=False)
+    sha1 = models.CharField(_('SHA1 hash'), max_length=40, db_index=True)
+    status = models.CharField(choices=STATUS, default=STATUS.pending, max_length=8, db_index=True)
+    n_attempts = models.PositiveSmallIntegerField(_('attempts'), default=0)
+    error = models.TextField(_('error'), blank=True)
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+
+    def __unicode__(self):
+        return "%s - %s (%s)" % (self.get_status_display(), self.attach_id, self.sha1)
+
+    class Meta:
+        db_table = u'data_import_text_extraction'
+        verbose_name = _('Text extraction')
+        verbose_name_plural = _('Text extractions')
+
+
+class ExtractedText(models.Model):
+    """
+    The text extracted from a file, keyed on the hash of its content,
+    so that identical files are never extracted twice.
+    """
+    sha1 = models.CharField(_('SHA1 hash'), max_length=40, unique=True)
+    text = models.TextField(_('text'), blank=True)
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+
+    def __unicode__(self):
+        return self.sha1
+
+    class Meta:
+        db_table = u'data_import_extracted_text'
+        verbose_name = _('Extracted text')
+        verbose_name_plural = _('Extracted texts')
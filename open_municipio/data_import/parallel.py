@@ -0,0 +1,130 @@
+"""
+Run an import command over many files with a pool of worker processes.
+
+The coordinator (``import_in_pool``) distributes the labels (file names) of an
+import command across the workers, and collects per-file results and errors.
+
+Each worker closes the DB connection inherited from the coordinator, so that it
+opens its own, and sets up its own instance of the import command, with its
+own people-mapping cache.
+
+Rows that could be written by more than one worker at a time (a ``Sitting``
+shared by votation files, an act repeated in more than one file, the ``News``
+generated at the end of each file) must be written within an ``import_lock``
+on a key identifying them. Locks are striped: keys are hashed onto a fixed
+set of locks, shared by all the workers. Outside of a pool, ``import_lock``
+does nothing.
+"""
+from contextlib import contextmanager
+import multiprocessing
+import time
+import traceback
+import zlib
+
+from django.core.management.base import CommandError
+from django.db import connection
+
+from open_municipio.data_import.utils import PeopleMapping
+
+
+# number of locks that keys are hashed onto
+N_LOCKS = 64
+
+# the state of a worker process
+_locks = None
+_command = None
+_options = None
+
+
+@contextmanager
+def import_lock(key):
+    """
+    Hold the lock of the given key, within a worker of a pool.
+    """
+    if _locks is None:
+        yield
+        return
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    with _locks[zlib.crc32(key) % len(_locks)]:
+        yield
+
+
+def _init_worker(command_class, options, locks):
+    global _locks, _command, _options
+    _locks = locks
+    _options = options
+
+    # do not share the coordinator's connection
+    connection.close()
+
+    _command = command_class()
+    _command.setup_import(**options)
+
+
+def _handle_label(label):
+    """
+    Import a single file in a worker; return the tuple ``(label, elapsed time, error)``,
+    with ``error`` being the traceback of the exception raised, if any.
+    """
+    start_time = time.time()
+    try:
+        _command.handle_label(label, **_options)
+    except Exception:
+        return label, time.time() - start_time, traceback.format_exc()
+    return label, time.time() - start_time, None
+
+
+def import_in_pool(command, labels, workers, **options):
+    """
+    Import the given labels with ``command`` (an import command instance), using
+    a pool of ``workers`` processes. Return the list of the labels that failed.
+    """
+    logger = command.logger
+    labels = list(labels)
+    locks = [multiprocessing.RLock() for i in range(N_LOCKS)]
+
+    # workers are forked: they must not inherit an open connection
+    connection.close()
+
+    pool = multiprocessing.Pool(
+        min(workers, len(labels)),
+        initializer=_init_worker, initargs=(command.__class__, options, locks)
+    )
+    failed = []
+    try:
+        for (n, (label, elapsed, error)) in enumerate(pool.imap_unordered(_handle_label, labels)):
+            if error is None:
+                logger.info("[%d/%d] %s imported in %.2f seconds" % (n + 1, len(labels), label, elapsed))
+            else:
+                logger.error("[%d/%d] %s failed:\n%s" % (n + 1, len(labels), label, error))
+                failed.append(label)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    return failed
+
+
+def import_labels(command, labels, **options):
+    """
+    Import the given labels with ``command``, once it has been set up:
+    sequentially, or in a pool of worker processes, with ``--workers``.
+    """
+    workers = options.get('workers') or 1
+    if workers > 1 and len(labels) > 1:
+        # workers build their own mappings
+        PeopleMapping.release(command.people_tree)
+        failed = import_in_pool(command, labels, workers, **options)
+        if failed:
+            raise CommandError("%d of %d files failed: %s" % (len(failed), len(labels), ", ".join(failed)))
+        return
+
+    for label in labels:
+        command.handle_label(label, **options)
+
+    command.people_mapping.log_stats()
+    PeopleMapping.release(command.people_tree)
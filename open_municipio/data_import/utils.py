@@ -1,9 +1,11 @@
 """
 A misc set of utilities useful in the data-import domain.
 """
+import hashlib
 import logging
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
-from open_municipio.people.models import Person, municipality
+from open_municipio.people.models import municipality
+from open_municipio.people.timeline import membership_timeline
 
 import socket
 
@@ -17,29 +19,93 @@ XLINK_NAMESPACE = NS['xlink']
 XLINK = "{%s}" % XLINK_NAMESPACE
 
 
-class ChargeSeekerMixin:
+class PeopleMapping(object):
+    """
+    An index of the people XML file, mapping the domain-specific ids
+    of the persons to their open municipio ids (``om_id``) and vice-versa.
+
+    The file is scanned once, and charge lookups are memoized
+    for the duration of the import run, along with hit/miss statistics.
+
+    Use ``PeopleMapping.for_tree``, so that the same index is shared
+    by all the lookups on the same tree.
+    """
     logger = logging.getLogger('import')
 
-    def lookupCharge(self, people_tree, ds_charge_id, institution=None, moment=None):
+    # the mappings built so far, keyed on the tree they were built from
+    _mappings = {}
+
+    def __init__(self, people_tree):
+        self.tree = people_tree
+        self.by_id = {}
+        self.by_om_id = {}
+        for person in people_tree.xpath('//om:Person', namespaces=NS):
+            attrs = dict(person.attrib)
+            # the first occurrence of an id wins, as in the xpath lookups
+            self.by_id.setdefault(attrs.get('id'), attrs)
+            if attrs.get('om_id') is not None:
+                self.by_om_id.setdefault(attrs['om_id'], []).append(attrs.get('id'))
+        self.charges = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def for_tree(cls, people_tree):
+        """
+        Return the mapping of the given tree (or the mapping itself, if one is passed).
+        """
+        if isinstance(people_tree, PeopleMapping):
+            return people_tree
+        mapping = cls._mappings.get(id(people_tree))
+        if mapping is None or mapping.tree is not people_tree:
+            mapping = cls._mappings[id(people_tree)] = cls(people_tree)
+        return mapping
+
+    @classmethod
+    def release(cls, people_tree):
+        """
+        Forget the mapping of the given tree, at the end of an import run.
+        """
+        cls._mappings.pop(id(people_tree), None)
+
+    def ids_for_om_id(self, om_id):
+        """
+        Return the list of the domain-specific ids mapped to the given ``om_id``.
+        """
+        return self.by_om_id.get(str(om_id), [])
+
+    def lookup_charge(self, ds_charge_id, institution=None, moment=None):
         """
         look for the correct open municipio charge, or return None
-        starting from an internal, domain-specific, charge id
-        using the mapping in people_tree (lxml.etree)
+        starting from an internal, domain-specific, charge id;
+        if the institution is not passed, it is grabbed from the charge attribute;
         if the moment parameter is not passed, then current charges are looked up
         """
+        # ids are strings in the people file, but may be passed as integers (e.g. MDB componentIDs);
+        # they are formatted as the XPath lookups used to
+        ds_charge_id = '%s' % ds_charge_id
+        key = (ds_charge_id, getattr(institution, 'pk', institution),
+               str(moment)[:10] if moment is not None else None)
         try:
-            people_charges = people_tree.xpath(
-                '//om:Person[@id="%s"]' % ds_charge_id,
-                namespaces=NS
-            )
-            if len(people_charges):
-                om_id = people_charges[0].get('om_id')
+            charge = self.charges[key]
+            self.hits += 1
+            return charge
+        except KeyError:
+            self.misses += 1
+            charge = self.charges[key] = self._lookup_charge(ds_charge_id, institution, moment)
+            return charge
+
+    def _lookup_charge(self, ds_charge_id, institution=None, moment=None):
+        try:
+            person = self.by_id.get(ds_charge_id)
+            if person is not None:
+                om_id = person.get('om_id')
                 if om_id is None:
                     self.logger.warning("charge with id %s has no om_id (past charge?). Skipping." % ds_charge_id)
                     return None
 
                 if institution is None:
-                    charge_type = people_charges[0].get('charge')
+                    charge_type = person.get('charge')
                     if charge_type is None:
                         self.logger.warning("charge with id %s has no charge attribute. Skipping." % ds_charge_id)
                         return None
@@ -58,10 +124,9 @@ class ChargeSeekerMixin:
                         return None
 
                 try:
-                    person = Person.objects.get(pk=int(om_id))
-                    charge =  person.get_current_charge_in_institution(institution, moment=moment)
+                    charge = membership_timeline.charge_of(int(om_id), institution, moment=moment)
                     self.logger.debug("id %s (%s) mapped to %s (%s)" %
-                                      (ds_charge_id, institution, person, charge))
+                                      (ds_charge_id, institution, charge.person, charge))
                     return charge
                 except ObjectDoesNotExist:
                     self.logger.warning("could not find person or charge for id = %s (om_id=%s) (%s) in OM DB. Skipping." % (ds_charge_id, om_id, institution))
@@ -76,6 +141,37 @@ class ChargeSeekerMixin:
             self.logger.warning("could not find charge for %s in Open Municipio DB. Skipping." % ds_charge_id)
             return None
 
+    def log_stats(self):
+        self.logger.info("people mapping: %d persons, %d charge lookups (%d hits, %d misses)" %
+                         (len(self.by_id), self.hits + self.misses, self.hits, self.misses))
+
+
+class ChargeSeekerMixin:
+    logger = logging.getLogger('import')
+
+    def lookupCharge(self, people_tree, ds_charge_id, institution=None, moment=None):
+        """
+        look for the correct open municipio charge, or return None
+        starting from an internal, domain-specific, charge id
+        using the mapping in people_tree (lxml.etree, or ``PeopleMapping``)
+        if the moment parameter is not passed, then current charges are looked up
+        """
+        return PeopleMapping.for_tree(people_tree).lookup_charge(ds_charge_id, institution, moment)
+
+def file_sha1(file_path, chunk_size=65536):
+    """
+    Return the SHA1 hex digest of the content of a file, read in chunks
+    """
+    sha1 = hashlib.sha1()
+    f = open(file_path, 'rb')
+    try:
+        for chunk in iter(lambda: f.read(chunk_size), ''):
+            sha1.update(chunk)
+    finally:
+        f.close()
+    return sha1.hexdigest()
+
+
 def netcat(hostname, port, content):
     """
     netcat (nc) implementation in python
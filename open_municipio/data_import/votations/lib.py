@@ -1,19 +1,31 @@
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 from django.utils import simplejson as json
 import re
 from open_municipio.acts.models import Act
 from open_municipio.data_import.lib import DataSource, BaseReader, BaseWriter, JSONWriter, XMLWriter, valid_XML_char_ordinal
+from open_municipio.data_import.parallel import import_lock
 # import OM-XML language tags
 from open_municipio.data_import.om_xml import *
+from open_municipio.data_import.om_xml import OMXML_NAMESPACE, XLINK_NAMESPACE, XSI_NAMESPACE
 # import models used in DBVotationWriter
 from open_municipio.people.models import Institution
+from open_municipio.people.timeline import membership_timeline
 from open_municipio.votations.models import Sitting as DBSitting, GroupVote
 from open_municipio.votations.models import Votation as DBBallot
-from open_municipio.votations.models import ChargeVote
+from open_municipio.votations.models import ChargeVote, update_charge_counters, update_votation_counters
+from open_municipio.votations.matrix import update_vote_matrix
+from open_municipio.votations.analytics import store_group_analytics
+from open_municipio.votations.similarity import update_charge_similarities
+from open_municipio.om_utils.db import bulk_insert, bulk_update
 
 from lxml import etree
 
+from datetime import datetime
+import gzip
 import logging
+import time
+from xml.sax.saxutils import quoteattr
 
  
 class VotationDataSource(DataSource):
@@ -58,6 +70,11 @@ class Sitting(object):
         return "Sitting #%(sitting_n)s of %(sitting_date)s" % {'sitting_n': self.seq_n, 'sitting_date': self.date}
 
 class Ballot(object):
+    # ``__slots__`` keep ballots and votes small, since millions
+    # of them may be read from large archives
+    __slots__ = ('sitting', 'seq_n', 'time', 'type_', 'short_subj', 'subj', 'n_presents', 'n_partecipants',
+                 'n_majority', 'n_yes', 'n_no', 'n_abst', 'n_legal', 'outcome', 'votes')
+
     def __init__(self, sitting, seq_n=None, timestamp=None, ballot_type=None, short_subj=None, subj=None,
                  n_presents=None, n_partecipants=None, n_majority=None, n_yes=None, n_no=None, n_abst=None,
                  n_legal=None, outcome=None):
@@ -84,6 +101,8 @@ class Ballot(object):
         return "Ballot #%(ballot_n)s of %(sitting)s" % {'ballot_n': self.seq_n, 'sitting': self.sitting}
 
 class Vote(object):
+    __slots__ = ('ballot', 'cardID', 'componentID', 'groupID', 'componentName', 'choice')
+
     def __init__(self, ballot, cardID=None, componentID=None, groupID=None, component_name=None, choice=None):
         # parent ballot
         self.ballot = ballot
@@ -91,6 +110,7 @@ class Vote(object):
         self.cardID = cardID 
         self.componentID = componentID
         self.groupID = groupID
+        self.componentName = component_name
         self.choice = choice
         
     def __repr__(self):
@@ -122,6 +142,26 @@ class BaseVotationReader(BaseReader):
         # that can be extracted from the data source
         return self.sittings      
 
+    def iter_sittings(self):
+        """
+        Streaming alternative to ``read``: a generator yielding one sitting
+        at a time, with its ballots and votes.
+
+        Once the consumer (usually a writer) asks for the next sitting,
+        the ballots of the previous one are released, so that memory usage
+        does not grow with the size of the data source.
+        """
+        # initialize the reader
+        self.setup()
+        # get the data source to read from
+        data_source = self.get_data_source()
+        # initialize the data source
+        data_source.setup()
+        for sitting in data_source.get_sittings():
+            sitting.ballots = data_source.get_ballots(sitting)
+            yield sitting
+            sitting.ballots = []
+
     
 class GenericVotationReader(BaseVotationReader):
     pass
@@ -163,12 +203,10 @@ class DBVotationWriter(BaseVotationWriter):
         at the moment when the Votation took place,
         and her ChargeVote is not among the associate chargevote_set
         """
-        votation_moment = votation.sitting.date.strftime('%Y-%m-%d')
-        charges = votation.sitting.institution.get_current_charges(moment=votation_moment)
+        charges = membership_timeline.members_at(votation.sitting.institution_id, votation.sitting.date)
+        voting_ids = set(votation.chargevote_set.values_list('charge_id', flat=True))
         for c in charges:
-            try:
-                cv = votation.chargevote_set.get(charge__pk=c.pk)
-            except ObjectDoesNotExist:
+            if c.pk not in voting_ids:
                 # get or create absence ChargeVote in OpenMunicipio DB
                 cv, created = ChargeVote.objects.get_or_create(
                     charge=c,
@@ -203,6 +241,7 @@ class DBVotationWriter(BaseVotationWriter):
 
 
         # compute rebel caches for each voting charge
+        rebel_charges = []
         for vc in votation.charge_votes:
             group = vc.charge_group_at_vote_date
             if group is not None:
@@ -217,19 +256,16 @@ class DBVotationWriter(BaseVotationWriter):
                             # add rebel status to ChargeVote
                             vc.is_rebel = True
                             vc.save()
-
-                            # there's a new rebellion!
-                            # votation and charge caches must be updated
-
-                            # update charge cache
-                            vc.charge.update_rebellion_cache()
-
-                            # update votation cache
-                            votation.n_rebels = votation.charge_votes.filter(is_rebel=True).count()
-                            votation.save()
+                            rebel_charges.append(vc.charge_id)
                 except ObjectDoesNotExist:
                     pass
 
+        # there are new rebellions!
+        # votation and charge caches must be updated
+        if rebel_charges:
+            update_votation_counters(DBBallot.objects.filter(pk=votation.pk))
+            update_charge_counters(rebel_charges)
+
 
     def compute_group_votes(self, votation):
         """
@@ -266,42 +302,12 @@ class DBVotationWriter(BaseVotationWriter):
                 votation=votation, group=g,
                 defaults={'vote':GroupVote.VOTES.noncomputable}
             )
-
-            if v == ChargeVote.VOTES.yes:
-                gv.n_yes += 1
-                gv.n_presents += 1
-            elif v == ChargeVote.VOTES.no:
-                gv.n_no += 1
-                gv.n_presents += 1
-            elif v == ChargeVote.VOTES.abstained:
-                gv.n_abst += 1
-                gv.n_presents += 1
-            elif v == ChargeVote.VOTES.secret:
-                gv.n_presents += 1
-            elif v == ChargeVote.VOTES.canceled:
-                gv.n_presents += 1
-            elif v == ChargeVote.VOTES.pres:
-                gv.n_presents += 1
-            elif v == ChargeVote.VOTES.absent:
-                gv.n_absents += 1
-            else:
-                pass
-
+            gv.add_charge_vote(v)
             gv.save()
 
         for gv in votation.group_votes:
             # compute group vote and n of rebels
-            if gv.n_yes > gv.n_no and gv.n_yes > gv.n_abst:
-                gv.vote = GroupVote.VOTES.yes
-                gv.n_rebels = gv.n_no + gv.n_abst
-
-            if gv.n_no > gv.n_yes and gv.n_no > gv.n_abst:
-                gv.vote = GroupVote.VOTES.no
-                gv.n_rebels = gv.n_abst + gv.n_yes
-
-            if gv.n_abst > gv.n_yes and gv.n_abst > gv.n_no:
-                gv.vote = GroupVote.VOTES.abstained
-                gv.n_rebels = gv.n_no + gv.n_yes
+            gv.compute_vote()
 
             # save updates
             gv.save()
@@ -311,76 +317,201 @@ class DBVotationWriter(BaseVotationWriter):
     def write_vote(self, vote, db_ballot=None):
         raise Exception("Not implemented")
 
+    def build_vote(self, vote, db_ballot):
+        """
+        Return an unsaved ``ChargeVote`` instance for the given vote,
+        or ``None`` if the vote must be skipped.
+
+        Used instead of ``write_vote`` when writing in bulk mode.
+        """
+        raise Exception("Not implemented")
+
+    def write_ballot(self, ballot, db_sitting):
+        """
+        Get or create the ballot in the DB and try to link it to an act.
+        """
+        b, created = DBBallot.objects.get_or_create(
+            idnum=int(ballot.seq_n),
+            sitting=db_sitting,
+            defaults={
+                'act_descr': ballot.subj or ballot.short_subj or "",
+                'n_legal': int(ballot.n_legal),
+                'n_presents': int(ballot.n_presents),
+                'n_partecipants': int(ballot.n_partecipants),
+                'n_maj': int(ballot.n_majority),
+                'n_yes': int(ballot.n_yes),
+                'n_no': int(ballot.n_no),
+                'n_abst': int(ballot.n_abst),
+                'outcome': int(ballot.outcome),
+            }
+        )
+
+        # try to link to an act
+        self.logger.debug("act_descr: %s" % b.act_descr.strip())
+        m = re.match(r"(.+?)-(.+)", b.act_descr.strip())
+        if m:
+            act_idnum = str(m.group(1))
+            self.logger.debug("act_idnum: %s" % act_idnum)
+            linked_act = Act.objects.get(idnum=act_idnum)
+            if isinstance(linked_act, Act):
+                try:
+                    b.act = linked_act.downcast()
+                    b.save()
+                    self.logger.info("act was linked: %s" % b.act)
+                except ObjectDoesNotExist:
+                    self.logger.info("act was not linked")
+
+
+        if created:
+            self.logger.debug("%s created in DB" % b)
+
+        else:
+            self.logger.debug("%s found in DB" % b)
+
+        return b
+
+    @transaction.commit_on_success
+    def write_sitting_bulk(self, sitting, db_sitting):
+        """
+        Write all the ballots of a sitting in bulk, within a single transaction.
+
+        All the votes of the sitting are kept in memory: absences are computed
+        as the difference between the members of the institution and the voting charges,
+        group votes and rebel flags are computed in Python, and each table is then
+        written with a single ``executemany`` statement.
+
+        Votes already stored for the ballots of the sitting are replaced.
+
+        Return the number of written rows.
+        """
+        inst = db_sitting.institution
+        members = membership_timeline.members_at(inst.pk, db_sitting.date)
+        compute_rebels = inst.institution_type != Institution.COMMITTEE
+
+        db_ballots = []
+        charge_vote_rows = []
+        group_vote_rows = []
+        ballot_rows = []
+        for ballot in sitting.ballots:
+            self.logger.info("processing %s in Mdb" % ballot)
+            b = self.write_ballot(ballot, db_sitting)
+            db_ballots.append(b)
+
+            votes = {}
+            for vote in ballot.votes:
+                self.logger.debug("processing %s in Mdb" % vote)
+                cv = self.build_vote(vote, b)
+                if cv is not None:
+                    votes[cv.charge_id] = cv
+
+            # since absences are not explicitly set
+            # they must be computed
+            for c in members:
+                if c.pk not in votes:
+                    votes[c.pk] = ChargeVote(charge_id=c.pk, votation=b, vote=ChargeVote.VOTES.absent)
+
+            # compute group votes
+            group_votes = {}
+            charge_groups = {}
+            for cv in votes.values():
+                g = membership_timeline.group_of(cv.charge_id, db_sitting.date)
+                if g is None:
+                    self.logger.warning(u"no group found for charge %s" % cv.charge_id)
+                    continue
+                charge_groups[cv.charge_id] = g.pk
+                gv = group_votes.get(g.pk)
+                if gv is None:
+                    gv = group_votes[g.pk] = GroupVote(votation=b, group_id=g.pk)
+                gv.add_charge_vote(cv.vote)
+            for gv in group_votes.values():
+                gv.compute_vote()
+
+            # compute rebels
+            if compute_rebels:
+                for cv in votes.values():
+                    if cv.charge_id in charge_groups:
+                        cv.is_rebel = group_votes[charge_groups[cv.charge_id]].is_rebel_vote(cv.vote)
+
+            now = datetime.now()
+            charge_vote_rows.extend(
+                (now, now, b.pk, cv.vote, cv.charge_id, cv.is_rebel) for cv in votes.values()
+            )
+            group_vote_rows.extend(
+                (now, now, b.pk, gv.vote, gv.group_id, gv.n_presents, gv.n_yes,
+                 gv.n_no, gv.n_abst, gv.n_rebels, gv.n_absents) for gv in group_votes.values()
+            )
+            ballot_rows.append((
+                len([cv for cv in votes.values() if cv.vote == ChargeVote.VOTES.absent]),
+                len([cv for cv in votes.values() if cv.is_rebel]),
+                b.pk
+            ))
+
+        ballot_ids = [b.pk for b in db_ballots]
+        ChargeVote.objects.filter(votation__in=ballot_ids).delete()
+        GroupVote.objects.filter(votation__in=ballot_ids).delete()
+
+        bulk_insert(ChargeVote, ('created', 'modified', 'votation', 'vote', 'charge', 'is_rebel'),
+                    charge_vote_rows)
+        bulk_insert(GroupVote, ('created', 'modified', 'votation', 'vote', 'group', 'n_presents',
+                                'n_yes', 'n_no', 'n_abst', 'n_rebels', 'n_absents'),
+                    group_vote_rows)
+        bulk_update(DBBallot, ('n_absents', 'n_rebels'), ballot_rows)
+
+        # update presence and rebellion caches of the charges
+        charge_ids = set(c.pk for c in members)
+        charge_ids.update(row[4] for row in charge_vote_rows)
+        update_charge_counters(list(charge_ids))
+
+        return len(charge_vote_rows) + len(group_vote_rows) + len(ballot_rows) + len(charge_ids)
+
     def write(self):
         self.setup()
 
+        bulk = self.options.get('bulk', False)
+        if bulk and type(self).build_vote.im_func is DBVotationWriter.build_vote.im_func:
+            # checked before writing anything, not to leave a sitting without votes
+            self.logger.warning("%s does not implement build_vote: votes are written one by one" %
+                                type(self).__name__)
+            bulk = False
+        n_rows = 0
+        start_time = time.time()
+        db_sittings = []
+
         for sitting in self.sittings:
             self.logger.info("processing %s in Mdb" % sitting)
             inst = Institution.objects.get(name=self.conf.XML_TO_OM_INST[sitting.site])
 
             if not self.dry_run:
-                s, created = DBSitting.objects.get_or_create(
-                    idnum=sitting._id,
-                    defaults={
-                        'number':      sitting.seq_n,
-                        'date':        sitting.date,
-                        'call':        sitting.call,
-                        'institution': inst,
-                        }
-                )
+                # sittings may be shared by files imported by parallel workers
+                with import_lock("sitting:%s" % sitting._id):
+                    s, created = DBSitting.objects.get_or_create(
+                        idnum=sitting._id,
+                        defaults={
+                            'number':      sitting.seq_n,
+                            'date':        sitting.date,
+                            'call':        sitting.call,
+                            'institution': inst,
+                            }
+                    )
                 if created:
                     self.logger.info("%s created in DB" % s)
                 else:
                     self.logger.debug("%s found in DB" % s)
+                db_sittings.append(s)
+
+                if bulk:
+                    n_rows += self.write_sitting_bulk(sitting, s)
+                    self.logger.info("caches for this sitting updated.\n")
+                    continue
 
             for ballot in sitting.ballots:
                 self.logger.info("processing %s in Mdb" % ballot)
 
-                if not self.dry_run:
-
-                    # get or create the ballot in the DB
-                    b, created = DBBallot.objects.get_or_create(
-                        idnum=int(ballot.seq_n),
-                        sitting=s,
-                        defaults={
-                            'act_descr': ballot.subj or ballot.short_subj or "",
-                            'n_legal': int(ballot.n_legal),
-                            'n_presents': int(ballot.n_presents),
-                            'n_partecipants': int(ballot.n_partecipants),
-                            'n_maj': int(ballot.n_majority),
-                            'n_yes': int(ballot.n_yes),
-                            'n_no': int(ballot.n_no),
-                            'n_abst': int(ballot.n_abst),
-                            'outcome': int(ballot.outcome),
-                        }
-                    )
-
-                    # try to link to an act
-                    self.logger.debug("act_descr: %s" % b.act_descr.strip())
-                    m = re.match(r"(.+?)-(.+)", b.act_descr.strip())
-                    if m:
-                        act_idnum = str(m.group(1))
-                        self.logger.debug("act_idnum: %s" % act_idnum)
-                        linked_act = Act.objects.get(idnum=act_idnum)
-                        if isinstance(linked_act, Act):
-                            try:
-                                b.act = linked_act.downcast()
-                                b.save()
-                                self.logger.info("act was linked: %s" % b.act)
-                            except ObjectDoesNotExist:
-                                self.logger.info("act was not linked")
-
-
-                    if created:
-                        self.logger.debug("%s created in DB" % b)
-
-                    else:
-                        self.logger.debug("%s found in DB" % b)
-
-
                 if self.dry_run:
                     continue
 
+                b = self.write_ballot(ballot, s)
+
                 for vote in ballot.votes:
                     self.logger.debug("processing %s in Mdb" % vote)
                     self.write_vote(vote, db_ballot=b)
@@ -410,6 +541,26 @@ class DBVotationWriter(BaseVotationWriter):
 
                 self.logger.info("caches for this votation updated.\n")
 
+        if bulk and not self.dry_run:
+            elapsed = time.time() - start_time
+            self.logger.info("%d rows written in %.2f seconds (%.1f rows/s)" %
+                                (n_rows, elapsed, n_rows / elapsed if elapsed else n_rows))
+
+        # add the imported votations to the vote matrix, storing
+        # the group analytics of the new matrix along with it,
+        # and update the similarities of the charges who voted
+        # in the imported sittings
+        # (one worker at a time, with parallel imports)
+        if not self.dry_run and db_sittings:
+            with import_lock("vote_matrix"):
+                matrix = update_vote_matrix(db_sittings, before_publish=store_group_analytics)
+                if matrix is not None:
+                    update_charge_similarities(
+                        ChargeVote.objects.filter(votation__sitting__in=db_sittings).
+                            values_list('charge', flat=True).distinct(),
+                        matrix
+                    )
+
 
 class XMLVotationWriter(BaseVotationWriter, XMLWriter):
     """
@@ -417,6 +568,14 @@ class XMLVotationWriter(BaseVotationWriter, XMLWriter):
     according to the OM-XML schema specs.
     
     So, its output can be imported directly into a running instance of OpenMunicipio.
+
+    The following options are supported:
+
+    * ``streaming`` - write each votation as soon as it is built, instead of
+      building the whole tree of a sitting in memory
+    * ``out_file`` - write all sittings (e.g. a whole legislature) into a single file;
+      implies ``streaming``
+    * ``compress`` - gzip-compress the output files
     """
 
     def setup(self):
@@ -425,14 +584,82 @@ class XMLVotationWriter(BaseVotationWriter, XMLWriter):
     def write(self):
         self.setup()
 
+        out_file = self.options.get('out_file')
+        if out_file:
+            f = self.open_out_file(out_file)
+            try:
+                self.write_start(f)
+                for sitting in self.sittings:
+                    self.write_sitting_stream(sitting, f)
+                self.write_end(f)
+            finally:
+                f.close()
+            return
+
         for sitting in self.sittings:
             out_fname = self.get_out_fname(sitting)
-            tree = self.write_sitting(sitting)
-            tree.write(out_fname, 
-                       pretty_print=True, 
-                       xml_declaration=True, 
-                       encoding='UTF-8')
-            
+            if self.options.get('streaming'):
+                f = self.open_out_file(out_fname)
+                try:
+                    self.write_start(f)
+                    self.write_sitting_stream(sitting, f)
+                    self.write_end(f)
+                finally:
+                    f.close()
+            else:
+                tree = self.write_sitting(sitting)
+                f = self.open_out_file(out_fname)
+                try:
+                    tree.write(f,
+                               pretty_print=True,
+                               xml_declaration=True,
+                               encoding='UTF-8')
+                finally:
+                    f.close()
+
+    def open_out_file(self, out_fname):
+        """
+        Open the given output file for writing, gzip-compressed if requested.
+        """
+        if self.options.get('compress'):
+            if not out_fname.endswith('.gz'):
+                out_fname += '.gz'
+            return gzip.open(out_fname, 'wb')
+        return open(out_fname, 'wb')
+
+    def write_start(self, f):
+        """
+        Write the XML declaration and the opening ``om:Sittings`` tag.
+        """
+        f.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+        f.write('<om:Sittings xmlns:om=%s xmlns:xlink=%s xmlns:xsi=%s xsi:schemaLocation=%s>\n' % (
+            quoteattr(OMXML_NAMESPACE), quoteattr(XLINK_NAMESPACE),
+            quoteattr(XSI_NAMESPACE), quoteattr(OMXML_SCHEMA_LOCATION)
+        ))
+
+    def write_end(self, f):
+        f.write('</om:Sittings>\n')
+
+    def write_sitting_stream(self, sitting, f):
+        """
+        Write the XML representation of a given sitting into the file ``f``,
+        one votation at a time.
+
+        Since each votation is serialized on its own, it carries
+        its own namespace declarations.
+        """
+        attrs = dict(call=sitting.call,
+                     date=sitting.date,
+                     num=sitting.seq_n,
+                     site=sitting.site)
+        f.write('<om:Sitting %s>\n' % " ".join(
+            "%s=%s" % (name, quoteattr(str(value))) for (name, value) in sorted(attrs.items())
+        ))
+        for ballot in sitting.ballots:
+            f.write(etree.tostring(self.write_ballot(ballot), pretty_print=True,
+                                   xml_declaration=False, encoding='UTF-8'))
+        f.write('</om:Sitting>\n')
+
     def write_sitting(self, sitting):
         """
         Returns the XML representation (as a ``ElementTree`` object) of a given City Council sitting.
@@ -449,37 +676,43 @@ class XMLVotationWriter(BaseVotationWriter, XMLWriter):
         self._set_element_attrs(sitting_el, attrs)
         root.append(sitting_el) 
         for ballot in sitting.ballots:
-            ballot_el = VOTATION(SUBJECT(ballot.subj, sintetic=ballot.short_subj), VOTES())
-            attrs = dict(seq_n=ballot.seq_n,
-                         votation_type=ballot.type_,
-                         presents=ballot.n_presents,
-                         partecipants=ballot.n_partecipants,
-                         majority=ballot.n_majority,
-                         outcome=self.conf.OUTCOMES[int(ballot.outcome)],
-                         legal_number=ballot.n_legal,
-                         date_time=ballot.time,
-                         counter_yes=ballot.n_yes,
-                         counter_no=ballot.n_no,
-                         counter_abs=ballot.n_abst,)
-            self._set_element_attrs(ballot_el, attrs) 
-            sitting_el.append(ballot_el)
-            for vote in ballot.votes:
-                vote_el = CHARGEVOTE()
-                attrs = dict(cardID=vote.cardID,
-                                    componentID=vote.componentID,
-                                    groupID=vote.groupID,
-                                    vote=self.conf.XML_TO_OM_VOTE[vote.choice],
-                                    component_name=vote.componentName)
-                self._set_element_attrs(vote_el, attrs)
-                ballot_el.append(vote_el)
-                chargexref_el = CHARGEXREF()
-                attrs = {
-                         XLINK + 'href': vote.componentID,
-                         XLINK + 'type': 'simple',
-                        }
-                self._set_element_attrs(chargexref_el, attrs)
-                vote_el.append(chargexref_el)
+            sitting_el.append(self.write_ballot(ballot))
         return etree.ElementTree(root)
+
+    def write_ballot(self, ballot):
+        """
+        Returns the XML representation (as an ``Element``) of a given ballot, with its votes.
+        """
+        ballot_el = VOTATION(SUBJECT(ballot.subj, sintetic=ballot.short_subj), VOTES())
+        attrs = dict(seq_n=ballot.seq_n,
+                     votation_type=ballot.type_,
+                     presents=ballot.n_presents,
+                     partecipants=ballot.n_partecipants,
+                     majority=ballot.n_majority,
+                     outcome=self.conf.OUTCOMES[int(ballot.outcome)],
+                     legal_number=ballot.n_legal,
+                     date_time=ballot.time,
+                     counter_yes=ballot.n_yes,
+                     counter_no=ballot.n_no,
+                     counter_abs=ballot.n_abst,)
+        self._set_element_attrs(ballot_el, attrs) 
+        for vote in ballot.votes:
+            vote_el = CHARGEVOTE()
+            attrs = dict(cardID=vote.cardID,
+                                componentID=vote.componentID,
+                                groupID=vote.groupID,
+                                vote=self.conf.XML_TO_OM_VOTE[vote.choice],
+                                component_name=vote.componentName)
+            self._set_element_attrs(vote_el, attrs)
+            ballot_el.append(vote_el)
+            chargexref_el = CHARGEXREF()
+            attrs = {
+                     XLINK + 'href': vote.componentID,
+                     XLINK + 'type': 'simple',
+                    }
+            self._set_element_attrs(chargexref_el, attrs)
+            vote_el.append(chargexref_el)
+        return ballot_el
     
     def get_out_fname(self, sitting):
         """
@@ -1,5 +1,5 @@
-from django.db import models
-from django.db.models.query import EmptyQuerySet
+from django.db import models, transaction
+from django.db.models import Count, F
 from django.db.models.signals import post_save, pre_delete
 from django.dispatch.dispatcher import receiver
 from django.utils.translation import ugettext_lazy as _
@@ -8,7 +8,9 @@ from django.contrib.auth.models import User
 from open_municipio.acts.models import Act
 from open_municipio.monitoring.models import MonitorizedItem
 
+from open_municipio.om_utils.db import bulk_update
 from open_municipio.om_utils.models import SlugModel
+from open_municipio.taxonomy.news import invalidate_topic_news, topic_news
 
 
 
@@ -48,17 +50,9 @@ class Location(SlugModel, MonitorizedItem):
     def related_news(self):
         """
         News related to a location are the union of the news related to all the acts
-        tagged with this location
+        tagged with this location (see ``taxonomy.news``)
         """
-        news = EmptyQuerySet()
-
-        tagged_acts = Act.objects.filter(
-            id__in=set([ta['act_id'] for ta in self.tagged_acts.values('act_id')])
-        )
-
-        for a in tagged_acts:
-            news |= a.downcast().related_news
-        return news
+        return topic_news(self)
 
 
     @models.permalink
@@ -96,10 +90,15 @@ class TaggedActByLocation(models.Model):
                   }
         return u"User '%(tagger)s' added location '%(location)s' to act #%(act_id)s at %(time)s" % params
 
+@transaction.commit_on_success
 def reset_location_counters():
-    for item in Location.objects.all():
-        item.count = TaggedActByLocation.objects.filter(location=item).count()
-        item.save()
+    """
+    Recount the acts tagged with each location, with one grouped query,
+    and write the counters with a bulk update.
+    """
+    counts = TaggedActByLocation.objects.values_list('location').annotate(n=Count('id')).order_by()
+    Location.objects.update(count=0)
+    bulk_update(Location, ['count'], [(n, pk) for (pk, n) in counts])
 
 def locations_tagging_stats():
     print "------\nTAGGING STATS:\n"
@@ -115,8 +114,9 @@ def new_tagging_by_location(**kwargs):
     """
     if not kwargs.get('raw', False) and kwargs.get('created', False):
         tagging = kwargs.get('instance')
-        tagging.location.count += 1
-        tagging.location.save()
+        # atomic increment, so that concurrent taggings are all counted
+        Location.objects.filter(pk=tagging.location_id).update(count=F('count') + 1)
+        invalidate_topic_news([('location', tagging.location_id)])
 
 @receiver(pre_delete, sender=TaggedActByLocation)
 def remove_tagging_by_location(**kwargs):
@@ -124,5 +124,5 @@ def remove_tagging_by_location(**kwargs):
     Decrement counter of related location
     """
     tagging = kwargs.get('instance')
-    tagging.location.count = max(0, tagging.location.count - 1)
-    tagging.location.save()
\ No newline at end of file
+    Location.objects.filter(pk=tagging.location_id, count__gt=0).update(count=F('count') - 1)
+    invalidate_topic_news([('location', tagging.location_id)])
\ No newline at end of file
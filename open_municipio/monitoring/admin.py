@@ -7,3 +7,11 @@ class MonitoringAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Monitoring, MonitoringAdmin)
+
+
+class MonitoringCounterAdmin(admin.ModelAdmin):
+    list_display = ('content_type', 'object_pk', 'n_simple', 'n_politicians', 'n_total')
+    list_filter = ('content_type',)
+
+
+admin.site.register(MonitoringCounter, MonitoringCounterAdmin)
@@ -0,0 +1,140 @@
+"""
+Rankings of the most monitored objects, by family of models.
+
+Boards are stored as sorted ``LeaderboardEntry`` rows, and kept up to date
+from the monitoring signals: when the counter of an object changes (see
+``MonitoringCounter``), the board of its family is recomputed from the
+counters, unless the change cannot affect it (the object is not ranked, and
+its count is below the last ranked one). Only the top
+``settings.OM_LEADERBOARD_LENGTH`` objects of each board are stored.
+
+All boards are read at once, with the objects fetched in bulk (one query per
+content type), and cached together, under a version token stored in the DB
+(see ``om_utils.cache``), so that a page showing any number of them costs a
+version lookup and a single cache read, and a rebuild made by any process
+(e.g. by a management command) is seen by all the others. Rebuilds are
+serialized on the row of the version token. Usage::
+
+    from open_municipio.monitoring.leaderboards import top_monitored
+
+    for row in top_monitored('politicians', 3):
+        print row['object'], row['n_monitoring']
+
+Boards can be rebuilt from scratch with the ``rebuild_monitoring_counters``
+management command.
+"""
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import get_model
+
+from open_municipio.om_utils.cache import bump_version, get_version, lock_version
+from open_municipio.om_utils.generic import resolve_generic_rows
+
+
+VERSION_CACHE_KEY = 'om_leaderboards_version'
+CACHE_KEY = 'om_leaderboards_%s'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+# the models ranked in each board, as ``(app label, model name)`` pairs
+BOARDS = {
+    'politicians': (('people', 'Person'),),
+    'acts': (('acts', 'Deliberation'), ('acts', 'Motion'), ('acts', 'Interpellation'),
+             ('acts', 'Agenda'), ('acts', 'Interrogation')),
+    'topics': (('taxonomy', 'Tag'), ('taxonomy', 'Category'), ('locations', 'Location')),
+}
+
+
+def board_content_types(board):
+    """
+    Return the list of the ids of the content types ranked in ``board``.
+    """
+    return [ContentType.objects.get_for_model(get_model(app_label, model_name)).pk
+            for (app_label, model_name) in BOARDS[board]]
+
+
+def board_of(content_type_id):
+    """
+    Return the name of the board ranking the given content type, or ``None``.
+    """
+    for board in BOARDS:
+        if content_type_id in board_content_types(board):
+            return board
+    return None
+
+
+def rebuild_board(board):
+    """
+    Recompute ``board`` from the monitoring counters.
+    """
+    from open_municipio.monitoring.models import LeaderboardEntry, MonitoringCounter
+
+    content_types = board_content_types(board)
+    with transaction.commit_on_success():
+        # concurrent rebuilds wait here, and then read the counters committed in the meantime
+        lock_version(VERSION_CACHE_KEY)
+        top = MonitoringCounter.objects.filter(
+            content_type__in=content_types, n_total__gt=0
+        ).order_by('-n_total', 'id').values_list('content_type', 'object_pk', 'n_total')[:settings.OM_LEADERBOARD_LENGTH]
+
+        LeaderboardEntry.objects.filter(board=board).delete()
+        LeaderboardEntry.objects.bulk_create([
+            LeaderboardEntry(board=board, rank=rank, content_type_id=content_type_id,
+                             object_pk=object_pk, n_monitoring=n_total)
+            for (rank, (content_type_id, object_pk, n_total)) in enumerate(top, 1)
+        ])
+        bump_version(VERSION_CACHE_KEY)
+
+
+def rebuild_leaderboards():
+    """
+    Recompute all the boards from the monitoring counters.
+    """
+    for board in BOARDS:
+        rebuild_board(board)
+
+
+def update_leaderboard(content_type_id, object_pk):
+    """
+    Update the board of the given object, after a change of its monitoring counter.
+    """
+    from open_municipio.monitoring.models import LeaderboardEntry, MonitoringCounter
+
+    board = board_of(content_type_id)
+    if board is None:
+        return
+
+    entries = list(LeaderboardEntry.objects.filter(board=board).values_list('content_type', 'object_pk', 'n_monitoring'))
+    ranked = set((e[0], e[1]) for e in entries)
+    if (content_type_id, object_pk) not in ranked and len(entries) >= settings.OM_LEADERBOARD_LENGTH:
+        n_total = MonitoringCounter.objects.filter(content_type=content_type_id, object_pk=object_pk).\
+            values_list('n_total', flat=True)
+        if not n_total or n_total[0] < min(e[2] for e in entries):
+            return
+    rebuild_board(board)
+
+
+def leaderboards():
+    """
+    Return a dictionary mapping the name of each board to its list of rows, as dictionaries
+    with the ``content_type``, ``object_pk``, ``n_monitoring`` and ``object`` items.
+    """
+    from open_municipio.monitoring.models import LeaderboardEntry
+
+    key = CACHE_KEY % get_version(VERSION_CACHE_KEY)
+    boards = cache.get(key)
+    if boards is None:
+        boards = dict((board, []) for board in BOARDS)
+        rows = resolve_generic_rows(LeaderboardEntry.objects.values('board', 'content_type', 'object_pk', 'n_monitoring'))
+        for row in rows:
+            boards[row.pop('board')].append(row)
+        cache.set(key, boards, CACHE_TIMEOUT)
+    return boards
+
+
+def top_monitored(board, n=10):
+    """
+    Return the rows of the ``n`` most monitored objects of ``board`` (see ``leaderboards``).
+    """
+    return leaderboards()[board][:n]
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from open_municipio.monitoring.leaderboards import rebuild_leaderboards
+from open_municipio.monitoring.models import Monitoring, MonitoringCounter
+
+
+class Command(BaseCommand):
+    """
+    Refresh the ``is_politician`` flags of the monitorings, then rebuild the monitoring
+    counters of all the monitored objects from the ``Monitoring`` table, with a grouped
+    query, then the leaderboards (see ``monitoring.leaderboards``).
+
+    Counters are kept up to date by the ``Monitoring`` signal handlers, but monitorings
+    loaded from fixtures, or users becoming politicians, are not accounted for.
+    """
+    help = "Rebuild the monitoring counters of all the monitored objects"
+
+    logger = logging.getLogger('import')
+
+    def handle(self, **options):
+        # fix logger level according to verbosity
+        verbosity = options['verbosity']
+        if verbosity == '0':
+            self.logger.setLevel(logging.ERROR)
+        elif verbosity == '1':
+            self.logger.setLevel(logging.WARNING)
+        elif verbosity == '2':
+            self.logger.setLevel(logging.INFO)
+        elif verbosity == '3':
+            self.logger.setLevel(logging.DEBUG)
+
+        with transaction.commit_on_success():
+            Monitoring.objects.filter(user__userprofile__person__isnull=False, is_politician=False).\
+                update(is_politician=True)
+            Monitoring.objects.filter(user__userprofile__person__isnull=True, is_politician=True).\
+                update(is_politician=False)
+
+        counts = {}
+        for (content_type_id, object_pk, is_politician, n) in Monitoring.objects.\
+                values_list('content_type', 'object_pk', 'is_politician').annotate(n=Count('id')).order_by():
+            counter = counts.setdefault((content_type_id, object_pk), MonitoringCounter(
+                content_type_id=content_type_id, object_pk=object_pk
+            ))
+            if is_politician:
+                counter.n_politicians += n
+            else:
+                counter.n_simple += n
+            counter.n_total += n
+        counters = counts.values()
+
+        with transaction.commit_on_success():
+            MonitoringCounter.objects.all().delete()
+            for start in range(0, len(counters), 100):
+                MonitoringCounter.objects.bulk_create(counters[start:start + 100])
+
+        self.logger.info("%d monitoring counters rebuilt" % len(counters))
+
+        rebuild_leaderboards()
+        self.logger.info("leaderboards rebuilt")
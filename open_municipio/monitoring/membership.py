@@ -0,0 +1,54 @@
+"""
+The set of the objects monitored by a user.
+
+Checking whether a user is monitoring an object used to load and resolve all
+the user's monitored objects. The set of the ``(content type id, object pk)``
+pairs of the objects monitored by a user is read instead, with a single
+``values_list`` query, and cached on the user instance, for the rest of the
+request; the views changing monitorings always redirect, so the set is never
+read stale. Usage::
+
+    from open_municipio.monitoring.membership import is_monitoring
+
+    if is_monitoring(request.user, act):
+        ...
+"""
+from django.contrib.contenttypes.models import ContentType
+
+
+# the attribute caching the set on the user instance
+USER_ATTR = '_om_monitoring_set'
+
+
+def monitoring_key(obj):
+    """
+    Return the ``(content type id, object pk)`` pair identifying ``obj`` in monitoring sets.
+    """
+    from open_municipio.acts.models import Act
+
+    # acts are monitored as instances of their concrete types
+    if obj.__class__ is Act:
+        obj = obj.downcast()
+    return ContentType.objects.get_for_model(obj).pk, obj.pk
+
+
+def monitoring_set(user):
+    """
+    Return the set of the ``(content type id, object pk)`` pairs of the objects monitored by ``user``.
+    """
+    from open_municipio.monitoring.models import Monitoring
+
+    if not user.is_authenticated():
+        return frozenset()
+    objects = getattr(user, USER_ATTR, None)
+    if objects is None:
+        objects = frozenset(Monitoring.objects.filter(user=user).values_list('content_type', 'object_pk'))
+        setattr(user, USER_ATTR, objects)
+    return objects
+
+
+def is_monitoring(user, obj):
+    """
+    Return ``True`` if ``user`` is monitoring ``obj``.
+    """
+    return monitoring_key(obj) in monitoring_set(user)
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.core.urlresolvers import reverse 
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.contenttypes.models import ContentType
@@ -7,6 +8,8 @@ from django.contrib.auth.models import User
 from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 from django.template.context import Context
+from open_municipio.monitoring.leaderboards import update_leaderboard
+from open_municipio.monitoring.membership import monitoring_key
 from open_municipio.newscache.models import News
 
 class Monitoring(models.Model):
@@ -44,10 +47,19 @@ class Monitoring(models.Model):
     
     # When monitoring started (auto-set at the current datetime, on creation)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    # Was the user a politician when monitoring started ? (auto-set on creation)
+    # the monitoring counters are updated according to this flag
+    is_politician  = models.BooleanField(default=False)
     
     def __unicode__(self):
         return u'user %s is monitoring %s since %s' % (self.user, self.content_object, self.created_at)
 
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            self.is_politician = self.user.get_profile().person_id is not None
+        super(Monitoring, self).save(*args, **kwargs)
+
     def get_content_object_url(self):
         """
         Get a URL suitable for redirecting to the content object.
@@ -55,6 +67,96 @@ class Monitoring(models.Model):
         return reverse('om_monitoring_url_redirect', args=(), kwargs=(self.content_type.pk, self.object_pk))
 
 
+class MonitoringCounter(models.Model):
+    """
+    The number of users monitoring a content object: simple users, politicians, and in total.
+
+    Counters are kept up to date by the ``Monitoring`` signal handlers, with atomic
+    increments; they can be rebuilt from scratch with the ``rebuild_monitoring_counters``
+    management command.
+    """
+    content_type   = models.ForeignKey(ContentType, verbose_name=_('content type'))
+    object_pk      = models.PositiveIntegerField(_('object ID'))
+
+    n_simple       = models.IntegerField(_('simple users'), default=0)
+    n_politicians  = models.IntegerField(_('politicians'), default=0)
+    n_total        = models.IntegerField(_('total'), default=0, db_index=True)
+
+    def __unicode__(self):
+        return u'%s %s is monitored by %s users' % (self.content_type, self.object_pk, self.n_total)
+
+    class Meta:
+        db_table = u'monitoring_counter'
+        unique_together = ('content_type', 'object_pk')
+
+    @classmethod
+    def increment(cls, content_type_id, object_pk, is_politician, delta=1):
+        """
+        Atomically add ``delta`` to the counters of the given object.
+
+        The counter is created if missing; if a concurrent request creates it first,
+        the insertion fails, and the increment is applied to the row of the other request.
+        """
+        field = 'n_politicians' if is_politician else 'n_simple'
+        counters = cls.objects.filter(content_type=content_type_id, object_pk=object_pk)
+        if counters.update(**{'n_total': F('n_total') + delta, field: F(field) + delta}):
+            return
+
+        sid = transaction.savepoint()
+        try:
+            cls.objects.create(content_type_id=content_type_id, object_pk=object_pk,
+                               **{'n_total': delta, field: delta})
+            transaction.savepoint_commit(sid)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+            counters.update(**{'n_total': F('n_total') + delta, field: F(field) + delta})
+
+
+class LeaderboardEntry(models.Model):
+    """
+    An entry of a ranking of the most monitored objects of a family of models
+    (see ``monitoring.leaderboards``); entries are stored sorted by ``rank``.
+    """
+    board          = models.CharField(_('board'), max_length=32)
+    rank           = models.PositiveIntegerField(_('rank'))
+    content_type   = models.ForeignKey(ContentType, verbose_name=_('content type'),
+                                       related_name="content_type_set_for_%(class)s")
+    object_pk      = models.PositiveIntegerField(_('object ID'))
+    n_monitoring   = models.IntegerField(_('monitoring users'))
+
+    def __unicode__(self):
+        return u'%s #%s: %s %s (%s)' % (self.board, self.rank, self.content_type, self.object_pk, self.n_monitoring)
+
+    class Meta:
+        db_table = u'monitoring_leaderboard_entry'
+        ordering = ('board', 'rank')
+        unique_together = ('board', 'rank')
+
+
+def prefetch_monitoring_counters(objects):
+    """
+    Fetch the monitoring counters of the given objects, with one query per content type,
+    and cache them in the objects, so that reading their monitoring counts costs no query.
+
+    Return the list of the objects.
+    """
+    objects = list(objects)
+    by_type = {}
+    for o in objects:
+        content_type_id, pk = monitoring_key(o)
+        by_type.setdefault(content_type_id, {}).setdefault(pk, []).append(o)
+
+    for (content_type_id, by_pk) in by_type.items():
+        counters = dict((c.object_pk, c) for c in MonitoringCounter.objects.filter(
+            content_type=content_type_id, object_pk__in=by_pk.keys()
+        ))
+        for (pk, same_objects) in by_pk.items():
+            counter = counters.get(pk) or MonitoringCounter(content_type_id=content_type_id, object_pk=pk)
+            for o in same_objects:
+                o._monitoring_counter = counter
+    return objects
+
+
 class MonitorizedItem():
 
 
@@ -89,9 +191,22 @@ class MonitorizedItem():
         # monitoring users, so building a list in memory may result in a waste of resources).
         return [m.user for m in self.monitorings()]
 
+    @property
+    def monitoring_counter(self):
+        """
+        Returns the ``MonitoringCounter`` of this item (see ``prefetch_monitoring_counters``).
+        """
+        if getattr(self, '_monitoring_counter', None) is None:
+            content_type_id, pk = monitoring_key(self)
+            try:
+                self._monitoring_counter = MonitoringCounter.objects.get(content_type=content_type_id, object_pk=pk)
+            except MonitoringCounter.DoesNotExist:
+                self._monitoring_counter = MonitoringCounter(content_type_id=content_type_id, object_pk=pk)
+        return self._monitoring_counter
+
     @property
     def all_monitoring_count(self):
-        return self.monitorings().count()
+        return self.monitoring_counter.n_total
 
     @property
     def monitoring_users(self):
@@ -106,7 +221,7 @@ class MonitorizedItem():
 
     @property
     def monitoring_users_count(self):
-        return self.monitorings(user_type='simple').count()
+        return self.monitoring_counter.n_simple
 
     @property
     def monitoring_politicians(self):
@@ -118,7 +233,7 @@ class MonitorizedItem():
 
     @property
     def monitoring_politicians_count(self):
-        return self.monitorings(user_type='politician').count()
+        return self.monitoring_counter.n_politicians
 
     @property
     def content_type_id(self):
@@ -142,6 +257,11 @@ def new_monitoring(**kwargs):
         generating_item = kwargs['instance']
         monitored_object = generating_item.content_object
         monitoring_user = generating_item.user.get_profile()
+
+        MonitoringCounter.increment(generating_item.content_type_id, generating_item.object_pk,
+                                    is_politician=generating_item.is_politician)
+        update_leaderboard(generating_item.content_type_id, generating_item.object_pk)
+
         # define context for textual representation of the news
         ctx = Context({ 'monitored_object': monitored_object, 'monitoring_user': monitoring_user })
 
@@ -175,6 +295,12 @@ def remove_monitoring(**kwargs):
     if not generating_item:
         return
 
+    # the counter incremented on creation is decremented, even if the user
+    # has become (or is no longer) a politician since
+    MonitoringCounter.increment(generating_item.content_type_id, generating_item.object_pk,
+                                is_politician=generating_item.is_politician, delta=-1)
+    update_leaderboard(generating_item.content_type_id, generating_item.object_pk)
+
     if monitored_object:
         # remove news related to the monitored object
         News.objects.filter(
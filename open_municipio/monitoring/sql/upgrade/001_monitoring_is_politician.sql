@@ -0,0 +1,6 @@
+-- adds the ``is_politician`` flag of the monitorings, to databases created
+-- before it was introduced, and sets it for the users who are politicians now;
+-- then run the ``rebuild_monitoring_counters`` management command
+ALTER TABLE monitoring_monitoring ADD COLUMN is_politician boolean NOT NULL DEFAULT false;
+UPDATE monitoring_monitoring SET is_politician = true
+    WHERE user_id IN (SELECT user_id FROM users_user_profile WHERE person_id IS NOT NULL);
@@ -3,6 +3,7 @@
 from django import template
 from django.core.exceptions import ObjectDoesNotExist
 from open_municipio.monitoring.forms import MonitoringForm
+from open_municipio.monitoring.membership import is_monitoring
 
 register = template.Library()
 
@@ -39,7 +40,7 @@ def object_monitoring(context, object, show_politicians=True):
                 'user_id': args['user'].id
             })
 
-            if object in args['user'].get_profile().monitored_objects:
+            if is_monitoring(args['user'], object):
                 args['is_user_monitoring'] = True
     except ObjectDoesNotExist:
         args['is_user_monitoring'] = False
@@ -67,7 +68,7 @@ def object_inline_monitoring(context, object, shows_monitoring_users=True):
                 'user_id': args['user'].id
             })
 
-            if object in args['user'].get_profile().monitored_objects:
+            if is_monitoring(args['user'], object):
                 args['is_user_monitoring'] = True
     except ObjectDoesNotExist:
         args['is_user_monitoring'] = False
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import logging
+from optparse import make_option
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from open_municipio.newscache.models import News
+from open_municipio.om_utils.db import bulk_update
+
+
+class Command(BaseCommand):
+    """
+    Fill in the ``news_date`` of the news created before it was stored.
+
+    Dates are read with one query per generating content type and block of news,
+    and written with a single ``executemany`` per block.
+    """
+    help = "Fill in the missing dates of the news"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--all',
+                    action='store_true',
+                    dest='all',
+                    default=False,
+                    help='Recompute the dates of all the news, not only of those missing it'),
+        make_option('--block-size',
+                    type='int',
+                    dest='block_size',
+                    default=1000,
+                    help='Number of news updated at once'),
+        )
+
+    logger = logging.getLogger('import')
+
+    def handle(self, **options):
+        # fix logger level according to verbosity
+        verbosity = options['verbosity']
+        if verbosity == '0':
+            self.logger.setLevel(logging.ERROR)
+        elif verbosity == '1':
+            self.logger.setLevel(logging.WARNING)
+        elif verbosity == '2':
+            self.logger.setLevel(logging.INFO)
+        elif verbosity == '3':
+            self.logger.setLevel(logging.DEBUG)
+
+        news = News.objects.all()
+        if not options['all']:
+            news = news.filter(news_date__isnull=True)
+
+        block_size = options['block_size']
+        n_updated = 0
+        for content_type_id in news.values_list('generating_content_type', flat=True).distinct().order_by():
+            content_type = ContentType.objects.get_for_id(content_type_id)
+            pks = list(news.filter(generating_content_type=content_type).
+                       values_list('pk', flat=True).order_by('pk'))
+            for start in range(0, len(pks), block_size):
+                n_updated += self.backfill(content_type, pks[start:start + block_size])
+            self.logger.info("%s: %d news updated" % (content_type, len(pks)))
+
+        self.logger.info("%d news updated" % n_updated)
+
+    @transaction.commit_on_success
+    def backfill(self, content_type, pks):
+        rows = list(News.objects.filter(pk__in=pks).values_list('pk', 'generating_object_pk', 'created'))
+        dates = News.generator_dates(content_type, [generating_pk for (pk, generating_pk, created) in rows])
+        if dates is None:
+            # not an act, a signature or a transition: the date of the news itself
+            bulk_update(News, ('news_date',), [(created.date(), pk) for (pk, generating_pk, created) in rows])
+        else:
+            bulk_update(News, ('news_date',), [(dates.get(generating_pk), pk) for (pk, generating_pk, created) in rows])
+        return len(rows)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from open_municipio.newscache.timeline import rebuild_timelines
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the materialised news feeds (see ``newscache.timeline``) from
+    the whole news table, e.g. after the first deploy, or after a change in
+    the length of the timelines.
+    """
+    help = "Rebuild the timelines of the news feeds"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--block-size',
+                    type='int',
+                    dest='block_size',
+                    default=1000,
+                    help='Number of news processed at once'),
+        )
+
+    logger = logging.getLogger('import')
+
+    def handle(self, **options):
+        # fix logger level according to verbosity
+        verbosity = options['verbosity']
+        if verbosity == '0':
+            self.logger.setLevel(logging.ERROR)
+        elif verbosity == '1':
+            self.logger.setLevel(logging.WARNING)
+        elif verbosity == '2':
+            self.logger.setLevel(logging.INFO)
+        elif verbosity == '3':
+            self.logger.setLevel(logging.DEBUG)
+
+        n_entries = transaction.commit_on_success(rebuild_timelines)(block_size=options['block_size'])
+        self.logger.info("%d timeline entries written" % n_entries)
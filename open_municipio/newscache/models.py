@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 from django.db import models
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.template.loader import get_template
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.contenttypes.models import ContentType
@@ -9,6 +11,7 @@ from model_utils import Choices
 from model_utils.models import TimeStampedModel
 
 
+import itertools
 import re
 
 #
@@ -53,6 +56,9 @@ class News(TimeStampedModel):
 
     text                      = models.TextField(verbose_name=_('text'), max_length=512)
 
+    # the generating object's date (see ``get_news_date``), stored so that news can be sorted in the DB
+    news_date                 = models.DateField(_('news date'), null=True, db_index=True)
+
 
     class Meta:
         verbose_name = _('cached news')
@@ -66,23 +72,51 @@ class News(TimeStampedModel):
             return u'nessuna data - %s' % \
                    (self.text)
 
-    @property
-    def news_date(self):
+    def save(self, *args, **kwargs):
+        if self.news_date is None:
+            self.news_date = self.get_news_date()
+        # generating objects' dates may still be strings, when just imported
+        self.news_date = self._meta.get_field('news_date').to_python(self.news_date)
+        super(News, self).save(*args, **kwargs)
+
+    def get_news_date(self):
         """
         Return the generating object's date, according to type of object
         The date is used in the news
+
+        The generating object is fetched only if it is an act, a signature or a transition.
         """
         from open_municipio.acts.models import Act, ActSupport, Transition
 
-        generator = self.generating_object
-        if isinstance(generator, Act):
-            return generator.presentation_date
-        elif isinstance(generator, ActSupport):
-            return generator.support_date
-        elif isinstance(generator, Transition):
-            return generator.transition_date
+        generator_class = self.generating_content_type.model_class()
+        if generator_class and issubclass(generator_class, Act):
+            return self.generating_object.presentation_date
+        elif generator_class is ActSupport:
+            return self.generating_object.support_date
+        elif generator_class is Transition:
+            return self.generating_object.transition_date
         else:
-            return self.created
+            return self.created.date() if self.created else None
+
+    @classmethod
+    def generator_dates(cls, content_type, pks):
+        """
+        Return a dictionary mapping the given primary keys of generating objects
+        of the given content type to their dates (see ``get_news_date``),
+        with a single query; return ``None`` for objects of other types.
+        """
+        from open_municipio.acts.models import Act, ActSupport, Transition
+
+        model_class = content_type.model_class()
+        if model_class and issubclass(model_class, Act):
+            date_field = 'presentation_date'
+        elif model_class is ActSupport:
+            date_field = 'support_date'
+        elif model_class is Transition:
+            date_field = 'transition_date'
+        else:
+            return None
+        return dict(model_class._default_manager.filter(pk__in=list(pks)).values_list('pk', date_field))
 
 
 
@@ -119,4 +153,61 @@ class NewsTargetMixin(models.Model):
 
 
     class Meta:
-        abstract = True
\ No newline at end of file
+        abstract = True
+
+
+class NewsTimelineEntry(models.Model):
+    """
+    An entry of a materialised news feed (see ``newscache.timeline``).
+
+    Feeds are keyed by strings such as ``person:12``, ``group:3`` or ``politicians_council``;
+    news are copied into the feeds they belong to when created, and only
+    the latest ones of each feed and news type are kept.
+    """
+    feed = models.CharField(_('feed'), max_length=64)
+    news = models.ForeignKey(News, related_name='timeline_entry_set')
+    news_type = models.CharField(choices=News.NEWS_TYPE, max_length=4)
+    news_date = models.DateField(_('news date'), null=True)
+
+    class Meta:
+        db_table = u'newscache_timeline'
+        unique_together = (('feed', 'news'),)
+        verbose_name = _('news timeline entry')
+        verbose_name_plural = _('news timeline entries')
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.feed, self.news_id)
+
+
+def newest_first(queryset, n=None, tie_break='-created'):
+    """
+    Sort ``queryset`` (of news, or of timeline entries) by ``news_date``, newest first,
+    and items without a date last; ties are sorted by ``tie_break``.
+
+    Dated and undated items are read with two queries, since the position of NULLs
+    in a descending sort depends on the DB (PostgreSQL puts them first).
+
+    Return the list of the first ``n`` items, or an iterator over all of them if ``n`` is ``None``.
+    """
+    dated = queryset.filter(news_date__isnull=False).order_by('-news_date', tie_break)
+    undated = queryset.filter(news_date__isnull=True).order_by(tie_break)
+    if n is None:
+        return itertools.chain(dated.iterator(), undated.iterator())
+    items = list(dated[:n])
+    if len(items) < n:
+        items.extend(undated[:n - len(items)])
+    return items
+
+
+#
+# Signals handlers
+#
+
+@receiver(post_save, sender=News)
+def fan_out_news(**kwargs):
+    """
+    copy a news just created into the timelines of the feeds it belongs to
+    """
+    if not kwargs.get('raw', False) and kwargs.get('created', False):
+        from open_municipio.newscache.timeline import fan_out
+        fan_out([kwargs['instance']])
@@ -0,0 +1,2 @@
+-- feeds are read with a range scan on (feed, news_type), sorted by news_date
+CREATE INDEX newscache_timeline_feed_type_date ON newscache_timeline (feed, news_type, news_date);
@@ -0,0 +1,4 @@
+-- adds the ``news_date`` of the news, to databases created before it was stored;
+-- then run the ``backfill_news_date`` and ``rebuild_news_timelines`` management commands
+ALTER TABLE newscache_news ADD COLUMN news_date date NULL;
+CREATE INDEX newscache_news_news_date ON newscache_news (news_date);
@@ -1,9 +1,8 @@
 from django import template
 
-from open_municipio.newscache.models import News
-from open_municipio.people.models import Person, InstitutionCharge, municipality
-
-from django.db.models.query import EmptyQuerySet
+from open_municipio.newscache.models import News, newest_first
+from open_municipio.newscache.timeline import feed_for_object, feed_news
+from open_municipio.om_utils.generic import prefetch_generic
 
 register = template.Library()
 
@@ -26,34 +25,21 @@ class NewsForObjectNode(template.Node):
             return ''
 
 
-        # extract all news
-        # if obect is a Person, extract news related to all current and past charges
-        if isinstance(object, Person):
-            news = EmptyQuerySet()
-            for c in object.all_institution_charges:
-                news |= c.related_news
-        elif isinstance(object, basestring):
-            if object == 'politicians_all':
-                news = EmptyQuerySet()
-                for c in InstitutionCharge.objects.all():
-                    news |= c.related_news
-            if object == 'politicians_council':
-                news = EmptyQuerySet()
-                for c in municipality.council.charges:
-                    news |= c.related_news
-            if object == 'politicians_gov':
-                news = EmptyQuerySet()
-                for c in municipality.gov.charges:
-                    news |= c.related_news
-        else:
-            news = object.related_news
+        # persons, groups, categories, tags, locations and the politicians' feeds
+        # are read from the materialised timelines (see ``newscache.timeline``)
+        feed = feed_for_object(object)
+        if feed is not None:
+            context[self.context_var] = feed_news(feed, news_type=self.news_type, n=15)
+            return ''
+
+        news = object.related_news
 
         # filter only news of a given type (INST or COMM) (if given)
         if self.news_type:
             news = news.filter(news_type=self.news_type)
 
         # sort news by news_date, descending order
-        context[self.context_var] = sorted(news, key=lambda n: n.news_date, reverse=True)[0:15]
+        context[self.context_var] = prefetch_generic(newest_first(news, 15), 'related_object')
 
         return ''
 
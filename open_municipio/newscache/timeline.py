@@ -0,0 +1,212 @@
+"""
+Materialised news feeds (fan-out on write).
+
+Instead of OR-ing the ``related_news`` of many objects at read time
+(e.g. of all the charges of a person, or of all the charges of the council),
+each news is copied, when created, into the timelines of the feeds it belongs to,
+as ``NewsTimelineEntry`` records; a feed is then read with a single range scan
+on the ``(feed, news_type, news_date)`` index.
+
+Feeds are keyed by strings:
+
+* ``person:<id>`` - news related to any charge of the person
+* ``group:<id>`` - news related to the charges in the group, at the date of the news
+* ``politicians_all`` - news related to any charge
+* ``politicians_council``, ``politicians_gov`` - news related to the charges
+  in the council or in the city government, at the date of the news
+* ``category:<id>``, ``tag:<id>``, ``location:<id>`` - news related to the
+  category itself, or to the acts classified under it
+
+Only the latest ``settings.OM_NEWS_TIMELINE_LENGTH`` news of each feed and news
+type are kept. Timelines can be rebuilt from scratch with the
+``rebuild_news_timelines`` management command.
+"""
+from datetime import date
+import logging
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+
+from open_municipio.newscache.models import News, NewsTimelineEntry, newest_first
+from open_municipio.om_utils.generic import prefetch_generic
+from open_municipio.people.timeline import membership_timeline
+
+
+logger = logging.getLogger('import')
+
+POLITICIANS_ALL = 'politicians_all'
+POLITICIANS_COUNCIL = 'politicians_council'
+POLITICIANS_GOV = 'politicians_gov'
+
+
+def feed_for_object(obj):
+    """
+    Return the key of the feed of ``obj`` (a person, group, category, tag, location,
+    or a key), or ``None`` if it has no materialised feed.
+    """
+    from open_municipio.locations.models import Location
+    from open_municipio.people.models import Group, Person
+    from open_municipio.taxonomy.models import Category, Tag
+
+    if isinstance(obj, basestring):
+        return obj
+    for (model, prefix) in ((Person, 'person'), (Group, 'group'), (Category, 'category'),
+                            (Tag, 'tag'), (Location, 'location')):
+        if isinstance(obj, model):
+            return "%s:%s" % (prefix, obj.pk)
+    return None
+
+
+def feeds_for_news(news_list):
+    """
+    Return a dictionary mapping each news (by primary key) to the set of the keys
+    of the feeds it belongs to, with a few queries for the whole list.
+    """
+    from open_municipio.acts.models import Act
+    from open_municipio.locations.models import TaggedActByLocation
+    from open_municipio.people.models import Institution, InstitutionCharge
+    from open_municipio.taxonomy.models import Category, TaggedAct
+
+    charge_type = ContentType.objects.get_for_model(InstitutionCharge)
+    category_type = ContentType.objects.get_for_model(Category)
+    act_types = set(ct.pk for ct in ContentType.objects.filter(app_label='acts')
+                    if ct.model_class() and issubclass(ct.model_class(), Act))
+
+    feeds = dict((n.pk, set()) for n in news_list)
+
+    # charges
+    charge_news = [n for n in news_list if n.related_content_type_id == charge_type.pk]
+    charges = InstitutionCharge.objects.select_related('institution').\
+        in_bulk(list(set(n.related_object_pk for n in charge_news)))
+    for n in charge_news:
+        charge = charges.get(n.related_object_pk)
+        if charge is None:
+            continue
+        moment = n.news_date or date.today()
+        feeds[n.pk].update(["person:%s" % charge.person_id, POLITICIANS_ALL])
+        if charge.start_date <= moment and (charge.end_date is None or charge.end_date >= moment):
+            if charge.institution.institution_type == Institution.COUNCIL:
+                feeds[n.pk].add(POLITICIANS_COUNCIL)
+            elif charge.institution.institution_type == Institution.CITY_GOVERNMENT:
+                feeds[n.pk].add(POLITICIANS_GOV)
+        group = membership_timeline.group_of(charge.pk, moment)
+        if group is not None:
+            feeds[n.pk].add("group:%s" % group.pk)
+
+    # categories
+    for n in news_list:
+        if n.related_content_type_id == category_type.pk:
+            feeds[n.pk].add("category:%s" % n.related_object_pk)
+
+    # acts, through their categories, tags and locations
+    act_news = [n for n in news_list if n.related_content_type_id in act_types]
+    act_ids = list(set(n.related_object_pk for n in act_news))
+    if act_ids:
+        act_feeds = {}
+        for (act_id, category_id) in Act.category_set.through.objects.\
+                filter(act__in=act_ids).values_list('act', 'category'):
+            act_feeds.setdefault(act_id, set()).add("category:%s" % category_id)
+        for (act_id, tag_id, category_id) in TaggedAct.objects.\
+                filter(content_object__in=act_ids).values_list('content_object', 'tag', 'category'):
+            if tag_id is not None:
+                act_feeds.setdefault(act_id, set()).add("tag:%s" % tag_id)
+            act_feeds.setdefault(act_id, set()).add("category:%s" % category_id)
+        for (act_id, location_id) in TaggedActByLocation.objects.\
+                filter(act__in=act_ids).values_list('act', 'location'):
+            act_feeds.setdefault(act_id, set()).add("location:%s" % location_id)
+        for n in act_news:
+            feeds[n.pk].update(act_feeds.get(n.related_object_pk, ()))
+
+    return feeds
+
+
+def trim(feed, news_type, length=None):
+    """
+    Remove the entries of ``feed`` of the given type, but for the latest ``length`` ones.
+    """
+    length = length or settings.OM_NEWS_TIMELINE_LENGTH
+    old_ids = list(newest_first(NewsTimelineEntry.objects.filter(feed=feed, news_type=news_type).
+                                values_list('id', flat=True), tie_break='-news'))[length:]
+    if old_ids:
+        NewsTimelineEntry.objects.filter(id__in=old_ids).delete()
+
+
+def fan_out(news_list, trim_feeds=True):
+    """
+    Copy the given news into the timelines of the feeds they belong to;
+    news already in a timeline are skipped.
+
+    Return the set of ``(feed, news_type)`` pairs written to.
+    """
+    news_list = [n for n in news_list if n.pk is not None]
+    if not news_list:
+        return set()
+
+    existing = set(NewsTimelineEntry.objects.filter(news__in=[n.pk for n in news_list]).
+                   values_list('feed', 'news'))
+    news_by_pk = dict((n.pk, n) for n in news_list)
+    entries = []
+    written = set()
+    for (pk, feeds) in feeds_for_news(news_list).items():
+        n = news_by_pk[pk]
+        for feed in feeds:
+            if (feed, pk) in existing:
+                continue
+            entries.append(NewsTimelineEntry(feed=feed, news_id=pk,
+                                             news_type=n.news_type, news_date=n.news_date))
+            written.add((feed, n.news_type))
+
+    # insert in batches, to stay within the DB limits on query parameters
+    for start in range(0, len(entries), 100):
+        NewsTimelineEntry.objects.bulk_create(entries[start:start + 100])
+
+    if trim_feeds:
+        for (feed, news_type) in written:
+            trim(feed, news_type)
+    return written
+
+
+def feed_news(feed, news_type=None, n=15):
+    """
+    Return the list of the latest ``n`` news of ``feed`` (of the given type, if any).
+    """
+    entries = NewsTimelineEntry.objects.filter(feed=feed)
+    if news_type:
+        entries = entries.filter(news_type=news_type)
+    news = [e.news for e in newest_first(entries.select_related('news'), n, tie_break='-news')]
+    return prefetch_generic(news, 'related_object')
+
+
+def rebuild_timelines(block_size=1000):
+    """
+    Rebuild all timelines from the news table, newest news first:
+    once the timeline of a feed is full, older news are not copied into it.
+    """
+    NewsTimelineEntry.objects.all().delete()
+    length = settings.OM_NEWS_TIMELINE_LENGTH
+
+    counts = {}
+    n_entries = 0
+    # dated news first, undated news last (see ``newest_first``)
+    news_sets = (News.objects.filter(news_date__isnull=False).order_by('-news_date', '-id'),
+                 News.objects.filter(news_date__isnull=True).order_by('-id'))
+    n_news = sum(news.count() for news in news_sets)
+    n_processed = 0
+    for news in news_sets:
+        for start in range(0, news.count(), block_size):
+            block = list(news[start:start + block_size])
+            block_feeds = feeds_for_news(block)
+            entries = []
+            for n in block:
+                for feed in block_feeds.get(n.pk, ()):
+                    if counts.get((feed, n.news_type), 0) >= length:
+                        continue
+                    counts[(feed, n.news_type)] = counts.get((feed, n.news_type), 0) + 1
+                    entries.append(NewsTimelineEntry(feed=feed, news_id=n.pk,
+                                                     news_type=n.news_type, news_date=n.news_date))
+            for i in range(0, len(entries), 100):
+                NewsTimelineEntry.objects.bulk_create(entries[i:i + 100])
+            n_entries += len(entries)
+            n_processed += len(block)
+            logger.info("%d/%d news processed, %d timeline entries" % (n_processed, n_news, n_entries))
+    return n_entries
@@ -5,4 +5,12 @@ from open_municipio.newsletter.models import *
 class NewsletterAdmin(admin.ModelAdmin):
     readonly_fields = ['started', 'finished']
 
+
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('to', 'subject', 'status', 'n_attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to', 'subject')
+    readonly_fields = ['created_at', 'sent_at']
+
 admin.site.register(Newsletter, NewsletterAdmin)
+admin.site.register(OutboxMessage, OutboxMessageAdmin)
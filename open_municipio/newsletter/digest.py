@@ -0,0 +1,193 @@
+"""
+Set-based computation of the newsletter digests.
+
+Instead of OR-ing, for each subscriber, the ``related_news`` of each monitored
+object, ``compute_digests`` works on all the subscribers at once:
+
+* the monitorings of the subscribers are read with one query
+* monitored persons are expanded to their institution charges, and monitored
+  topics (tags, categories and locations) to their tagged acts, with one query
+  per kind, restricted to the charges and acts the candidate news are related to
+* the candidate news (institutional, of the highest priorities, created after the
+  last newsletter) are then scanned once, newest first, and each of them is
+  appended to the digests of the users monitoring its related object
+
+Digests are rendered by ``render_digests``, with a pool of worker processes.
+"""
+import multiprocessing
+import re
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.template import Context
+from django.template.loader import get_template
+from django.utils import translation
+
+from open_municipio.monitoring.models import Monitoring
+from open_municipio.newscache.models import News, newest_first
+
+
+# only news of this priority, or of a higher one (lower value), are sent
+MAX_PRIORITY = 2
+
+# ids in ``__in`` lookups are split in chunks of this size, to stay within the DB limits
+CHUNK_SIZE = 500
+
+# the templates of a worker process
+_templates = None
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def candidate_news(from_date=None):
+    """
+    Return the QuerySet of the news that can be sent, created after ``from_date``, if given.
+    """
+    news = News.objects.filter(news_type=News.NEWS_TYPE.institutional, priority__lte=MAX_PRIORITY)
+    if from_date:
+        news = news.filter(created__gt=from_date)
+    return news
+
+
+def user_monitorings(profiles):
+    """
+    Return a dictionary mapping the id of each user of the given ``UserProfile``
+    QuerySet, who monitors any object, to the list of the ``(content type id, object pk)``
+    pairs of the objects they monitor.
+    """
+    monitorings = {}
+    for (user_id, content_type_id, object_pk) in Monitoring.objects.\
+            filter(user__in=profiles.values('user')).values_list('user', 'content_type', 'object_pk'):
+        monitorings.setdefault(user_id, []).append((content_type_id, object_pk))
+    return monitorings
+
+
+def compute_digests(monitorings, from_date=None):
+    """
+    Given the monitorings of a set of users (see ``user_monitorings``), return a dictionary
+    mapping the id of each user with news to send to the list of the news, as
+    ``(news_date, text)`` pairs, newest first.
+    """
+    from open_municipio.locations.models import Location, TaggedActByLocation
+    from open_municipio.people.models import InstitutionCharge, Person
+    from open_municipio.taxonomy.models import Category, Tag, TaggedAct
+    from open_municipio.taxonomy.news import act_content_types
+
+    # users monitoring each object
+    monitors = {}
+    for (user_id, objects) in monitorings.items():
+        for key in objects:
+            monitors.setdefault(key, set()).add(user_id)
+    if not monitors:
+        return {}
+
+    person_type = ContentType.objects.get_for_model(Person).pk
+    charge_type = ContentType.objects.get_for_model(InstitutionCharge).pk
+    act_types = set(ct.pk for ct in act_content_types())
+    topic_types = (
+        (ContentType.objects.get_for_model(Tag).pk, TaggedAct, 'tag', 'content_object'),
+        (ContentType.objects.get_for_model(Category).pk, TaggedAct, 'category', 'content_object'),
+        (ContentType.objects.get_for_model(Location).pk, TaggedActByLocation, 'location', 'act'),
+    )
+
+    news = candidate_news(from_date)
+    charge_ids = set()
+    act_ids = set()
+    for (content_type_id, object_pk) in news.values_list('related_content_type', 'related_object_pk').distinct():
+        if content_type_id == charge_type:
+            charge_ids.add(object_pk)
+        elif content_type_id in act_types:
+            act_ids.add(object_pk)
+
+    # users receiving the news related to each object: the object itself is monitored,
+    # or the person holding the charge, or a topic of the act (acts of any type are
+    # keyed as ``('act', pk)``)
+    watchers = dict((key, set(users)) for (key, users) in monitors.items())
+
+    person_ids = [pk for (content_type_id, pk) in monitors if content_type_id == person_type]
+    if person_ids and charge_ids:
+        for ids in _chunks(charge_ids):
+            for (person_id, charge_id) in InstitutionCharge.objects.\
+                    filter(person__in=person_ids, id__in=ids).values_list('person', 'id'):
+                watchers.setdefault((charge_type, charge_id), set()).\
+                    update(monitors[(person_type, person_id)])
+
+    for (topic_type, model, topic_field, act_field) in topic_types:
+        topic_ids = [pk for (content_type_id, pk) in monitors if content_type_id == topic_type]
+        if not topic_ids or not act_ids:
+            continue
+        for ids in _chunks(act_ids):
+            for (topic_id, act_id) in model.objects.filter(**{
+                '%s__in' % topic_field: topic_ids, '%s__in' % act_field: ids
+            }).values_list(topic_field, act_field):
+                watchers.setdefault(('act', act_id), set()).update(monitors[(topic_type, topic_id)])
+
+    # a single pass over the news, newest first
+    digests = {}
+    for (content_type_id, object_pk, news_date, text) in newest_first(
+            news.values_list('related_content_type', 'related_object_pk', 'news_date', 'text')):
+        users = watchers.get((content_type_id, object_pk), set())
+        if content_type_id in act_types:
+            users = users | watchers.get(('act', object_pk), set())
+        for user_id in users:
+            digests.setdefault(user_id, []).append((news_date, text))
+    return digests
+
+
+def _init_worker(language):
+    global _templates
+    translation.activate(language)
+    _templates = (get_template('email.txt'), get_template('email.html'))
+
+
+def render_digest(args):
+    """
+    Render a digest in a worker; return the tuple ``(user_id, text_content, html_content)``.
+    """
+    user_id, news, context = args
+    site_url = 'href="http://{0}/'.format(context['domain'])
+    d = Context(dict(context, user_news=[
+        {'date': news_date, 'text': re.sub('href=\"\/', site_url, text)} for (news_date, text) in news
+    ]))
+    plaintext_tpl, html_tpl = _templates
+    return user_id, plaintext_tpl.render(d), html_tpl.render(d)
+
+
+def render_digests(jobs, workers=1, language='it'):
+    """
+    Render the digests of the given ``(user_id, news, context)`` jobs,
+    with a pool of ``workers`` processes.
+
+    Yield the ``(user_id, text_content, html_content)`` results, in the order of the jobs.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return
+
+    if workers > 1:
+        # workers are forked: they must not inherit an open connection
+        connection.close()
+        pool = multiprocessing.Pool(min(workers, len(jobs)), initializer=_init_worker,
+                                    initargs=(language,))
+        results = pool.imap(render_digest, jobs, chunksize=10)
+    else:
+        pool = None
+        _init_worker(language)
+        results = (render_digest(job) for job in jobs)
+
+    try:
+        for result in results:
+            yield result
+        if pool is not None:
+            pool.close()
+    except:
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        if pool is not None:
+            pool.join()
@@ -0,0 +1,64 @@
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from open_municipio.newsletter.models import OutboxMessage
+from open_municipio.newsletter.outbox import drain
+
+
+class Command(BaseCommand):
+    """
+    Send the mails queued in the outbox (see ``newsletter.outbox``),
+    retrying the failed ones whose backoff delay has expired.
+
+    Meant to be run periodically, so that mails left in the queue by
+    interrupted runs, or waiting to be retried, are eventually sent.
+    """
+    help = "Send the mails queued in the outbox"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--connections',
+                    type='int',
+                    dest='connections',
+                    help='Number of SMTP connections (defaults to settings.OM_OUTBOX_CONNECTIONS)'),
+        make_option('--rate',
+                    type='float',
+                    dest='rate',
+                    help='Max number of mails sent per second (defaults to settings.OM_OUTBOX_RATE)'),
+        make_option('--retry-failed',
+                    action='store_true',
+                    dest='retry_failed',
+                    default=False,
+                    help='Queue the failed mails again, before sending'),
+        make_option('--status',
+                    action='store_true',
+                    dest='status',
+                    default=False,
+                    help='Only show the status of the outbox'),
+    )
+
+    logger = logging.getLogger('import')
+
+    def handle(self, *args, **options):
+
+        # fix logger level according to verbosity
+        verbosity = options['verbosity']
+        if verbosity == '0':
+            self.logger.setLevel(logging.ERROR)
+        elif verbosity == '1':
+            self.logger.setLevel(logging.INFO)
+        elif verbosity >= '2':
+            self.logger.setLevel(logging.DEBUG)
+
+        if not options['status']:
+            if options['retry_failed']:
+                n = OutboxMessage.objects.filter(status=OutboxMessage.STATUS.failed).\
+                    update(status=OutboxMessage.STATUS.pending, n_attempts=0)
+                self.logger.info("%d failed mails queued again" % n)
+
+            n_sent, n_failed = drain(connections=options['connections'], rate=options['rate'])
+            self.logger.info("%d mails sent, %d failed attempts" % (n_sent, n_failed))
+
+        for (status, label) in OutboxMessage.STATUS:
+            self.stdout.write("%s: %d\n" % (label, OutboxMessage.objects.filter(status=status).count()))
@@ -3,22 +3,28 @@ from optparse import make_option
 from datetime import datetime
 from django.contrib.sites.models import Site
 from django.core.management.base import LabelCommand, BaseCommand, CommandError
-from django.db.models.query import EmptyQuerySet
 
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import get_template
-from django.template import Context
 from django.conf import settings
+from django.db import transaction
 from django.utils import translation
 
-from open_municipio.newscache.models import News
-from open_municipio.newsletter.models import Newsletter
+from open_municipio.newsletter.digest import compute_digests, render_digests, user_monitorings
+from open_municipio.newsletter.models import Newsletter, OutboxMessage
+from open_municipio.newsletter.outbox import drain, queue_message
+from open_municipio.om_utils.generic import resolve_generic
 from open_municipio.users.models import UserProfile
 
 class Command(LabelCommand):
     """
     Fetch and send emails containing news on monitored objects.
 
+    The digests of all the subscribed users are computed at once (see ``newsletter.digest``),
+    then rendered with a pool of worker processes (--workers), queued in the outbox,
+    and sent (see ``newsletter.outbox``).
+
+    Mails are queued in order of user id, and the newsletter keeps track of the last
+    user queued: the --resume option resumes the last unfinished newsletter from there.
+
     The --dryrun option allows to preview which mails will be sent, without actually send them
 
     """
@@ -38,14 +44,24 @@ class Command(LabelCommand):
         make_option('--from-date',
                     dest='fromdate',
                     help='Fetches news from this date, overrides ordinary last newsletter date filtering'),
+        make_option('--workers',
+                    type='int',
+                    dest='workers',
+                    default=1,
+                    help='Render emails with a pool of N worker processes'),
+        make_option('--resume',
+                    action='store_true',
+                    dest='resume',
+                    default=False,
+                    help='Resume the last unfinished newsletter'),
     )
 
     args = '<user_email>'
     label = 'user email'
     logger = logging.getLogger('import')
 
-    plaintext_tpl = get_template('email.txt')
-    htmly_tpl     = get_template('email.html')
+    # number of mails queued in a transaction, along with the checkpoint
+    queue_batch_size = 50
 
 
     def handle(self, *labels, **options):
@@ -68,12 +84,6 @@ class Command(LabelCommand):
             options['dryrun'] = True
             self.logger.setLevel(logging.DEBUG)
 
-        n_sent_mails = 0
-
-        nl = Newsletter()
-        if not options['dryrun']:
-            nl.save()
-
         if not labels:
             nlprofiles = UserProfile.objects.filter(wants_newsletter=True)
         else:
@@ -88,73 +98,97 @@ class Command(LabelCommand):
             if not options['fromdate']:
                 options['fromdate'] = from_date
 
+        nl = Newsletter(from_date=options['fromdate'])
+        if options['resume']:
+            unfinished = Newsletter.objects.filter(finished__isnull=True).order_by('-started')
+            if not unfinished:
+                raise CommandError("No unfinished newsletter to resume")
+            nl = unfinished[0]
+            options['fromdate'] = nl.from_date
+            self.logger.info(u'resuming newsletter started at {0}, after user {1}'.format(nl.started, nl.last_user_id))
+        elif not options['dryrun']:
+            nl.save()
+
         if options['fromdate']:
             self.logger.info('fetching news from: {0}'.format(options['fromdate']))
 
-        for profile in nlprofiles:
-            n_sent_mails += self.handle_label(profile, **options)
+        users = dict((user_id, (username, email)) for (user_id, username, email) in
+                     nlprofiles.values_list('user', 'user__username', 'user__email'))
+        monitorings = user_monitorings(nlprofiles)
+        digests = compute_digests(monitorings, options['fromdate'])
+        self.log_digests(users, monitorings, digests)
 
-        nl.n_mails = n_sent_mails
-        nl.finished = datetime.now()
         if not options['dryrun']:
+            context = {
+                'city': settings.SITE_INFO['main_city'],
+                'domain': Site.objects.get(pk=settings.SITE_ID).domain,
+            }
+            jobs = [(user_id, news, dict(context, n_monitored=len(monitorings[user_id])))
+                    for (user_id, news) in sorted(digests.items())
+                    if nl.last_user_id is None or user_id > nl.last_user_id]
+
+            subject, from_email = 'Monitoraggio Open Municipio', 'noreply@openmunicipio.it'
+            messages = []
+            for (user_id, text_content, html_content) in render_digests(jobs, options['workers']):
+                messages.append(queue_message(subject, text_content, from_email, [users[user_id][1]],
+                                              html_content, newsletter=nl, user_id=user_id, save=False))
+                if len(messages) >= self.queue_batch_size:
+                    self.queue_messages(nl, messages)
+                    messages = []
+            self.queue_messages(nl, messages)
+
+            n_sent, n_failed = drain(newsletter=nl)
+            self.logger.info(u'{0} mails sent, {1} failed attempts, {2} mails still to send'.format(
+                n_sent, n_failed, OutboxMessage.objects.filter(newsletter=nl, status=OutboxMessage.STATUS.pending).count()
+            ))
+
+            nl.finished = datetime.now()
             nl.save()
+        else:
+            self.logger.info(u'{0} mails would be sent (dryrun)'.format(len(digests)))
 
         translation.deactivate()
 
 
-    def handle_label(self, profile, **options):
+    @transaction.commit_on_success
+    def queue_messages(self, nl, messages):
         """
-        fetch newsletter and send email to a single user
-        return the number of mail sent
+        queue the given messages, and move the newsletter's checkpoint after them
         """
-        self.logger.info('-------------')
-        self.logger.info(u'user: {0}'.format(profile.user))
-        mos = profile.monitored_objects
-        if not mos:
-            self.logger.debug(u' not monitoring')
-            return 0
-        else:
-            self.logger.debug(u' monitoring these objects:')
-            # extract the news related to all objects that the user is monitoring
-            # filter: institutional news of highest priority, only
-            user_news = EmptyQuerySet()
-            for mo in mos:
-                related_news = mo.related_news.\
-                    filter(news_type=News.NEWS_TYPE.institutional).\
-                    filter(priority__lte=2)
-
-                # add date filter if required
-                if options['fromdate']:
-                    related_news = related_news.filter(created__gt=options['fromdate'])
-
-                # add objects related news to user news
-                user_news |= related_news
-
-                # log at debug level, for previewing
-                self.logger.debug(u' -{0}, with {1} news'.format(mo.__unicode__()[:60], related_news.count()))
-                for news in related_news:
-                    self.logger.debug(u'   *{0}'.format(news))
-
-            import re
-            site_domain = Site.objects.get(pk=settings.SITE_ID)
-
-            n_news = len(user_news)
-            if n_news:
-                if not options['dryrun']:
-                    d = Context({ 'profile': profile,
-                                  'city': settings.SITE_INFO['main_city'],
-                                  'user_news': [{'date': rn.news_date, 'text': re.sub('href=\"\/', 'href="http://{0}/'.format(site_domain), rn.text)} for rn in user_news]})
-
-                    subject, from_email, to = 'Monitoraggio Open Municipio', 'noreply@openmunicipio.it', profile.user.email
-                    text_content = self.plaintext_tpl.render(d)
-                    html_content = self.htmly_tpl.render(d)
-                    msg = EmailMultiAlternatives(subject, text_content, from_email, [to])
-                    msg.attach_alternative(html_content, "text/html")
-                    msg.send()
-                    self.logger.info(u'mail with {0} news sent'.format(n_news))
-                else:
-                    self.logger.info(u'mail with {0} news would be sent (dryrun)'.format(n_news))
+        if not messages:
+            return
+        OutboxMessage.objects.bulk_create(messages)
+        nl.last_user_id = messages[-1].user_id
+        nl.n_mails += len(messages)
+        nl.save()
+        self.logger.info(u'{0} mails queued'.format(nl.n_mails))
 
+
+    def log_digests(self, users, monitorings, digests):
+        """
+        log the digest of each user; monitored objects and news are logged at debug level, for previewing
+        """
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            objects = resolve_generic(key for keys in monitorings.values() for key in keys)
+
+        for (user_id, (username, email)) in sorted(users.items(), key=lambda u: u[1][0]):
+            self.logger.info('-------------')
+            self.logger.info(u'user: {0}'.format(username))
+            if user_id not in monitorings:
+                self.logger.debug(u' not monitoring')
+                continue
+
+            if debug:
+                self.logger.debug(u' monitoring these objects:')
+                for key in monitorings[user_id]:
+                    if key in objects:
+                        self.logger.debug(u' -{0}'.format(objects[key].__unicode__()[:60]))
+
+            news = digests.get(user_id, [])
+            if news:
+                self.logger.info(u'mail with {0} news to send'.format(len(news)))
+                for (news_date, text) in news:
+                    self.logger.debug(u'   *{0} {1}'.format(news_date, text))
             else:
                 self.logger.info(u'no news to send')
-            return n_news > 0
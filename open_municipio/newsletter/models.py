@@ -1,16 +1,25 @@
 from django.db import models
+from django.utils.translation import ugettext_lazy as _
 from datetime import datetime
 
+from model_utils import Choices
+
 class Newsletter(models.Model):
     """
     A simple table, to keep track of the sent newsletter.
     An instance is created at the beginning of the news extractions
     After emails are computed and sent, the instance is updated,
     with the sent timestamp and the number of mails sent.
+
+    Mails are queued in the outbox in order of user id; ``last_user_id`` is
+    the checkpoint of an unfinished newsletter: the id of the last user whose
+    mail was queued, so that an interrupted run can resume after it.
     """
     n_mails = models.IntegerField(default=0)
     started = models.DateTimeField(editable=False, auto_now_add=True)
     finished = models.DateTimeField(editable=False, blank=True, null=True)
+    from_date = models.DateTimeField(editable=False, blank=True, null=True)
+    last_user_id = models.IntegerField(editable=False, blank=True, null=True)
 
     def save(self, **kwargs):
         if not self.id:
@@ -19,3 +28,39 @@ class Newsletter(models.Model):
 
     def __unicode__(self):
         return "inizio: {n.started}, fine: {n.finished}, n mail: {n.n_mails}".format(n=self)
+
+
+class OutboxMessage(models.Model):
+    """
+    A rendered mail, queued to be sent (see ``newsletter.outbox``).
+
+    Failed deliveries are retried, with an exponential backoff, until
+    ``settings.OM_OUTBOX_MAX_ATTEMPTS`` attempts have been made.
+    """
+    STATUS = Choices(
+        ('PENDING', 'pending', _('pending')),
+        ('SENT', 'sent', _('sent')),
+        ('FAILED', 'failed', _('failed'))
+    )
+
+    newsletter = models.ForeignKey(Newsletter, blank=True, null=True, related_name='outbox_message_set')
+    user_id = models.IntegerField(blank=True, null=True)
+    subject = models.CharField(_('subject'), max_length=255)
+    from_email = models.CharField(_('from'), max_length=255)
+    # comma separated addresses
+    to = models.TextField(_('to'))
+    body = models.TextField(_('body'))
+    html_body = models.TextField(_('HTML body'), blank=True)
+    status = models.CharField(choices=STATUS, default=STATUS.pending, max_length=8, db_index=True)
+    n_attempts = models.PositiveSmallIntegerField(_('attempts'), default=0)
+    next_attempt_at = models.DateTimeField(_('next attempt at'), default=datetime.now, db_index=True)
+    error = models.TextField(_('error'), blank=True)
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    sent_at = models.DateTimeField(_('sent at'), blank=True, null=True)
+
+    def __unicode__(self):
+        return u"%s - %s: %s" % (self.get_status_display(), self.to, self.subject)
+
+    class Meta:
+        db_table = u'newsletter_outbox_message'
+        unique_together = ('newsletter', 'user_id')
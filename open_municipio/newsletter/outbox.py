@@ -0,0 +1,192 @@
+"""
+The outbox of outbound mails.
+
+Mails are not sent where they are composed: they are rendered, and queued as
+``OutboxMessage`` records (see ``queue_message``); ``drain`` then sends the
+pending messages over a small pool of persistent SMTP connections, one per
+sender thread, in batches, with rate limiting, and retries failed deliveries
+with an exponential backoff. A run interrupted halfway leaves the messages not
+yet sent in the queue, for the next run.
+
+Messages are sent through the backend set in ``settings.EMAIL_BACKEND``; to test
+against a local SMTP stand-in, run::
+
+    python -m smtpd -n -c DebuggingServer localhost:1025
+
+and set ``EMAIL_HOST = 'localhost'`` and ``EMAIL_PORT = 1025``.
+
+The outbox is configured in ``settings``:
+
+* ``OM_OUTBOX_CONNECTIONS`` - the number of SMTP connections (sender threads)
+* ``OM_OUTBOX_BATCH_SIZE`` - the number of messages read from the queue at a time
+* ``OM_OUTBOX_RATE`` - the maximum number of messages sent per second (0 for no limit)
+* ``OM_OUTBOX_MAX_ATTEMPTS`` - the number of attempts after which a message is failed
+* ``OM_OUTBOX_RETRY_DELAY`` - the delay before the first retry, in seconds; it doubles at each attempt
+"""
+from datetime import datetime, timedelta
+import logging
+from multiprocessing.pool import ThreadPool
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+
+from open_municipio.newsletter.models import OutboxMessage
+
+
+logger = logging.getLogger('import')
+
+
+class RateLimiter(object):
+    """
+    Limit the rate of an action, shared by many threads, to ``rate`` times per second.
+    """
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_time = time.time()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.time()
+            wait_time = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+class Sender(object):
+    """
+    Send mails over persistent SMTP connections, one per thread.
+    """
+    def __init__(self, rate=0):
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.limiter = RateLimiter(rate)
+
+    def get_connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = get_connection()
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def send(self, args):
+        """
+        Send a mail; return the tuple ``(pk, error)``, ``error`` being ``None`` on success.
+        """
+        pk, email = args
+        self.limiter.wait()
+        connection = self.get_connection()
+        try:
+            connection.open()
+            connection.send_messages([email])
+            return pk, None
+        except Exception, e:
+            # the connection may be broken: open a new one at the next message
+            try:
+                connection.close()
+            except Exception:
+                pass
+            return pk, "%s: %s" % (e.__class__.__name__, e)
+
+    def close(self):
+        for connection in self.connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        self.connections = []
+
+
+def queue_message(subject, body, from_email, to, html_body='', newsletter=None, user_id=None, save=True):
+    """
+    Queue a mail to the ``to`` list of addresses; return the ``OutboxMessage``.
+    """
+    message = OutboxMessage(subject=subject, body=body, from_email=from_email, to=u','.join(to),
+                            html_body=html_body, newsletter=newsletter, user_id=user_id)
+    if save:
+        message.save()
+    return message
+
+
+def as_email(message):
+    """
+    Return the ``EmailMultiAlternatives`` of the given ``OutboxMessage``.
+    """
+    email = EmailMultiAlternatives(message.subject, message.body, message.from_email,
+                                   [a for a in message.to.split(',') if a])
+    if message.html_body:
+        email.attach_alternative(message.html_body, "text/html")
+    return email
+
+
+def pending_messages(newsletter=None):
+    """
+    Return the QuerySet of the messages that are due to be sent (of the given newsletter, if any).
+    """
+    messages = OutboxMessage.objects.filter(status=OutboxMessage.STATUS.pending,
+                                            next_attempt_at__lte=datetime.now())
+    if newsletter is not None:
+        messages = messages.filter(newsletter=newsletter)
+    return messages.order_by('id')
+
+
+def drain(newsletter=None, connections=None, batch_size=None, rate=None, max_attempts=None):
+    """
+    Send the messages due to be sent (of the given newsletter, if any).
+    Return the tuple ``(number of messages sent, number of failed attempts)``.
+    """
+    connections = connections or settings.OM_OUTBOX_CONNECTIONS
+    batch_size = batch_size or settings.OM_OUTBOX_BATCH_SIZE
+    rate = settings.OM_OUTBOX_RATE if rate is None else rate
+    max_attempts = max_attempts or settings.OM_OUTBOX_MAX_ATTEMPTS
+
+    sender = Sender(rate)
+    pool = ThreadPool(connections)
+    n_sent = n_failed = 0
+    # messages failing in this run are not retried before the next batch
+    skipped_ids = []
+    try:
+        while True:
+            batch = list(pending_messages(newsletter).exclude(id__in=skipped_ids)[:batch_size])
+            if not batch:
+                break
+            messages = dict((m.pk, m) for m in batch)
+
+            sent_ids = []
+            for (pk, error) in pool.imap_unordered(sender.send, [(m.pk, as_email(m)) for m in batch]):
+                if error is None:
+                    sent_ids.append(pk)
+                    continue
+                message = messages[pk]
+                message.n_attempts += 1
+                message.error = error
+                if message.n_attempts >= max_attempts:
+                    message.status = OutboxMessage.STATUS.failed
+                else:
+                    message.next_attempt_at = datetime.now() + \
+                        timedelta(seconds=settings.OM_OUTBOX_RETRY_DELAY * 2 ** (message.n_attempts - 1))
+                message.save()
+                skipped_ids.append(pk)
+                n_failed += 1
+                logger.warning(u"sending mail to %s failed (attempt %d): %s" % (message.to, message.n_attempts, error))
+
+            OutboxMessage.objects.filter(id__in=sent_ids).update(
+                status=OutboxMessage.STATUS.sent, sent_at=datetime.now(), error=''
+            )
+            n_sent += len(sent_ids)
+            logger.info("%d mails sent, %d failed attempts" % (n_sent, n_failed))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        sender.close()
+    return n_sent, n_failed
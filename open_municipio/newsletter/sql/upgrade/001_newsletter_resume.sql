@@ -0,0 +1,5 @@
+-- adds the ``from_date`` and ``last_user_id`` columns of the newsletters, used to
+-- resume an interrupted ``nlsend`` run, to databases created before they were introduced;
+-- the table of the outbox (``newsletter_outbox_message``) is created by ``syncdb``
+ALTER TABLE newsletter_newsletter ADD COLUMN from_date timestamp with time zone NULL;
+ALTER TABLE newsletter_newsletter ADD COLUMN last_user_id integer NULL;
@@ -11,6 +11,7 @@ from os import path
 from open_municipio.people.models import Sitting, Institution, Person
 from open_municipio.votations.models import Votation, ChargeVote, InstitutionCharge
 from open_municipio import settings_import as settings
+from open_municipio.data_import.utils import PeopleMapping
 
 import logging
 
@@ -45,23 +46,21 @@ class Command(LabelCommand):
     logger = logging.getLogger('import')
 
     people_tree = None
+    people_mapping = None
 
     def lookupCharge(self, om_id, **options):
         """
         look for the correct open municipio charge, or return None
         """
-        people_charges = self.people_tree.xpath(
-            '//om:Person[@om_id=%s]' % om_id,
-            namespaces={'om': "http://www.openmunicipio.it"}
-        )
-        if len(people_charges) == 1:
-            id = people_charges[0].get('id')
+        ids = self.people_mapping.ids_for_om_id(om_id)
+        if len(ids) == 1:
+            id = ids[0]
             if id is None:
                 if int(options['verbosity']) > 0:
                     self.logger.error(" charge with om_id %s has no id in people XML file. Skipping.\n" % om_id)
                 return None
             return id
-        elif len(people_charges) > 1:
+        elif len(ids) > 1:
             if int(options['verbosity']) > 0:
                 self.logger.error(" more than one person for om_id %s in people XML file. Skipping.\n" % om_id)
             return None
@@ -221,8 +220,12 @@ class Command(LabelCommand):
             raise IOError("File %s does not exist" % people_file)
 
         self.people_tree = etree.parse(people_file)
+        self.people_mapping = PeopleMapping.for_tree(self.people_tree)
 
         # parse passed sittings
         for label in labels:
             self.handle_label(label, **options)
+
+        self.people_mapping.log_stats()
+        PeopleMapping.release(self.people_tree)
         return 'done\n'
@@ -4,10 +4,10 @@ from django.views.generic.base import TemplateView
 from open_municipio.acts.models import Calendar, Act, ActSupport
 from open_municipio.events.models import Event
 from open_municipio.locations.models import Location
-from open_municipio.newscache.models import News
+from open_municipio.newscache.models import News, newest_first
 from open_municipio.people.models import municipality, InstitutionResponsability, Person
 from open_municipio.taxonomy.models import Category, Tag
-from open_municipio.users.views import extract_top_monitored_objects
+from open_municipio.monitoring.leaderboards import top_monitored
 
 from django import http
 from django.template import (Context, loader)
@@ -44,14 +44,14 @@ class HomeView(TemplateView):
             filter(actsupport__support_type=ActSupport.SUPPORT_TYPE.first_signer).distinct().\
             order_by('-actsupport__support_date')[0:3]
 
-        news = News.objects.filter(news_type=News.NEWS_TYPE.community, priority=1)
-        context['last_community_news'] = sorted(news, key=lambda n: n.news_date, reverse=True)[0:3]
+        context['last_community_news'] = newest_first(News.objects.\
+            filter(news_type=News.NEWS_TYPE.community, priority=1), 3)
 
         context['key_acts'] = Act.objects.filter(is_key=True).order_by('-presentation_date')[0:3]
         context['key_votations'] = Votation.objects.filter(is_key=True).order_by('-sitting__date')[0:3]
 
 
-        context['top_monitored'] = extract_top_monitored_objects(Person, qnt=3)
+        context['top_monitored'] = top_monitored('politicians', 3)
 
 
         context['most_acts'] = municipality.council.as_institution.charge_set.\
@@ -0,0 +1,93 @@
+"""
+Version tokens of groups of cache entries.
+
+A group of cache entries (e.g. the cached news feed of a topic) is invalidated
+at once by making a version token part of the keys of the entries, and
+replacing it. Tokens are random, so that a version never repeats: an old entry
+can never become valid again.
+
+Tokens are stored in the DB (see ``CacheVersion``), not in the cache: no shared
+cache backend is configured, and the default one is local to each process, so
+a token replaced by an importer or a management command would never reach the
+web processes. Reading a token costs a primary key lookup; replacing it within
+a transaction makes the change visible to other processes together with the data.
+"""
+import uuid
+
+from django.db import IntegrityError, transaction
+
+
+def new_version():
+    """
+    Return a new, unique version token.
+    """
+    return uuid.uuid4().hex
+
+
+def _create_version(key):
+    from open_municipio.om_utils.models import CacheVersion
+
+    version = new_version()
+    sid = transaction.savepoint()
+    try:
+        CacheVersion.objects.create(key=key, version=version)
+        transaction.savepoint_commit(sid)
+    except IntegrityError:
+        # another process has just stored one
+        transaction.savepoint_rollback(sid)
+        version = CacheVersion.objects.get(key=key).version
+    return version
+
+
+def get_versions(keys):
+    """
+    Return a dictionary mapping each of ``keys`` to its version token,
+    storing a new one for the keys that have none.
+    """
+    from open_municipio.om_utils.models import CacheVersion
+
+    keys = list(keys)
+    versions = dict(CacheVersion.objects.filter(key__in=keys).values_list('key', 'version'))
+    for key in keys:
+        if key not in versions:
+            versions[key] = _create_version(key)
+    return versions
+
+
+def get_version(key):
+    """
+    Return the version token stored under ``key``, storing a new one if there is none.
+    """
+    return get_versions([key])[key]
+
+
+def bump_versions(keys):
+    """
+    Store new version tokens under ``keys``, invalidating the entries of the previous ones.
+    """
+    from open_municipio.om_utils.models import CacheVersion
+
+    keys = set(keys)
+    if not keys:
+        return
+    CacheVersion.objects.filter(key__in=keys).update(version=new_version())
+    for key in keys - set(CacheVersion.objects.filter(key__in=keys).values_list('key', flat=True)):
+        _create_version(key)
+
+
+def bump_version(key):
+    """
+    Store a new version token under ``key``, invalidating the entries of the previous one.
+    """
+    bump_versions([key])
+
+
+def lock_version(key):
+    """
+    Lock the row of the version token stored under ``key`` until the end of the
+    current transaction, so that concurrent writers of the group are serialized.
+    """
+    from open_municipio.om_utils.models import CacheVersion
+
+    get_version(key)
+    list(CacheVersion.objects.select_for_update().filter(key=key))
@@ -0,0 +1,50 @@
+"""
+Helpers to write many rows with a single ``executemany`` statement.
+
+Django 1.4 has ``bulk_create`` but no bulk update; both helpers
+bypass the ORM (and its signals). Within a managed transaction
+(e.g. a ``transaction.commit_on_success`` block) the transaction is marked
+as dirty, otherwise changes are committed at once.
+"""
+from django.db import connection, transaction
+
+
+def _executemany(sql, rows):
+    connection.cursor().executemany(sql, rows)
+    if transaction.is_managed():
+        transaction.set_dirty()
+    else:
+        transaction.commit_unless_managed()
+
+
+def bulk_insert(model, fields, rows):
+    """
+    Insert ``rows`` (sequences of values, in the same order of ``fields``)
+    into the table of ``model``.
+    """
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    sql = "INSERT INTO %s (%s) VALUES (%s)" % (
+        qn(model._meta.db_table),
+        ", ".join(qn(model._meta.get_field(f).column) for f in fields),
+        ", ".join(["%s"] * len(fields))
+    )
+    _executemany(sql, rows)
+
+
+def bulk_update(model, fields, rows):
+    """
+    Update ``fields`` of the rows of the table of ``model``;
+    each row is a sequence of the new values, in the same order of ``fields``,
+    followed by the primary key of the record.
+    """
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    sql = "UPDATE %s SET %s WHERE %s = %%s" % (
+        qn(model._meta.db_table),
+        ", ".join("%s = %%s" % qn(model._meta.get_field(f).column) for f in fields),
+        qn(model._meta.pk.column)
+    )
+    _executemany(sql, rows)
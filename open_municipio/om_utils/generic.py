@@ -0,0 +1,98 @@
+"""
+Bulk resolution of generic relations.
+
+Accessing a ``GenericForeignKey`` on each row of a list costs one query per row.
+The helpers in this module group the ``(content type, primary key)`` pairs of
+a whole list by content type, and fetch each type with a single ``in_bulk``
+query; ``Act`` instances are downcasted to their concrete subclasses in bulk,
+as well. Usage::
+
+    from open_municipio.om_utils.generic import prefetch_generic
+
+    news = prefetch_generic(news, 'generating_object', 'related_object')
+    objects = resolve_generic([(content_type_id, object_pk), ...])
+"""
+from django.contrib.contenttypes.models import ContentType
+
+
+def _content_type_id(content_type):
+    if isinstance(content_type, ContentType):
+        return content_type.pk
+    return int(content_type)
+
+
+def resolve_generic(pairs):
+    """
+    Given an iterable of ``(content type, primary key)`` pairs (content types
+    as instances or ids), return a dictionary mapping each pair, with the content
+    type as an id, to its object; objects that do not exist are not mapped.
+    """
+    from open_municipio.acts.models import Act
+
+    pks_by_type = {}
+    for (content_type, pk) in pairs:
+        if content_type is None or pk is None:
+            continue
+        pks_by_type.setdefault(_content_type_id(content_type), set()).add(int(pk))
+
+    objects = {}
+    for (content_type_id, pks) in pks_by_type.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is None:
+            continue
+        if model is Act:
+            # downcast acts to their concrete types
+            fetched = dict((o.pk, o) for o in Act.objects.filter(pk__in=list(pks)).select_subclasses())
+        else:
+            fetched = model._default_manager.in_bulk(list(pks))
+        for (pk, obj) in fetched.items():
+            objects[(content_type_id, pk)] = obj
+    return objects
+
+
+def prefetch_generic(instances, *names):
+    """
+    Fetch in bulk the objects of the given ``GenericForeignKey`` fields of ``instances``,
+    and cache them in the instances, so that accessing the fields costs no query.
+
+    Return the list of the instances.
+    """
+    instances = list(instances)
+    if not instances:
+        return instances
+
+    model = instances[0].__class__
+    fields = [getattr(model, name) for name in names]
+    objects = resolve_generic(
+        (getattr(i, field.ct_field + '_id'), getattr(i, field.fk_field))
+        for i in instances for field in fields
+    )
+    for i in instances:
+        for field in fields:
+            content_type_id = getattr(i, field.ct_field + '_id')
+            pk = getattr(i, field.fk_field)
+            if content_type_id is not None and pk is not None:
+                setattr(i, field.cache_attr, objects.get((content_type_id, int(pk))))
+    return instances
+
+
+def resolve_generic_rows(rows, ct_key='content_type', pk_key='object_pk', attr='object'):
+    """
+    Add to each of the given dictionaries (e.g. rows of a ``values`` QuerySet)
+    the object referenced by its ``ct_key`` and ``pk_key`` items, as ``attr``,
+    and its content type, as ``ct_key``; rows referencing missing objects are dropped.
+
+    Return the list of the rows.
+    """
+    rows = list(rows)
+    objects = resolve_generic((r[ct_key], r[pk_key]) for r in rows)
+    resolved = []
+    for r in rows:
+        content_type_id = _content_type_id(r[ct_key])
+        obj = objects.get((content_type_id, int(r[pk_key])))
+        if obj is None:
+            continue
+        r[ct_key] = ContentType.objects.get_for_id(content_type_id)
+        r[attr] = obj
+        resolved.append(r)
+    return resolved
@@ -35,4 +35,20 @@ class SlugModel(models.Model):
                 model.objects.get(slug=slug)
                 slug = self.slugify(self.name, i)
             except model.DoesNotExist:
-                return slug
\ No newline at end of file
+                return slug
+
+class CacheVersion(models.Model):
+    """
+    The version token of a group of cache entries (see ``om_utils.cache``).
+
+    Tokens are kept in the DB, where every process can read them, since the
+    cache itself may be local to each process.
+    """
+    key = models.CharField(max_length=128, primary_key=True)
+    version = models.CharField(max_length=32)
+
+    class Meta:
+        db_table = u'om_utils_cache_version'
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.key, self.version)
@@ -0,0 +1,120 @@
+"""
+A content-addressed file storage.
+
+Files are stored once, under a name derived from the SHA1 hash of their content::
+
+    <first directory of the upload path>/ab/cd/abcd...ef.<extension>
+
+so that any number of records can reference the same file, and saving a file
+whose content is already stored writes nothing.
+
+Since files are shared, ``delete`` does not remove them: files no longer
+referenced by any ``FileField`` using the storage are removed by
+``collect_garbage``.
+"""
+import hashlib
+import os
+import time
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db.models import FileField, get_models
+from django.utils.encoding import force_unicode
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    A ``FileSystemStorage`` naming files after the hash of their content.
+    """
+    # content hashes are read in chunks of this size
+    chunk_size = 64 * 2 ** 10
+
+    def content_name(self, name, content):
+        """
+        Return the name of ``content`` in the storage, given the name it would have been saved with.
+        """
+        sha1 = hashlib.sha1()
+        for chunk in content.chunks(self.chunk_size):
+            sha1.update(chunk)
+        content.seek(0)
+        digest = sha1.hexdigest()
+
+        name = name.replace('\\', '/')
+        prefix = name.split('/')[0] if '/' in name else ''
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(prefix, digest[:2], digest[2:4], digest + extension)
+
+    def is_content_name(self, name):
+        """
+        Return ``True`` if ``name`` is in the content-addressed layout.
+        """
+        parts = (name or '').replace('\\', '/').split('/')
+        digest = os.path.splitext(parts[-1])[0]
+        return len(parts) >= 3 and len(digest) == 40 and \
+            parts[-3] == digest[:2] and parts[-2] == digest[2:4]
+
+    def save(self, name, content):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content)
+
+        name = self.content_name(name, content)
+        if not self.exists(name):
+            name = self._save(name, content)
+        return force_unicode(name.replace('\\', '/'))
+
+    def _save(self, name, content):
+        # write under a temporary name, then atomically move the file in place,
+        # so that concurrent saves of the same content do not collide
+        tmp_name = super(ContentAddressedStorage, self)._save(
+            "%s.%s.tmp" % (name, uuid.uuid4().hex), content
+        )
+        os.rename(self.path(tmp_name), self.path(name))
+        return name
+
+    def get_available_name(self, name):
+        # names depend on the content only: the same name means the same file
+        return name
+
+    def delete(self, name):
+        # files may be shared: see ``collect_garbage``
+        pass
+
+    def referenced_names(self):
+        """
+        Return the set of the names referenced by the ``FileField``s using this storage.
+        """
+        names = set()
+        for model in get_models():
+            for field in model._meta.fields:
+                if isinstance(field, FileField) and field.storage is self:
+                    names.update(model._default_manager.exclude(**{field.name: ''}).
+                                 values_list(field.name, flat=True))
+        return names
+
+    def collect_garbage(self, min_age=60 * 60, dry_run=False):
+        """
+        Remove the files in the content-addressed layout that are not referenced anymore,
+        and are older than ``min_age`` seconds (so that files just saved by a running
+        import are kept). Return the list of the names of the removed files.
+        """
+        referenced = self.referenced_names()
+        removed = []
+        now = time.time()
+        for (dir_path, dir_names, file_names) in os.walk(self.location):
+            for file_name in file_names:
+                path = os.path.join(dir_path, file_name)
+                name = os.path.relpath(path, self.location).replace(os.sep, '/')
+                if not self.is_content_name(name) or name in referenced:
+                    continue
+                if now - os.path.getmtime(path) < min_age:
+                    continue
+                if not dry_run:
+                    os.remove(path)
+                removed.append(name)
+        return removed
+
+
+content_addressed_storage = ContentAddressedStorage()
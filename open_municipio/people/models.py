@@ -3,6 +3,8 @@ from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 from django.db import models
 from django.db.models import permalink
 from django.db.models.query import EmptyQuerySet
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.utils.datetime_safe import date
 from django.utils.translation import ugettext_lazy as _
 from django.template.defaultfilters import slugify
@@ -183,11 +185,16 @@ class Person(models.Model, MonitorizedItem):
         Returns group at given moment in time (now if moment is None)
         Group is computed from GroupCharge where Charge is the IntstitutionalCharge in the council
         Returns None if there is no current group.
+
+        The lookup is performed on the in-memory ``membership_timeline``, with no DB hits.
         """
-        gc = self.get_current_groupcharge(moment)
-        if gc is None:
+        from open_municipio.people.timeline import membership_timeline
+        try:
+            council = membership_timeline.institution(Institution.COUNCIL)
+            ic = membership_timeline.charge_of(self, council, moment)
+        except ObjectDoesNotExist:
             return None
-        return gc.group
+        return membership_timeline.group_of(ic, moment)
     current_group = property(get_current_group)
 
 
@@ -1386,3 +1393,24 @@ class Municipality(object):
   
   
 municipality = Municipality()
+
+
+#
+# Signals handlers
+#
+
+@receiver(post_save, sender=InstitutionCharge)
+@receiver(post_delete, sender=InstitutionCharge)
+@receiver(post_save, sender=GroupCharge)
+@receiver(post_delete, sender=GroupCharge)
+@receiver(post_save, sender=InstitutionResponsability)
+@receiver(post_delete, sender=InstitutionResponsability)
+@receiver(post_save, sender=GroupResponsability)
+@receiver(post_delete, sender=GroupResponsability)
+def invalidate_membership_timeline(**kwargs):
+    """
+    the in-memory membership timeline must be rebuilt
+    whenever charges, group charges or responsabilities change
+    """
+    from open_municipio.people.timeline import membership_timeline
+    membership_timeline.notify_change(kwargs['instance'])
@@ -4,9 +4,12 @@ when you run "manage.py test".
 
 Replace this with more appropriate tests for your application.
 """
+from datetime import date
 
 from django.test import TestCase
 
+from open_municipio.people.timeline import IntervalIndex
+
 
 class SimpleTest(TestCase):
     def test_basic_addition(self):
@@ -14,3 +17,41 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class IntervalIndexTest(TestCase):
+    def setUp(self):
+        self.index = IntervalIndex()
+        self.index.add('council', date(2010, 1, 1), date(2010, 12, 31), 'a')
+        self.index.add('council', date(2010, 7, 1), None, 'b')
+        self.index.add('council', date(2011, 6, 1), date(2011, 6, 1), 'c')
+        self.index.freeze()
+
+    def test_before_first_interval(self):
+        self.assertEqual(self.index.at('council', date(2009, 12, 31)), ())
+
+    def test_unknown_key(self):
+        self.assertEqual(self.index.at('gov', date(2010, 1, 1)), ())
+
+    def test_start_boundary_is_included(self):
+        self.assertEqual(self.index.at('council', date(2010, 1, 1)), ('a',))
+        self.assertEqual(set(self.index.at('council', date(2010, 7, 1))), set(['a', 'b']))
+
+    def test_end_boundary_is_included(self):
+        self.assertEqual(set(self.index.at('council', date(2010, 12, 31))), set(['a', 'b']))
+        self.assertEqual(self.index.at('council', date(2011, 1, 1)), ('b',))
+
+    def test_single_day_interval(self):
+        self.assertEqual(self.index.at('council', date(2011, 5, 31)), ('b',))
+        self.assertEqual(set(self.index.at('council', date(2011, 6, 1))), set(['b', 'c']))
+        self.assertEqual(self.index.at('council', date(2011, 6, 2)), ('b',))
+
+    def test_open_ended_interval(self):
+        self.assertEqual(self.index.at('council', date(2030, 1, 1)), ('b',))
+
+    def test_closed_intervals_only(self):
+        index = IntervalIndex()
+        index.add('group', date(2010, 1, 1), date(2010, 1, 31), 'x')
+        index.freeze()
+        self.assertEqual(index.at('group', date(2010, 1, 31)), ('x',))
+        self.assertEqual(index.at('group', date(2010, 2, 1)), ())
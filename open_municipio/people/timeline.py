@@ -0,0 +1,315 @@
+"""
+An in-memory index of the historical composition of institutions and groups.
+
+Answering "who held which seat at date D" through ``TimeFramedQuerySet.current()``
+costs a query per call; importers and caches ask that question thousands of times
+per sitting. The ``MembershipTimeline`` loads all timeframed membership records once
+and answers point-in-time lookups through bisection over sorted interval boundaries,
+without touching the DB.
+
+Usage::
+
+    from open_municipio.people.timeline import membership_timeline
+
+    members = membership_timeline.members_at(council, '2012-05-21')
+    group = membership_timeline.group_of(charge, sitting.date)
+
+The index is rebuilt lazily, after any ``InstitutionCharge``, ``GroupCharge``,
+``InstitutionResponsability`` or ``GroupResponsability`` has been saved or deleted
+(see signal handlers in ``people.models``).
+"""
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+import threading
+import time
+
+from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
+
+from open_municipio.om_utils.cache import bump_version, get_version
+
+
+class IntervalIndex(object):
+    """
+    Maps keys to sets of objects, valid within closed date intervals.
+
+    For every key, the boundaries of all the intervals are sorted into a list,
+    and the tuple of the objects valid between two consecutive boundaries is
+    precomputed, so that a lookup is a single bisection.
+    """
+    def __init__(self):
+        self._intervals = {}
+        self._boundaries = {}
+        self._segments = {}
+
+    def add(self, key, start_date, end_date, obj):
+        """
+        Register ``obj`` under ``key``, valid from ``start_date`` to ``end_date``
+        (both included); an ``end_date`` of ``None`` means *still valid*.
+        """
+        self._intervals.setdefault(key, []).append((start_date, end_date, obj))
+
+    def freeze(self):
+        """
+        Compute boundaries and segments for all registered keys.
+        """
+        for key, intervals in self._intervals.items():
+            boundaries = set()
+            for (start_date, end_date, obj) in intervals:
+                boundaries.add(start_date)
+                if end_date is not None:
+                    boundaries.add(end_date + timedelta(days=1))
+            boundaries = sorted(boundaries)
+            segments = []
+            for boundary in boundaries:
+                segments.append(tuple(
+                    obj for (start_date, end_date, obj) in intervals
+                    if start_date <= boundary and (end_date is None or end_date >= boundary)
+                ))
+            self._boundaries[key] = boundaries
+            self._segments[key] = segments
+        self._intervals = {}
+
+    def at(self, key, moment):
+        """
+        Return the tuple of objects registered under ``key`` and valid at ``moment``.
+        """
+        boundaries = self._boundaries.get(key)
+        if not boundaries:
+            return ()
+        i = bisect_right(boundaries, moment) - 1
+        if i < 0:
+            return ()
+        return self._segments[key][i]
+
+
+class MembershipTimeline(object):
+    """
+    Point-in-time lookups of charges, groups and responsabilities.
+
+    All lookup methods accept a moment expressed as a ``date``, a ``datetime``,
+    a ``YYYY-MM-DD`` string or ``None`` (meaning *today*), exactly as the
+    ``TimeFramedQuerySet`` methods do.
+
+    Since the timeline lives in the memory of each process, a version token
+    is kept in the DB (see ``om_utils.cache``), and checked at most every
+    ``VERSION_CHECK_INTERVAL`` seconds, so that a change recorded by a process
+    (e.g. an importer) forces the rebuild of the timeline in all other
+    processes, as well.
+    """
+    VERSION_CACHE_KEY = 'om_people_membership_timeline_version'
+
+    # how often (in seconds) the version token is checked
+    VERSION_CHECK_INTERVAL = 1
+
+    # ``InstitutionCharge`` fields the timeline depends upon
+    CHARGE_FIELDS = ('person_id', 'institution_id', 'original_charge_id', 'start_date', 'end_date')
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = None
+        self._version_checked_at = 0
+        self._moments = {}
+        self._charge_fields = {}
+        self.is_built = False
+
+    def invalidate(self):
+        """
+        Mark the timeline as stale, in this and in every other process.
+        """
+        self.is_built = False
+        bump_version(self.VERSION_CACHE_KEY)
+
+    def notify_change(self, instance):
+        """
+        Invalidate the timeline after ``instance`` has been saved or deleted.
+
+        Saving an ``InstitutionCharge`` only to update its cached counters
+        (as the votation importers do) does not invalidate the timeline.
+
+        The saved values are compared with a snapshot of the indexed ones, taken
+        when the timeline was built, since the indexed instances are handed out
+        to callers, and may have been modified by them.
+        """
+        from open_municipio.people.models import InstitutionCharge
+
+        if self.is_built and isinstance(instance, InstitutionCharge):
+            indexed = self._charge_fields.get(instance.pk)
+            if indexed is not None and indexed == self._fields_of(instance):
+                return
+        self.invalidate()
+
+    def _fields_of(self, charge):
+        return tuple(getattr(charge, f) for f in self.CHARGE_FIELDS)
+
+    def build(self):
+        """
+        Load all timeframed membership records and index them.
+        """
+        from open_municipio.people.models import Institution, InstitutionCharge, \
+            InstitutionResponsability, GroupCharge, GroupResponsability
+
+        with self._lock:
+            self._version = get_version(self.VERSION_CACHE_KEY)
+            self._version_checked_at = time.time()
+
+            institutions = {}
+            for i in Institution.objects.all():
+                institutions[i.pk] = i
+
+            members = IntervalIndex()
+            person_charges = IntervalIndex()
+            charges = {}
+            for c in InstitutionCharge.objects.select_related('person').all():
+                c.institution = institutions[c.institution_id]
+                charges[c.pk] = c
+                members.add(c.institution_id, c.start_date, c.end_date, c)
+                person_charges.add((c.person_id, c.institution_id), c.start_date, c.end_date, c)
+
+            groups = IntervalIndex()
+            groupcharges = {}
+            for gc in GroupCharge.objects.select_related('group').all():
+                gc.charge = charges[gc.charge_id]
+                groupcharges[gc.pk] = gc
+                groups.add(gc.charge_id, gc.start_date, gc.end_date, gc)
+
+            responsabilities = IntervalIndex()
+            for r in InstitutionResponsability.objects.all():
+                r.charge = charges[r.charge_id]
+                responsabilities.add(r.charge_id, r.start_date, r.end_date, r)
+
+            group_responsabilities = IntervalIndex()
+            for r in GroupResponsability.objects.all():
+                gc = groupcharges[r.charge_id]
+                r.charge = gc
+                group_responsabilities.add(gc.charge_id, r.start_date, r.end_date, r)
+
+            for index in (members, person_charges, groups, responsabilities, group_responsabilities):
+                index.freeze()
+
+            self._institutions = institutions
+            self._charges = charges
+            self._charge_fields = dict((pk, self._fields_of(c)) for (pk, c) in charges.items())
+            self._members = members
+            self._person_charges = person_charges
+            self._groups = groups
+            self._responsabilities = responsabilities
+            self._group_responsabilities = group_responsabilities
+            self.is_built = True
+
+    def _ensure_built(self):
+        if self.is_built and time.time() - self._version_checked_at > self.VERSION_CHECK_INTERVAL:
+            self._version_checked_at = time.time()
+            if self._version != get_version(self.VERSION_CACHE_KEY):
+                self.is_built = False
+        if not self.is_built:
+            self.build()
+
+    def _moment(self, moment):
+        """
+        Normalize a moment into a ``date`` instance.
+
+        Parsed strings are memoized, since the same few sitting dates are
+        passed over and over during an import.
+        """
+        if moment is None:
+            return date.today()
+        if isinstance(moment, datetime):
+            return moment.date()
+        if isinstance(moment, date):
+            return moment
+        try:
+            return self._moments[moment]
+        except KeyError:
+            d = self._moments[moment] = datetime.strptime(moment, "%Y-%m-%d").date()
+            return d
+
+    def _unique(self, objects):
+        if len(objects) == 0:
+            raise ObjectDoesNotExist
+        if len(objects) > 1:
+            raise MultipleObjectsReturned
+        return objects[0]
+
+    @staticmethod
+    def _pk(obj):
+        return getattr(obj, 'pk', obj)
+
+    def institution(self, institution_type):
+        """
+        Return the (unique) institution of the given type.
+        """
+        self._ensure_built()
+        return self._unique([i for i in self._institutions.values()
+                             if i.institution_type == institution_type])
+
+    def members_at(self, institution, moment=None):
+        """
+        Return the list of the ``InstitutionCharge`` instances current
+        in ``institution`` (an instance or a pk) at ``moment``.
+        """
+        self._ensure_built()
+        return list(self._members.at(self._pk(institution), self._moment(moment)))
+
+    def charge_of(self, person, institution, moment=None):
+        """
+        Return the ``InstitutionCharge`` held by ``person`` in ``institution`` at ``moment``.
+
+        Raise ``ObjectDoesNotExist`` or ``MultipleObjectsReturned``, as
+        ``Person.get_current_charge_in_institution`` does.
+        """
+        self._ensure_built()
+        return self._unique(self._person_charges.at(
+            (self._pk(person), self._pk(institution)), self._moment(moment)
+        ))
+
+    def groupcharge_of(self, charge, moment=None):
+        """
+        Return the ``GroupCharge`` of a council charge at ``moment``, or ``None``.
+
+        As in ``InstitutionCharge.current_at_moment_groupcharge``, committee charges
+        are looked up through their original council charge.
+
+        Raise ``MultipleObjectsReturned`` if the charge belongs to more than one group.
+        """
+        self._ensure_built()
+        charge = self._charges.get(self._pk(charge))
+        if charge is None:
+            return None
+        if charge.original_charge_id is not None:
+            charge = self._charges.get(charge.original_charge_id, charge)
+        groupcharges = self._groups.at(charge.pk, self._moment(moment))
+        if not groupcharges:
+            return None
+        return self._unique(groupcharges)
+
+    def group_of(self, charge, moment=None):
+        """
+        Return the ``Group`` a charge belongs to at ``moment``, or ``None``.
+        """
+        gc = self.groupcharge_of(charge, moment)
+        if gc is None:
+            return None
+        return gc.group
+
+    def responsability_of(self, charge, moment=None):
+        """
+        Return the ``InstitutionResponsability`` of a charge at ``moment``, or ``None``.
+        """
+        self._ensure_built()
+        responsabilities = self._responsabilities.at(self._pk(charge), self._moment(moment))
+        if not responsabilities:
+            return None
+        return self._unique(responsabilities)
+
+    def group_responsability_of(self, charge, moment=None):
+        """
+        Return the ``GroupResponsability`` of a council charge at ``moment``, or ``None``.
+        """
+        self._ensure_built()
+        responsabilities = self._group_responsabilities.at(self._pk(charge), self._moment(moment))
+        if not responsabilities:
+            return None
+        return self._unique(responsabilities)
+
+
+membership_timeline = MembershipTimeline()
@@ -2,7 +2,7 @@ from django.conf.urls.defaults import *
 
 from open_municipio.people.views import (CouncilListView, CityGovernmentView, MayorDetailView,
                                          CommitteeDetailView, InstitutionListView, CommitteeListView,
-                                         GroupListView, GroupDetailView)
+                                         GroupListView, GroupDetailView, GroupAnalyticsJSONView)
 
 urlpatterns = patterns('',
     url(r'^$', InstitutionListView.as_view(), name='om_institution_list'),
@@ -12,5 +12,6 @@ urlpatterns = patterns('',
     url(r'^committees/(?P<slug>[-\w]+)/$', CommitteeDetailView.as_view(), name='om_institution_committee'),
     url(r'^groups/$', GroupListView.as_view(), name='om_institution_groups'),
     url(r'^groups/(?P<slug>[-\w]+)/$', GroupDetailView.as_view(), name='om_institution_group'),
+    url(r'^groups/(?P<slug>[-\w]+)/analytics.json$', GroupAnalyticsJSONView.as_view(), name='om_institution_group_analytics'),
     url(r'^council/$', CouncilListView.as_view(), name='om_institution_council'),
 )
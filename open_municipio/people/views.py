@@ -7,10 +7,15 @@ from django.core.exceptions import ObjectDoesNotExist
 
 from open_municipio.people.models import Institution, InstitutionCharge, Person, municipality, InstitutionResponsability, Group
 from open_municipio.monitoring.forms import MonitoringForm
+from open_municipio.monitoring.membership import is_monitoring
+from open_municipio.monitoring.models import prefetch_monitoring_counters
 from open_municipio.acts.models import Act, Deliberation, Interrogation, Interpellation, Motion, Agenda, ActSupport
 from open_municipio.events.models import Event
+from open_municipio.votations.matrix import get_vote_matrix
+from open_municipio.votations.analytics import get_group_analytics
 
 from django.core import serializers
+from django.utils import simplejson as json
 
 from sorl.thumbnail import get_thumbnail
 
@@ -75,7 +80,7 @@ class CouncilListView(TemplateView):
         mayor = municipality.mayor.as_charge
         council = municipality.council
         president = municipality.council.president.charge
-        vicepresidents = municipality.council.vicepresidents
+        vicepresidents = list(municipality.council.vicepresidents)
         groups = municipality.council.groups
         committees = municipality.committees.as_institution
         latest_acts = Act.objects.filter(
@@ -91,9 +96,15 @@ class CouncilListView(TemplateView):
                 emitting_institution__institution_type=Institution.COUNCIL
                 ).count()
 
+        # read the monitoring counts of the whole table at once
+        council_members = list(council.members)
+        prefetch_monitoring_counters([c.person for c in council_members] +
+                                     [president.person] + [vp.charge.person for vp in vicepresidents])
+
         extra_context = {
             'mayor': mayor,
             'council': council,
+            'council_members': council_members,
             'president': president,
             'vicepresidents': vicepresidents,
             'groups': groups,
@@ -134,10 +145,15 @@ class CityGovernmentView(TemplateView):
                 emitting_institution__institution_type=Institution.CITY_GOVERNMENT
                 ).count()
             
+        # read the monitoring counts of the whole table at once
+        citygov_members = list(citygov.members)
+        prefetch_monitoring_counters([c.person for c in citygov_members] + [mayor.person, firstdeputy.person])
+
         extra_context = {
             'mayor': mayor,
             'firstdeputy': firstdeputy,
             'citygov': citygov,
+            'citygov_members': citygov_members,
             'latest_acts': latest_acts,
             'num_acts': num_acts,
             'events': events,
@@ -171,9 +187,59 @@ class GroupDetailView(DetailView):
         # Call the base implementation first to get a context
         extra_context = super(GroupDetailView, self).get_context_data(**kwargs)
         extra_context['groups'] = municipality.council.groups.filter(groupcharge__end_date__isnull=True).distinct()
+
+        # cohesion and loyalty metrics, by year
+        analytics = get_group_analytics()
+        extra_context['group_analytics'] = analytics.get(self.object.pk) if analytics else None
+        if extra_context['group_analytics']:
+            extra_context['group_analytics_table'] = group_analytics_table(extra_context['group_analytics'])
         return extra_context
 
 
+def group_analytics_table(analytics):
+    """
+    Arrange the metrics of a group (see ``votations.analytics``) for display:
+    the other groups, sorted by acronym, and a row for each year, and one for the
+    whole period, with the agreement with each of the other groups.
+    """
+    def fmt(value, pattern):
+        return '-' if value is None else pattern % value
+
+    rows = list(analytics['years'])
+    if analytics['overall']:
+        rows.append(dict(analytics['overall'], year=None))
+    other_ids = set(pk for row in rows for pk in row['agreement'])
+    others = sorted(Group.objects.in_bulk(list(other_ids)).values(), key=lambda g: g.acronym)
+
+    return {
+        'groups': others,
+        'rows': [{
+            'year': row['year'],
+            'n_votations': row['n_votations'],
+            'rice': fmt(row['rice'], "%.2f"),
+            'majority_agreement': fmt(row['majority_agreement'] and 100 * row['majority_agreement'], "%.1f%%"),
+            'agreement': [fmt(row['agreement'].get(g.pk) and 100 * row['agreement'][g.pk], "%.1f%%")
+                          for g in others],
+        } for row in rows],
+    }
+
+
+class GroupAnalyticsJSONView(DetailView):
+    """
+    Returns a JSON response with the cohesion and loyalty metrics of a group
+    (see ``votations.analytics``)
+    """
+    model = Group
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        analytics = get_group_analytics()
+        if analytics is None or self.object.pk not in analytics:
+            raise Http404
+        data = dict(analytics[self.object.pk], group=self.object.pk, acronym=self.object.acronym)
+        return HttpResponse(json.dumps(data), content_type='application/json')
+
+
 class CommitteeListView(ListView):
     model = Institution
     template_name = 'people/institution_committees.html'
@@ -287,15 +353,23 @@ class PoliticianDetailView(DetailView):
             # Calculate average present/absent for counselors
             percentage_present = 0
             percentage_absent = 0
-            n_counselors = len(municipality.council.charges)
-            for counselor in municipality.council.charges:
-                n_votations = counselor.n_present_votations \
-                    + counselor.n_absent_votations
-                if n_votations > 0:
-                    percentage_present += \
-                        float(counselor.n_present_votations) / n_votations
-                    percentage_absent += \
-                        float(counselor.n_absent_votations) / n_votations
+            counselors = municipality.council.charges
+            n_counselors = len(counselors)
+            vote_matrix = get_vote_matrix()
+            if vote_matrix is not None:
+                # vectorised over the rows of the vote matrix
+                present_rates, absent_rates = vote_matrix.presence_rates([c.pk for c in counselors])
+                percentage_present = present_rates.sum()
+                percentage_absent = absent_rates.sum()
+            else:
+                for counselor in counselors:
+                    n_votations = counselor.n_present_votations \
+                        + counselor.n_absent_votations
+                    if n_votations > 0:
+                        percentage_present += \
+                            float(counselor.n_present_votations) / n_votations
+                        percentage_absent += \
+                            float(counselor.n_absent_votations) / n_votations
             # Empty city council? That can't be the case!
             # n_counselors is supposed to be > 0
             context['percentage_present_votations_average'] = \
@@ -326,6 +400,10 @@ class PoliticianDetailView(DetailView):
                 .filter(votation__is_key=True) \
                 .order_by('-votation__sitting__date')[0:10]
 
+            # who votes like this politician (see ``votations.similarity``)
+            context['similar_charges'] = charge.similarity_set \
+                .select_related('similar_charge__person').order_by('rank')
+
         # last 10 presented acts
         presented_acts = Act.objects\
             .filter(actsupport__charge__pk__in=self.object.current_institution_charges)\
@@ -345,7 +423,7 @@ class PoliticianDetailView(DetailView):
                     'user_id': self.request.user.id
                 })
 
-                if context['person'] in self.request.user.get_profile().monitored_objects:
+                if is_monitoring(self.request.user, context['person']):
                     context['is_user_monitoring'] = True
         except ObjectDoesNotExist:
             context['is_user_monitoring'] = False
@@ -143,6 +143,7 @@ INSTALLED_APPS = (
     'open_municipio.data_import',
     'open_municipio.idioticon',
     'open_municipio.newsletter',
+    'open_municipio.om_utils',
     'sorl.thumbnail',
     'social_auth',
     'open_municipio.om_auth',
@@ -226,6 +227,32 @@ SECRET_KEY = 'unique-secret-key-has-been-changed-in-instance-settings'
 # Number of second within which users can delete their own comments
 OM_COMMENTS_REMOVAL_MAX_TIME = 600
 
+## settings for the ``open_municipio.monitoring`` app
+# Number of objects ranked in each leaderboard of the most monitored objects (see ``monitoring.leaderboards``)
+OM_LEADERBOARD_LENGTH = 10
+
+## settings for the ``open_municipio.votations`` app
+# Directory where the vote matrix (see ``votations.matrix``) is stored
+OM_VOTE_MATRIX_DIR = os.path.join(REPO_ROOT, 'data', 'vote_matrix')
+
+## settings for the ``open_municipio.newscache`` app
+# Number of news kept in the timeline of each feed, for each news type (see ``newscache.timeline``)
+OM_NEWS_TIMELINE_LENGTH = 100
+
+## settings for the ``open_municipio.data_import`` app
+# Backend used to extract the textual content of acts' attachments (see ``data_import.extraction``)
+OM_TEXT_EXTRACTOR = 'open_municipio.data_import.extraction.SolrTikaExtractor'
+
+## settings for the ``open_municipio.newsletter`` app
+# Outbound mail queue (see ``newsletter.outbox``): number of SMTP connections,
+# messages read from the queue at a time, max messages per second (0 for no limit),
+# attempts before a message is failed, and delay (in seconds) before the first retry
+OM_OUTBOX_CONNECTIONS = 2
+OM_OUTBOX_BATCH_SIZE = 50
+OM_OUTBOX_RATE = 10
+OM_OUTBOX_MAX_ATTEMPTS = 5
+OM_OUTBOX_RETRY_DELAY = 60
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
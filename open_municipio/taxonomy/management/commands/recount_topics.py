@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from django.core.management.base import BaseCommand
+
+from open_municipio.locations.models import reset_location_counters
+from open_municipio.taxonomy.models import reset_counters
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the counters of all tags, categories and locations from their taggings,
+    with grouped aggregate queries and bulk updates.
+
+    Counters are kept up to date by the tagging signal handlers; a recount is only
+    needed after taggings are changed bypassing them (e.g. when loading fixtures).
+    """
+    help = "Recount the taggings of all tags, categories and locations"
+
+    logger = logging.getLogger('import')
+
+    def handle(self, **options):
+        # fix logger level according to verbosity
+        verbosity = options['verbosity']
+        if verbosity == '0':
+            self.logger.setLevel(logging.ERROR)
+        elif verbosity == '1':
+            self.logger.setLevel(logging.WARNING)
+        elif verbosity == '2':
+            self.logger.setLevel(logging.INFO)
+        elif verbosity == '3':
+            self.logger.setLevel(logging.DEBUG)
+
+        reset_counters()
+        self.logger.info("tag and category counters rebuilt")
+        reset_location_counters()
+        self.logger.info("location counters rebuilt")
@@ -1,6 +1,5 @@
-from django.db import models
-from django.db.models import permalink
-from django.db.models.query import EmptyQuerySet
+from django.db import models, transaction
+from django.db.models import Count, F, permalink
 from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch.dispatcher import receiver
 from django.utils.translation import ugettext_lazy as _, ugettext
@@ -12,9 +11,12 @@ from taggit.models import TagBase, ItemBase
 from open_municipio.acts.models import Act
 
 from open_municipio.monitoring.models import MonitorizedItem
-from open_municipio.newscache.models import NewsTargetMixin
+from open_municipio.newscache.models import News, NewsTargetMixin
+from open_municipio.om_utils.db import bulk_update
 from open_municipio.om_utils.models import SlugModel
 from open_municipio.taxonomy.managers import post_tagging, post_untagging
+from open_municipio.taxonomy.news import invalidate_act_topic_news, invalidate_topic_news, \
+    is_act_content_type, topic_news
 
 
 class Tag(TagBase, MonitorizedItem):
@@ -39,17 +41,9 @@ class Tag(TagBase, MonitorizedItem):
     def related_news(self):
         """
         News related to a tag are the union of the news related to all the acts
-        tagged with this tag
+        tagged with this tag (see ``taxonomy.news``)
         """
-        news = EmptyQuerySet()
-
-        tagged_acts = Act.objects.filter(
-            id__in=set([ta['content_object_id'] for ta in self.tagged_acts.values('content_object_id')])
-        )
-
-        for a in tagged_acts:
-            news |= a.downcast().related_news
-        return news
+        return topic_news(self)
 
 
 class Category(SlugModel, NewsTargetMixin, MonitorizedItem):
@@ -95,17 +89,9 @@ class Category(SlugModel, NewsTargetMixin, MonitorizedItem):
     def related_news(self):
         """
         News related to a category are the union of the news related to all the acts
-        tagged with ther category and all the tags contained in the category
+        tagged with ther category and all the tags contained in the category (see ``taxonomy.news``)
         """
-        news = EmptyQuerySet()
-
-        # fetch all acts tagget with the category
-        tagged_acts = Act.objects.filter(
-            id__in=set([ta['content_object_id'] for ta in self.tagged_acts.values('content_object_id')])
-        )
-        for a in tagged_acts:
-            news |= a.downcast().related_news
-        return news
+        return topic_news(self)
 
 
 class TaggedAct(ItemBase):
@@ -164,13 +150,12 @@ def new_tagging(**kwargs):
     Increment counter of related location
     """
     tags = kwargs.get('tags', [])
-    for tag in tags:
-        tag.count += 1
-        tag.save()
+    # atomic increments, so that concurrent taggings are all counted
+    if tags:
+        Tag.objects.filter(pk__in=[tag.pk for tag in tags]).update(count=F('count') + 1)
 
     category = kwargs.get('category')
-    category.count += 1
-    category.save()
+    Category.objects.filter(pk=category.pk).update(count=F('count') + 1)
 
     # link category and tags
     category.tag_set.add( *tags )
@@ -185,35 +170,31 @@ def remove_tagging(**kwargs):
     Decrement counter of related location
     """
     tags = kwargs.get('tags', [])
-    for tag in tags:
-        tag.count = max(0, tag.count - 1)
-        tag.save()
+    if tags:
+        Tag.objects.filter(pk__in=[tag.pk for tag in tags], count__gt=0).update(count=F('count') - 1)
 
     category = kwargs.get('category')
-    category.count = max(0, category.count - 1)
-    category.save()
+    Category.objects.filter(pk=category.pk, count__gt=0).update(count=F('count') - 1)
 
 #    print "Removed tagging: %s[%s] ->\n" % (category,category.count)
 #    for tag in tags:
 #        print "\t%s[%s]\n" % (tag, tag.count)
 
 
+@transaction.commit_on_success
 def reset_counters():
-    for model in [Category, Tag]:
-        model.objects.update(count=0)
+    """
+    Recount the taggings of all tags, and the acts tagged with each category,
+    with one grouped query per model, and write the counters with bulk updates.
+    """
+    tag_counts = TaggedAct.objects.filter(tag__isnull=False).\
+        values_list('tag').annotate(n=Count('id')).order_by()
+    category_counts = TaggedAct.objects.\
+        values_list('category').annotate(n=Count('content_object', distinct=True)).order_by()
 
-    act_cat_cache = {}
-    for ta in TaggedAct.objects.all():
-        if ta.tag:
-            ta.tag.count += 1
-            ta.tag.save()
-        if not act_cat_cache.has_key(ta.content_object):
-            act_cat_cache[ta.content_object] = []
-        if ta.category in act_cat_cache.get(ta.content_object):
-            continue
-        ta.category.count += 1
-        ta.category.save()
-        act_cat_cache.get(ta.content_object).append(ta.category)
+    for (model, counts) in [(Tag, tag_counts), (Category, category_counts)]:
+        model.objects.update(count=0)
+        bulk_update(model, ['count'], [(n, pk) for (pk, n) in counts])
 
 def tagging_stats():
     print "------\nTAGGING STATS:\n"
@@ -222,3 +203,30 @@ def tagging_stats():
     print "\nTags: \n"
     print [("%s[%s]" % (x, x.count)) for x in Tag.objects.all()]
     print "\n-----"
+
+
+@receiver(post_save, sender=News)
+@receiver(post_delete, sender=News)
+def invalidate_news_topics_cache(**kwargs):
+    """
+    Invalidate the cached news feeds of the topics of the act a news is related to,
+    when the news changes
+    """
+    news = kwargs['instance']
+    if not kwargs.get('raw', False) and is_act_content_type(news.related_content_type_id):
+        invalidate_act_topic_news([news.related_object_pk])
+
+
+@receiver(post_save, sender=TaggedAct)
+@receiver(post_delete, sender=TaggedAct)
+def invalidate_tagging_topics_cache(**kwargs):
+    """
+    Invalidate the cached news feeds of the tag and of the category of a tagging,
+    when the tagging changes
+    """
+    tagging = kwargs['instance']
+    if not kwargs.get('raw', False):
+        topics = [('category', tagging.category_id)]
+        if tagging.tag_id is not None:
+            topics.append(('tag', tagging.tag_id))
+        invalidate_topic_news(topics)
@@ -0,0 +1,129 @@
+"""
+News feeds of topics (tags, categories and locations).
+
+The news of a topic are the news related to the acts tagged with it.
+``topic_news`` returns them as a single query, selecting the news whose
+related object is an act (of any type) among those in the topic's taggings,
+instead of OR-ing the ``related_news`` of each act.
+
+``cached_topic_news`` caches the latest news of a topic, under a version token
+of the topic (see ``om_utils.cache``). Only the feeds of the topics of an act
+are invalidated, when news related to the act are saved or deleted, or generated
+in bulk by importers (see ``acts.news``); the feed of a topic is invalidated
+when an act is tagged with it or untagged (see the signal handlers in
+``taxonomy.models`` and ``locations.models``).
+
+Topics are identified by ``(topic type, pk)`` pairs, the topic type being
+``'tag'``, ``'category'`` or ``'location'``.
+"""
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+
+from open_municipio.om_utils.cache import bump_versions, get_version
+from open_municipio.om_utils.generic import prefetch_generic
+
+
+VERSION_CACHE_KEY = 'om_topic_news_version_%(topic_type)s_%(pk)s'
+CACHE_KEY = 'om_topic_news_%(version)s_%(news_type)s_%(n)s'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def act_content_types():
+    """
+    Return the list of the content types of ``Act`` and of its subclasses.
+    """
+    from open_municipio.acts.models import Act
+
+    return [ct for ct in ContentType.objects.filter(app_label='acts')
+            if ct.model_class() and issubclass(ct.model_class(), Act)]
+
+
+def is_act_content_type(content_type_id):
+    """
+    Return ``True`` if the content type with the given id is ``Act``, or one of its subclasses.
+    """
+    from open_municipio.acts.models import Act
+
+    model = ContentType.objects.get_for_id(content_type_id).model_class()
+    return model is not None and issubclass(model, Act)
+
+
+def topic_acts(topic):
+    """
+    Return the ``values`` QuerySet of the ids of the acts tagged with ``topic``.
+    """
+    from open_municipio.locations.models import Location, TaggedActByLocation
+    from open_municipio.taxonomy.models import Category, Tag, TaggedAct
+
+    if isinstance(topic, Tag):
+        return TaggedAct.objects.filter(tag=topic).values('content_object')
+    elif isinstance(topic, Category):
+        return TaggedAct.objects.filter(category=topic).values('content_object')
+    elif isinstance(topic, Location):
+        return TaggedActByLocation.objects.filter(location=topic).values('act')
+    raise TypeError("%r is not a topic" % topic)
+
+
+def topic_news(topic):
+    """
+    Return the QuerySet of the news related to the acts tagged with ``topic``.
+    """
+    from open_municipio.newscache.models import News
+
+    return News.objects.filter(
+        related_content_type__in=act_content_types(),
+        related_object_pk__in=topic_acts(topic)
+    )
+
+
+def cached_topic_news(topic, news_type=None, n=15):
+    """
+    Return the list of the latest ``n`` news (of the given type, if any) of ``topic``, cached.
+    """
+    version = get_version(VERSION_CACHE_KEY % {'topic_type': topic.__class__.__name__.lower(), 'pk': topic.pk})
+    key = CACHE_KEY % {'version': version, 'news_type': news_type or 'all', 'n': n}
+    news = cache.get(key)
+    if news is None:
+        from open_municipio.newscache.models import newest_first
+
+        news = topic_news(topic)
+        if news_type:
+            news = news.filter(news_type=news_type)
+        news = prefetch_generic(newest_first(news, n), 'related_object')
+        cache.set(key, news, CACHE_TIMEOUT)
+    return news
+
+
+def act_topics(act_ids):
+    """
+    Return the set of the topics the acts with the given ids are tagged with.
+    """
+    from open_municipio.locations.models import TaggedActByLocation
+    from open_municipio.taxonomy.models import TaggedAct
+
+    act_ids = list(act_ids)
+    topics = set()
+    for start in range(0, len(act_ids), 500):
+        ids = act_ids[start:start + 500]
+        for (tag_id, category_id) in TaggedAct.objects.filter(content_object__in=ids).\
+                values_list('tag', 'category').distinct():
+            if tag_id is not None:
+                topics.add(('tag', tag_id))
+            topics.add(('category', category_id))
+        topics.update(('location', location_id) for location_id in TaggedActByLocation.objects.
+                      filter(act__in=ids).values_list('location', flat=True).distinct())
+    return topics
+
+
+def invalidate_topic_news(topics):
+    """
+    Invalidate the cached feeds of the given topics.
+    """
+    bump_versions(VERSION_CACHE_KEY % {'topic_type': topic_type, 'pk': pk} for (topic_type, pk) in topics)
+
+
+def invalidate_act_topic_news(act_ids):
+    """
+    Invalidate the cached feeds of the topics of the acts with the given ids.
+    """
+    invalidate_topic_news(act_topics(act_ids))
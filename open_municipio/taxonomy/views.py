@@ -3,9 +3,11 @@ from django.db.models import Count
 from django.views.generic import DetailView, ListView
 from open_municipio.acts.models import Deliberation, Interpellation, Interrogation, Calendar, Motion, CGDeliberation
 from open_municipio.locations.models import Location
-from open_municipio.monitoring.models import Monitoring
+from open_municipio.monitoring.leaderboards import top_monitored
+from open_municipio.monitoring.models import prefetch_monitoring_counters
 
 from open_municipio.taxonomy.models import Tag, Category, TaggedAct
+from open_municipio.taxonomy.news import cached_topic_news
 
 
 class TopicListView(ListView):
@@ -24,26 +26,10 @@ class TopicListView(ListView):
         import random
         random.shuffle(context['tags_to_cloud'], lambda : 0.5)
 
-        # collect content type ids
-        type_id_list = []
-        if context['categories']:
-            type_id_list.append(context['categories'][0].content_type_id)
-        if context['tags']:
-            type_id_list.append(context['tags'][0].content_type_id)
-        if context['locations']:
-            type_id_list.append(context['locations'][0].content_type_id)
-
-        if type_id_list:
-            # create rank of monitorized items
-            context['top_monitorized_tags'] = [
-                ContentType.objects.get_for_id(m['content_type'])
-                    .get_object_for_this_type(pk=m['object_pk'])
-                for m in Monitoring.objects
-                    .filter(content_type__in=type_id_list)
-                    .values('object_pk', 'content_type')
-                    .annotate(n_monitoring=Count('object_pk'))
-                    .order_by('-n_monitoring')[:10]
-            ]
+        # rank of monitorized items
+        context['top_monitorized_tags'] = prefetch_monitoring_counters(
+            [row['object'] for row in top_monitored('topics', 10)]
+        )
         return context
     
     
@@ -77,6 +63,9 @@ class TopicDetailView(DetailView):
         context['n_calendars'] = Calendar.objects.filter(pk__in=ta_ids).count()
         context['n_interrogations'] = Interrogation.objects.filter(pk__in=ta_ids).count()
         context['n_interpellations'] = Interpellation.objects.filter(pk__in=ta_ids).count()
+
+        # latest news of the acts tagged with the topic
+        context['topic_news'] = cached_topic_news(topic)
         return context
 
     def take_subtopics(self):
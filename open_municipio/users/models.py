@@ -15,6 +15,7 @@ from model_utils import Choices
 from open_municipio.locations.models import Location
 from open_municipio.monitoring.models import Monitoring
 from open_municipio.newscache.models import NewsTargetMixin
+from open_municipio.om_utils.generic import prefetch_generic
 from open_municipio.people.models import Person
 
 
@@ -105,7 +106,8 @@ class UserProfile(NewsTargetMixin, models.Model):
         """
         Returns objects monitored by this user (as a list).
         """
-        return [o.content_object for o in Monitoring.objects.filter(user=self.user)]
+        monitorings = prefetch_generic(Monitoring.objects.filter(user=self.user), 'content_object')
+        return [o.content_object for o in monitorings]
 
     def is_editor(self):
         try:
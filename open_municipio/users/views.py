@@ -7,7 +7,9 @@ from django.views.generic import DetailView
 from django.views.generic.list import ListView
 from open_municipio.acts.models import Deliberation, Motion, Interpellation, Amendment, Agenda, Interrogation
 from open_municipio.locations.models import Location
-from open_municipio.monitoring.models import Monitoring
+from open_municipio.monitoring.leaderboards import top_monitored
+from open_municipio.monitoring.models import Monitoring, prefetch_monitoring_counters
+from open_municipio.om_utils.generic import resolve_generic_rows
 from open_municipio.people.models import Person, GroupCharge
 from open_municipio.taxonomy.models import Category, Tag
 from open_municipio.users.models import UserProfile
@@ -76,10 +78,13 @@ class UserProfileListView(ListView):
 
         context.update({
             # TODO if a person not have a institution_charge...?
-            'top_monitored_politicians': extract_top_monitored_objects(Person,qnt=3),
-            'top_monitored_topics': extract_top_monitored_objects(Tag,Category,Location,qnt=5),
-            'top_monitored_acts': extract_top_monitored_objects(Deliberation, Motion, Interpellation, Agenda, Interrogation,qnt=5),
+            'top_monitored_politicians': top_monitored('politicians', 3),
+            'top_monitored_topics': top_monitored('topics', 5),
+            'top_monitored_acts': top_monitored('acts', 5),
         })
+        # read the monitoring counts of all the ranked objects at once
+        prefetch_monitoring_counters([row['object'] for key in ('top_monitored_politicians', 'top_monitored_topics',
+                                                                'top_monitored_acts') for row in context[key]])
         return context
 
 
@@ -99,17 +104,14 @@ def extract_top_monitored_objects(*models, **kwargs):
     # what TOP means
     limit = kwargs.get('qnt', 10)
 
-    monitored_objects = []
-    for el in Monitoring.objects.\
+    # objects are fetched in bulk, one query per content type
+    return resolve_generic_rows(
+        Monitoring.objects.\
             filter(**query).\
             values('content_type', 'object_pk').distinct().\
             annotate(n_monitoring=Count('object_pk')).\
-            order_by('-n_monitoring')[:limit]:
-        ct = ContentType.objects.get(pk=el['content_type'])
-        object = ct.get_object_for_this_type(pk=el['object_pk'])
-        monitored_objects.append({'content_type': ct, 'object': object, 'n_monitoring': el['n_monitoring']})
-
-    return monitored_objects
+            order_by('-n_monitoring')[:limit]
+    )
 
 def calculate_top_monitorings(*models, **kwargs):
     if len(models):
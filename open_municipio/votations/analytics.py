@@ -0,0 +1,198 @@
+"""
+Cohesion and loyalty analytics of the council groups.
+
+Metrics are computed for every group, by year and overall, in a single
+vectorised pass over the vote matrix (see ``votations.matrix``):
+
+* ``rice`` - the Rice cohesion index, i.e. the average, over the votations,
+  of ``|yes - no| / (yes + no)`` of the members of the group
+* ``majority_agreement`` - the share of votations where the majority of the group
+  voted as the majority of the council
+* ``agreement`` - for each other group, the share of votations where the
+  majorities of the two groups voted the same way
+
+As in ``GroupVote``, the majority is the yes, no or abstained vote of
+more than each of the other two; votations without a clear majority are skipped.
+
+Metrics are computed once per version of the vote matrix, by the process
+saving it (an importer, or the ``build_vote_matrix`` command), and stored in
+the version directory of the matrix, before it becomes the current one (see
+``store_group_analytics``); web processes load them from there, once per
+version (see ``get_group_analytics``).
+"""
+import cPickle as pickle
+from datetime import date
+import logging
+import os
+
+import numpy as np
+
+from open_municipio.people.models import Institution
+from open_municipio.people.timeline import membership_timeline
+from open_municipio.votations.matrix import VOTE_CODES, VOTE_MASK, get_vote_matrix
+from open_municipio.votations.models import ChargeVote, Votation
+
+
+# indexes of the choices in the tallies
+CHOICES = (
+    VOTE_CODES[ChargeVote.VOTES.yes],
+    VOTE_CODES[ChargeVote.VOTES.no],
+    VOTE_CODES[ChargeVote.VOTES.abstained],
+)
+YES, NO, ABSTAINED = range(3)
+
+# name of the file storing the metrics, in the version directory of the vote matrix
+ANALYTICS_FILE = 'group_analytics.pickle'
+
+logger = logging.getLogger('import')
+
+# the metrics loaded in this process, as a ``(matrix version, metrics)`` pair
+_group_analytics = (None, None)
+
+
+def _majority(tally):
+    """
+    Return the index of the majority choice along the last axis of ``tally``,
+    or -1 where there is no clear majority.
+    """
+    top = tally.max(axis=-1)
+    n_top = (tally == top[..., np.newaxis]).sum(axis=-1)
+    return np.where((n_top == 1) & (top > 0), tally.argmax(axis=-1), -1)
+
+
+def _ratio(num, den):
+    """
+    Element-wise ``num / den``, ``None`` where ``den`` is 0, as a list of floats.
+    """
+    return [float(n) / d if d else None for (n, d) in zip(num.ravel(), den.ravel())]
+
+
+def compute_group_analytics(matrix):
+    """
+    Compute the metrics for all the groups, from the council votations in ``matrix``.
+    """
+    council_ids = Votation.objects.filter(
+        sitting__institution__institution_type=Institution.COUNCIL
+    ).values_list('id', flat=True)
+    columns = np.nonzero(np.in1d(matrix.votation_ids, np.array(list(council_ids), dtype=np.int32)))[0]
+    codes = matrix.votes[:, columns] & VOTE_MASK
+    dates = matrix.dates[columns]
+    n_votations = len(columns)
+
+    # the group of each charge at each sitting date
+    unique_dates, date_index = np.unique(dates, return_inverse=True)
+    group_ids = []
+    group_index = {}
+    charge_groups = np.empty((len(matrix.charge_ids), len(unique_dates)), dtype=np.int32)
+    charge_groups.fill(-1)
+    for i, charge_id in enumerate(matrix.charge_ids):
+        for k, d in enumerate(unique_dates):
+            g = membership_timeline.group_of(int(charge_id), date.fromordinal(int(d)))
+            if g is not None:
+                if g.pk not in group_index:
+                    group_index[g.pk] = len(group_ids)
+                    group_ids.append(g.pk)
+                charge_groups[i, k] = group_index[g.pk]
+    groups = charge_groups[:, date_index]
+    n_groups = len(group_ids)
+    if not n_groups or not n_votations:
+        return {}
+
+    # map yes, no, abstained codes into tally indexes
+    choice = np.empty(VOTE_MASK + 1, dtype=np.int32)
+    choice.fill(-1)
+    for (i, code) in enumerate(CHOICES):
+        choice[code] = i
+    choices = choice[codes]
+
+    # tallies of the groups (n_groups x n_votations x 3) and of the council (n_votations x 3)
+    rows, cols = np.nonzero((choices >= 0) & (groups >= 0))
+    tally = np.bincount(
+        (groups[rows, cols] * n_votations + cols) * 3 + choices[rows, cols],
+        minlength=n_groups * n_votations * 3
+    ).reshape(n_groups, n_votations, 3)
+    rows, cols = np.nonzero(choices >= 0)
+    council_tally = np.bincount(
+        cols * 3 + choices[rows, cols], minlength=n_votations * 3
+    ).reshape(n_votations, 3)
+
+    group_majority = _majority(tally)
+    council_majority = _majority(council_tally)
+    yes_no = tally[:, :, YES] + tally[:, :, NO]
+    rice = np.abs(tally[:, :, YES] - tally[:, :, NO]) / np.maximum(yes_no, 1).astype(np.float64)
+
+    def period_metrics(period):
+        """
+        Metrics of all the groups, for the votations selected by the ``period`` mask.
+        """
+        gm = group_majority[:, period]
+        cm = council_majority[period]
+        voted = yes_no[:, period] > 0
+        has_majority = gm >= 0
+        with_council = has_majority & (cm >= 0)
+        both = has_majority[:, np.newaxis, :] & has_majority[np.newaxis, :, :]
+        agree = both & (gm[:, np.newaxis, :] == gm[np.newaxis, :, :])
+
+        rices = _ratio((rice[:, period] * voted).sum(axis=1), voted.sum(axis=1))
+        majority_agreements = _ratio((with_council & (gm == cm)).sum(axis=1), with_council.sum(axis=1))
+        agreements = np.array(_ratio(agree.sum(axis=-1), both.sum(axis=-1)), dtype=object).\
+            reshape(n_groups, n_groups)
+        return [{
+            'n_votations': int(voted[g].sum()),
+            'rice': rices[g],
+            'majority_agreement': majority_agreements[g],
+            'agreement': dict(
+                (group_ids[h], agreements[g, h]) for h in range(n_groups) if h != g
+            ),
+        } for g in range(n_groups)]
+
+    years = np.array([date.fromordinal(int(d)).year for d in unique_dates], dtype=np.int32)[date_index]
+    analytics = dict((pk, {'years': [], 'overall': None}) for pk in group_ids)
+    for year in np.unique(years):
+        for (g, metrics) in enumerate(period_metrics(years == year)):
+            if metrics['n_votations']:
+                metrics['year'] = int(year)
+                analytics[group_ids[g]]['years'].append(metrics)
+    for (g, metrics) in enumerate(period_metrics(np.ones(n_votations, dtype=bool))):
+        analytics[group_ids[g]]['overall'] = metrics
+    return analytics
+
+
+def store_group_analytics(matrix):
+    """
+    Compute the metrics from ``matrix``, and store them in its version directory.
+
+    Meant to be passed as the ``before_publish`` hook of ``VoteMatrix.save``,
+    so that the metrics of a version are stored before it becomes the current one.
+    """
+    analytics = compute_group_analytics(matrix)
+    analytics_path = os.path.join(matrix.version_path, ANALYTICS_FILE)
+    tmp_path = "%s.tmp" % analytics_path
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(analytics, f, pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_path, analytics_path)
+    return analytics
+
+
+def get_group_analytics():
+    """
+    Return the metrics of all groups, as a dictionary keyed on the groups' ids,
+    or ``None`` if the vote matrix has never been built.
+
+    Metrics are loaded once for each version of the vote matrix; they are computed
+    here only for versions saved without them.
+    """
+    global _group_analytics
+    matrix = get_vote_matrix()
+    if matrix is None:
+        return None
+    version, analytics = _group_analytics
+    if version != matrix.version:
+        try:
+            with open(os.path.join(matrix.version_path, ANALYTICS_FILE), 'rb') as f:
+                analytics = pickle.load(f)
+        except IOError:
+            logger.warning("no group analytics stored for vote matrix %s, computing them" % matrix.version)
+            analytics = compute_group_analytics(matrix)
+        _group_analytics = (matrix.version, analytics)
+    return analytics
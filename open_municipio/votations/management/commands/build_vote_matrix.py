@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from open_municipio.votations.analytics import store_group_analytics
+from open_municipio.votations.matrix import VoteMatrix, update_vote_matrix
+from open_municipio.votations.similarity import update_charge_similarities
+
+
+class Command(BaseCommand):
+    """
+    Build the charges x votations matrix of votes (see ``votations.matrix``)
+    and store it under ``settings.OM_VOTE_MATRIX_DIR``.
+
+    With ``--incremental``, only votations not yet in the stored matrix are added.
+    Group analytics (see ``votations.analytics``) are stored along with the matrix,
+    and charge similarities (see ``votations.similarity``) are then precomputed.
+    """
+    help = "Build (or update) the vote matrix"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--incremental',
+                    action='store_true',
+                    dest='incremental',
+                    default=False,
+                    help='Only add new votations to the stored matrix'),
+        )
+
+    logger = logging.getLogger('import')
+
+    def handle(self, **options):
+        # fix logger level according to verbosity
+        verbosity = options['verbosity']
+        if verbosity == '0':
+            self.logger.setLevel(logging.ERROR)
+        elif verbosity == '1':
+            self.logger.setLevel(logging.WARNING)
+        elif verbosity == '2':
+            self.logger.setLevel(logging.INFO)
+        elif verbosity == '3':
+            self.logger.setLevel(logging.DEBUG)
+
+        matrix = None
+        if options['incremental']:
+            matrix = update_vote_matrix(before_publish=store_group_analytics)
+            if matrix is None:
+                self.logger.warning("No vote matrix found, building it from scratch")
+        if matrix is None:
+            matrix = VoteMatrix.build()
+            matrix.save(before_publish=store_group_analytics)
+
+        # precompute charge similarities for the new matrix
+        update_charge_similarities(matrix=matrix)
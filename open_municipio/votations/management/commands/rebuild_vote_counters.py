@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import datetime
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from open_municipio.people.models import Sitting
+from open_municipio.votations.models import rebuild_vote_counters
+
+
+class Command(BaseCommand):
+    """
+    Recompute the cached counters related to votations, with a few aggregate queries:
+    votations' absents and rebels, group votes, charges' presences and rebellions.
+
+    Counters can be rebuilt for all votations (default), for the votations
+    of a single sitting, or for those in a dates range.
+    """
+    help = "Rebuild votations, group votes and charges counters"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--sitting',
+                    dest='sitting',
+                    default=None,
+                    help='Only rebuild counters for the votations of the sitting with this id'),
+        make_option('--from-date',
+                    dest='from_date',
+                    default=None,
+                    help='Only rebuild counters for votations from this date on (YYYY-MM-DD)'),
+        make_option('--to-date',
+                    dest='to_date',
+                    default=None,
+                    help='Only rebuild counters for votations up to this date (YYYY-MM-DD)'),
+        )
+
+    logger = logging.getLogger('import')
+
+    def handle(self, **options):
+        # fix logger level according to verbosity
+        verbosity = options['verbosity']
+        if verbosity == '0':
+            self.logger.setLevel(logging.ERROR)
+        elif verbosity == '1':
+            self.logger.setLevel(logging.WARNING)
+        elif verbosity == '2':
+            self.logger.setLevel(logging.INFO)
+        elif verbosity == '3':
+            self.logger.setLevel(logging.DEBUG)
+
+        sitting = None
+        if options['sitting']:
+            try:
+                sitting = Sitting.objects.get(pk=options['sitting'])
+            except Sitting.DoesNotExist:
+                raise CommandError("Sitting %s does not exist" % options['sitting'])
+
+        dates = {}
+        for d in ('from_date', 'to_date'):
+            if options[d]:
+                try:
+                    dates[d] = datetime.datetime.strptime(options[d], "%Y-%m-%d").date()
+                except ValueError:
+                    raise CommandError("Wrong date format: %s (use YYYY-MM-DD)" % options[d])
+
+        self.logger.info("Rebuilding vote counters")
+        rebuild_vote_counters(sitting=sitting, **dates)
+        self.logger.info("Vote counters rebuilt")
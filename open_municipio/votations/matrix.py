@@ -0,0 +1,300 @@
+"""
+A compact, in-memory representation of all the votes expressed in the institutions.
+
+The ``VoteMatrix`` is a charges x votations ``int8`` NumPy array: each cell
+contains the code of the vote expressed by a charge in a votation (see ``VOTE_CODES``),
+possibly or-ed with the ``REBEL`` flag; ``0`` means the charge did not take part
+in the votation. Rows are indexed by the ``charge_ids`` array, columns by the
+``votation_ids`` and ``dates`` arrays (dates are stored as ordinals), and are sorted
+by date.
+
+Presence, absence and rebellion counts are then computed as vectorised
+reductions over rows and columns, instead of SQL queries.
+
+The matrix is stored under ``settings.OM_VOTE_MATRIX_DIR`` as ``.npy`` files,
+that web processes memory-map (see ``get_vote_matrix``). It is built by the
+``build_vote_matrix`` management command, and updated incrementally
+whenever sittings are imported.
+"""
+from datetime import date
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+
+from django.conf import settings
+from django.db.models import Q
+
+from open_municipio.votations.models import ChargeVote, Votation
+
+
+# vote codes; 0 is reserved for *no vote*
+VOTE_CODES = {
+    ChargeVote.VOTES.yes: 1,
+    ChargeVote.VOTES.no: 2,
+    ChargeVote.VOTES.abstained: 3,
+    ChargeVote.VOTES.canceled: 4,
+    ChargeVote.VOTES.pres: 5,
+    ChargeVote.VOTES.secret: 6,
+    ChargeVote.VOTES.absent: 7,
+    ChargeVote.VOTES.untracked: 8,
+}
+NO_VOTE = 0
+REBEL = 16
+VOTE_MASK = 15
+
+ABSENT = VOTE_CODES[ChargeVote.VOTES.absent]
+
+
+class VoteMatrix(object):
+    """
+    The charges x votations matrix of votes, with its indexes.
+    """
+    # name of the file pointing to the current version of the matrix
+    CURRENT = 'CURRENT'
+
+    logger = logging.getLogger('import')
+
+    def __init__(self, votes, charge_ids, votation_ids, dates, version=None, path=None):
+        self.votes = votes
+        self.charge_ids = charge_ids
+        self.votation_ids = votation_ids
+        self.dates = dates
+        self.version = version
+        self.path = path
+        self._rows = dict((int(pk), i) for (i, pk) in enumerate(charge_ids))
+
+    #
+    # build and storage
+    #
+
+    @classmethod
+    def _fetch(cls, votations):
+        """
+        Read votes and indexes of the given votations from the DB.
+
+        Return the tuple ``(votes, charge_ids, votation_ids, dates)``.
+        """
+        columns = list(votations.order_by('sitting__date', 'id').values_list('id', 'sitting__date'))
+        votation_ids = np.array([pk for (pk, d) in columns], dtype=np.int32)
+        dates = np.array([d.toordinal() for (pk, d) in columns], dtype=np.int32)
+
+        rows = list(ChargeVote.objects.filter(votation__in=votations).
+                    values_list('charge', 'votation', 'vote', 'is_rebel').order_by())
+        charge_ids = np.unique(np.array([r[0] for r in rows], dtype=np.int32))
+
+        votes = np.zeros((len(charge_ids), len(votation_ids)), dtype=np.int8)
+        if rows:
+            columns_order = np.argsort(votation_ids)
+            i = np.searchsorted(charge_ids, np.array([r[0] for r in rows], dtype=np.int32))
+            j = columns_order[np.searchsorted(votation_ids[columns_order],
+                                              np.array([r[1] for r in rows], dtype=np.int32))]
+            votes[i, j] = np.array(
+                [VOTE_CODES.get(vote, NO_VOTE) | (REBEL if is_rebel else 0) for (c, v, vote, is_rebel) in rows],
+                dtype=np.int8
+            )
+        return votes, charge_ids, votation_ids, dates
+
+    @classmethod
+    def build(cls):
+        """
+        Build the whole matrix from the DB.
+        """
+        return cls(*cls._fetch(Votation.objects.all()))
+
+    def update(self, sittings=None):
+        """
+        Return a new matrix, with the votations not yet in this matrix
+        and the votations of the given sittings (re-)read from the DB.
+        """
+        new_ids = set(Votation.objects.values_list('id', flat=True)) - set(int(pk) for pk in self.votation_ids)
+        q = Q(id__in=list(new_ids))
+        if sittings:
+            q |= Q(sitting__in=sittings)
+        votes, charge_ids, votation_ids, dates = self._fetch(Votation.objects.filter(q))
+
+        # drop re-read columns from the current matrix
+        keep = ~np.in1d(self.votation_ids, votation_ids)
+
+        # align rows on the union of the charges
+        all_charge_ids = np.union1d(self.charge_ids, charge_ids).astype(np.int32)
+        merged = np.zeros((len(all_charge_ids), keep.sum() + len(votation_ids)), dtype=np.int8)
+        merged[np.searchsorted(all_charge_ids, self.charge_ids), :keep.sum()] = self.votes[:, keep]
+        merged[np.searchsorted(all_charge_ids, charge_ids), keep.sum():] = votes
+
+        all_votation_ids = np.concatenate((self.votation_ids[keep], votation_ids))
+        all_dates = np.concatenate((self.dates[keep], dates))
+
+        # sort columns by date and votation id
+        order = np.lexsort((all_votation_ids, all_dates))
+        return VoteMatrix(merged[:, order], all_charge_ids,
+                          all_votation_ids[order], all_dates[order])
+
+    @property
+    def version_path(self):
+        """
+        The directory of the stored version of the matrix.
+        """
+        return os.path.join(self.path, self.version)
+
+    def save(self, path=None, before_publish=None):
+        """
+        Save the matrix in a new version directory, then atomically
+        point the ``CURRENT`` file to it. Older versions are removed,
+        but for the previous one, that could still be in use.
+
+        ``before_publish``, if given, is called with the matrix once its
+        version directory is written, before it becomes the current one,
+        to store data derived from the matrix along with it.
+        """
+        path = path or settings.OM_VOTE_MATRIX_DIR
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        version = "%d-%d" % (int(time.time() * 1000), os.getpid())
+        version_path = os.path.join(path, version)
+        os.mkdir(version_path)
+        for name in ('votes', 'charge_ids', 'votation_ids', 'dates'):
+            np.save(os.path.join(version_path, "%s.npy" % name), getattr(self, name))
+        self.version = version
+        self.path = path
+        if before_publish is not None:
+            before_publish(self)
+
+        previous = _read_current(path)
+        tmp_current = os.path.join(path, "%s.%s" % (self.CURRENT, version))
+        with open(tmp_current, 'w') as f:
+            f.write(version)
+        os.rename(tmp_current, os.path.join(path, self.CURRENT))
+
+        for name in os.listdir(path):
+            if name not in (version, previous, self.CURRENT) and \
+               os.path.isdir(os.path.join(path, name)):
+                shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+        self.logger.info("vote matrix %s saved (%d charges x %d votations)" %
+                         (version, len(self.charge_ids), len(self.votation_ids)))
+
+    @classmethod
+    def load(cls, path=None, mmap_mode='r'):
+        """
+        Load the current version of the matrix (memory-mapped, by default),
+        or return ``None`` if it has never been built.
+        """
+        path = path or settings.OM_VOTE_MATRIX_DIR
+        version = _read_current(path)
+        if version is None:
+            return None
+        version_path = os.path.join(path, version)
+        return cls(
+            np.load(os.path.join(version_path, 'votes.npy'), mmap_mode=mmap_mode),
+            np.load(os.path.join(version_path, 'charge_ids.npy')),
+            np.load(os.path.join(version_path, 'votation_ids.npy')),
+            np.load(os.path.join(version_path, 'dates.npy')),
+            version=version, path=path
+        )
+
+    #
+    # reductions
+    #
+
+    def _columns(self, from_date=None, to_date=None):
+        """
+        The slice of the columns of the votations within the given dates.
+        """
+        start = 0 if from_date is None else np.searchsorted(self.dates, from_date.toordinal(), 'left')
+        end = len(self.dates) if to_date is None else np.searchsorted(self.dates, to_date.toordinal(), 'right')
+        return slice(start, end)
+
+    def _rows_of(self, charge_ids):
+        if charge_ids is None:
+            return slice(None)
+        return [self._rows[pk] for pk in charge_ids if pk in self._rows]
+
+    def counts(self, charge_ids=None, from_date=None, to_date=None):
+        """
+        Return the arrays of the number of presences, absences and rebellions
+        of the given charges (all charges, by default) in the given dates range.
+
+        Charges not in the matrix are skipped; as in ``InstitutionCharge``
+        counters, any vote but the absence counts as a presence.
+        """
+        votes = self.votes[self._rows_of(charge_ids), self._columns(from_date, to_date)]
+        codes = votes & VOTE_MASK
+        n_absent = (codes == ABSENT).sum(axis=1)
+        n_present = ((codes != NO_VOTE) & (codes != ABSENT)).sum(axis=1)
+        n_rebel = ((votes & REBEL) != 0).sum(axis=1)
+        return n_present, n_absent, n_rebel
+
+    def presence_rates(self, charge_ids=None, from_date=None, to_date=None):
+        """
+        Return the arrays of presence and absence rates of the given charges,
+        over the votations they took part in; charges who never took part
+        in a votation get a rate of 0.
+        """
+        n_present, n_absent, n_rebel = self.counts(charge_ids, from_date, to_date)
+        n_total = np.maximum(n_present + n_absent, 1).astype(np.float64)
+        return n_present / n_total, n_absent / n_total
+
+    def counts_by_year(self, charge_ids=None):
+        """
+        Return a dictionary mapping each year to the ``counts`` of that year.
+        """
+        if not len(self.dates):
+            return {}
+        first_year = date.fromordinal(int(self.dates[0])).year
+        last_year = date.fromordinal(int(self.dates[-1])).year
+        return dict(
+            (year, self.counts(charge_ids, date(year, 1, 1), date(year, 12, 31)))
+            for year in range(first_year, last_year + 1)
+        )
+
+
+def _read_current(path):
+    try:
+        with open(os.path.join(path, VoteMatrix.CURRENT)) as f:
+            return f.read().strip() or None
+    except IOError:
+        return None
+
+
+# the matrix loaded in this process
+_vote_matrix = None
+_vote_matrix_checked_at = 0
+
+# how often (in seconds) the current version of the matrix is checked
+VERSION_CHECK_INTERVAL = 5
+
+
+def get_vote_matrix():
+    """
+    Return the current ``VoteMatrix``, memory-mapped in this process,
+    or ``None`` if it has never been built.
+    """
+    global _vote_matrix, _vote_matrix_checked_at
+    now = time.time()
+    if _vote_matrix is None or now - _vote_matrix_checked_at > VERSION_CHECK_INTERVAL:
+        _vote_matrix_checked_at = now
+        version = _read_current(settings.OM_VOTE_MATRIX_DIR)
+        if version is None:
+            _vote_matrix = None
+        elif _vote_matrix is None or _vote_matrix.version != version:
+            _vote_matrix = VoteMatrix.load()
+    return _vote_matrix
+
+
+def update_vote_matrix(sittings=None, before_publish=None):
+    """
+    Incrementally update the stored matrix, if it has ever been built,
+    with new votations and with the votations of the given sittings.
+
+    Return the new matrix (see ``VoteMatrix.save`` for ``before_publish``).
+    """
+    matrix = VoteMatrix.load(mmap_mode=None)
+    if matrix is None:
+        return None
+    matrix = matrix.update(sittings)
+    matrix.save(before_publish=before_publish)
+    return matrix
@@ -1,12 +1,23 @@
-from django.db import models
+from datetime import datetime
+import logging
+
+from django.core.exceptions import MultipleObjectsReturned
+from django.db import models, transaction
+from django.db.models import Count
+from django.db.models.query import QuerySet
 from django.utils.translation import ugettext_lazy as _
 
 from model_utils import Choices
 from model_utils.models import TimeStampedModel
 from model_utils.managers import QueryManager
 
-from open_municipio.people.models import Group, InstitutionCharge, Sitting, Institution
+from open_municipio.people.models import Group, GroupCharge, InstitutionCharge, Sitting, Institution
+from open_municipio.people.timeline import membership_timeline
 from open_municipio.acts.models import Act
+from open_municipio.om_utils.db import bulk_insert, bulk_update
+
+
+logger = logging.getLogger('import')
 
 
 class Votation(models.Model):
@@ -105,8 +116,7 @@ class Votation(models.Model):
         """
         update presence caches for each voting charge of this votation
         """
-        for vc in self.charge_votes:
-            vc.charge.update_presence_cache()
+        update_charge_counters(InstitutionCharge.objects.filter(chargevote__votation=self))
 
 
 class GroupVote(TimeStampedModel):
@@ -140,6 +150,52 @@ class GroupVote(TimeStampedModel):
     def __unicode__(self):
         return u"%s - %s - %s" % (self.votation, self.group.acronym, self.get_vote_display())
 
+    def add_charge_vote(self, vote, n=1):
+        """
+        Update the cached counters of the group vote with ``n`` votes
+        expressed by members of the group
+        """
+        if vote == ChargeVote.VOTES.yes:
+            self.n_yes += n
+            self.n_presents += n
+        elif vote == ChargeVote.VOTES.no:
+            self.n_no += n
+            self.n_presents += n
+        elif vote == ChargeVote.VOTES.abstained:
+            self.n_abst += n
+            self.n_presents += n
+        elif vote in (ChargeVote.VOTES.secret, ChargeVote.VOTES.canceled, ChargeVote.VOTES.pres):
+            self.n_presents += n
+        elif vote == ChargeVote.VOTES.absent:
+            self.n_absents += n
+
+    def compute_vote(self):
+        """
+        The vote of the group is the vote of the majority of its members;
+        whenever there is no clear majority, the vote is not computable.
+
+        The number of rebels is computed accordingly.
+        """
+        if self.n_yes > self.n_no and self.n_yes > self.n_abst:
+            self.vote = GroupVote.VOTES.yes
+            self.n_rebels = self.n_no + self.n_abst
+        elif self.n_no > self.n_yes and self.n_no > self.n_abst:
+            self.vote = GroupVote.VOTES.no
+            self.n_rebels = self.n_abst + self.n_yes
+        elif self.n_abst > self.n_yes and self.n_abst > self.n_no:
+            self.vote = GroupVote.VOTES.abstained
+            self.n_rebels = self.n_no + self.n_yes
+        else:
+            self.vote = GroupVote.VOTES.noncomputable
+
+    def is_rebel_vote(self, vote):
+        """
+        A vote is rebel if it is a yes, no or abstained vote,
+        different from a computable vote of the group
+        """
+        return vote in (ChargeVote.VOTES.yes, ChargeVote.VOTES.no, ChargeVote.VOTES.abstained) and \
+            self.vote != GroupVote.VOTES.noncomputable and self.vote != vote
+
 
 class ChargeVote(TimeStampedModel):
     """
@@ -174,7 +230,11 @@ class ChargeVote(TimeStampedModel):
 
     @property
     def charge_group_at_vote_date(self):
-        return self.original_charge.person.get_current_group(moment=self.votation.sitting.date.strftime('%Y-%m-%d'))
+        """
+        The group of the (original) charge at the date of the votation,
+        looked up in the in-memory membership timeline
+        """
+        return membership_timeline.group_of(self.charge_id, self.votation.sitting.date)
     
     class Meta:
         db_table = u'votations_charge_vote'    
@@ -182,4 +242,183 @@ class ChargeVote(TimeStampedModel):
         verbose_name_plural = _('charge votes')
 
     def __unicode__(self):
-        return u"%s - %s - %s" % (self.votation, self.original_charge.person, self.get_vote_display())
\ No newline at end of file
+        return u"%s - %s - %s" % (self.votation, self.original_charge.person, self.get_vote_display())
+
+
+class ChargeSimilarity(models.Model):
+    """
+    One of the top-k charges voting most similarly to a given charge,
+    i.e. with the highest agreement rate over the votations where both were present.
+
+    Records are computed from the vote matrix (see ``votations.similarity``).
+    """
+    charge = models.ForeignKey(InstitutionCharge, related_name='similarity_set')
+    similar_charge = models.ForeignKey(InstitutionCharge, related_name='+')
+    rank = models.IntegerField()
+    agreement = models.FloatField(help_text=_("Share of common votations with the same vote"))
+    n_votations = models.IntegerField(help_text=_("Number of votations where both charges were present"))
+
+    class Meta:
+        db_table = u'votations_charge_similarity'
+        verbose_name = _('charge similarity')
+        verbose_name_plural = _('charge similarities')
+        ordering = ('charge', 'rank')
+
+    def __unicode__(self):
+        return u"%s - %s (%.2f)" % (self.charge, self.similar_charge, self.agreement)
+
+
+
+#
+# Counters
+#
+
+def _filter_votations(sitting=None, from_date=None, to_date=None):
+    votations = Votation.objects.all()
+    if sitting is not None:
+        votations = votations.filter(sitting=sitting)
+    if from_date is not None:
+        votations = votations.filter(sitting__date__gte=from_date)
+    if to_date is not None:
+        votations = votations.filter(sitting__date__lte=to_date)
+    return votations
+
+
+def update_votation_counters(votations):
+    """
+    Recompute ``n_absents`` and ``n_rebels`` of the given votations
+    (a ``Votation`` queryset), with a single aggregate query
+    """
+    counters = dict((pk, [0, 0]) for pk in votations.values_list('id', flat=True))
+    for (pk, vote, is_rebel, n) in ChargeVote.objects.filter(votation__in=votations).\
+        values_list('votation', 'vote', 'is_rebel').annotate(n=Count('id')).order_by():
+        if vote == ChargeVote.VOTES.absent:
+            counters[pk][0] += n
+        if is_rebel:
+            counters[pk][1] += n
+    bulk_update(Votation, ('n_absents', 'n_rebels'),
+                [tuple(n) + (pk, ) for (pk, n) in counters.items()])
+
+
+def update_group_vote_counters(sitting=None, from_date=None, to_date=None):
+    """
+    Recompute the ``GroupVote`` records of the votations in the given sitting or
+    dates range, and the ``is_rebel`` flags of their charge votes, with a single
+    pass over the charge votes.
+
+    Each charge vote is assigned to the group the (original) charge belonged to
+    at the date of the sitting, looked up in the membership timeline, as
+    ``ChargeVote.charge_group_at_vote_date`` does; group votes are then updated
+    or created, and charge votes flagged as rebel against them, but in committees.
+    """
+    votations = _filter_votations(sitting, from_date, to_date)
+    charge_votes = ChargeVote.objects.filter(votation__in=votations).values_list(
+        'id', 'votation', 'charge', 'vote', 'votation__sitting__date',
+        'votation__sitting__institution__institution_type'
+    )
+
+    group_votes = {}
+    # (charge vote id, vote, group vote key) of the charge votes that can be rebel
+    votes = []
+    groups = {}
+    for (pk, votation_id, charge_id, vote, sitting_date, institution_type) in charge_votes.iterator():
+        try:
+            group = groups[(charge_id, sitting_date)]
+        except KeyError:
+            try:
+                group = membership_timeline.group_of(charge_id, sitting_date)
+            except MultipleObjectsReturned:
+                logger.warning("charge %s belongs to more than one group at %s: votes not counted" %
+                               (charge_id, sitting_date))
+                group = None
+            groups[(charge_id, sitting_date)] = group
+        if group is None:
+            continue
+
+        key = (votation_id, group.pk)
+        gv = group_votes.get(key)
+        if gv is None:
+            gv = group_votes[key] = GroupVote(votation_id=votation_id, group_id=group.pk)
+        gv.add_charge_vote(vote)
+        if institution_type != Institution.COMMITTEE:
+            votes.append((pk, vote, key))
+
+    existing = GroupVote.objects.filter(votation__in=votations).values_list('id', 'votation', 'group')
+
+    fields = ('vote', 'n_presents', 'n_yes', 'n_no', 'n_abst', 'n_rebels', 'n_absents')
+    for gv in group_votes.values():
+        gv.compute_vote()
+    update_rows = []
+    inserted = dict(group_votes)
+    for (pk, votation_id, group_id) in existing:
+        # stale group votes are reset
+        gv = inserted.pop((votation_id, group_id), None)
+        if gv is None:
+            gv = GroupVote()
+            gv.compute_vote()
+        update_rows.append(tuple(getattr(gv, f) for f in fields) + (pk, ))
+    bulk_update(GroupVote, fields, update_rows)
+
+    now = datetime.now()
+    bulk_insert(GroupVote, ('created', 'modified', 'votation', 'group') + fields, [
+        (now, now, gv.votation_id, gv.group_id) + tuple(getattr(gv, f) for f in fields)
+        for gv in inserted.values()
+    ])
+
+    # rebel flags, from the rebuilt group votes
+    rebel_ids = [pk for (pk, vote, key) in votes if group_votes[key].is_rebel_vote(vote)]
+    ChargeVote.objects.filter(votation__in=votations, is_rebel=True).exclude(
+        votation__sitting__institution__institution_type=Institution.COMMITTEE
+    ).update(is_rebel=False)
+    for start in range(0, len(rebel_ids), 500):
+        ChargeVote.objects.filter(id__in=rebel_ids[start:start + 500]).update(is_rebel=True)
+
+
+def update_charge_counters(charges):
+    """
+    Recompute ``n_rebel_votations``, ``n_present_votations`` and ``n_absent_votations``
+    of the given charges (a queryset or a list of ids), with a single aggregate query
+    """
+    if isinstance(charges, QuerySet):
+        charge_ids = charges.values_list('id', flat=True)
+    else:
+        charge_ids = charges
+    counters = dict((pk, [0, 0, 0]) for pk in charge_ids)
+    for (pk, vote, is_rebel, n) in ChargeVote.objects.filter(charge__in=charges).\
+        values_list('charge', 'vote', 'is_rebel').annotate(n=Count('id')).order_by():
+        if is_rebel:
+            counters[pk][0] += n
+        if vote == ChargeVote.VOTES.absent:
+            counters[pk][2] += n
+        else:
+            counters[pk][1] += n
+    bulk_update(InstitutionCharge, ('n_rebel_votations', 'n_present_votations', 'n_absent_votations'),
+                [tuple(n) + (pk, ) for (pk, n) in counters.items()])
+
+
+@transaction.commit_on_success
+def rebuild_vote_counters(sitting=None, from_date=None, to_date=None):
+    """
+    Recompute all the cached counters related to votations:
+
+    * the ``GroupVote`` counters (and vote), and the ``ChargeVote.is_rebel`` flags
+    * ``Votation.n_absents`` and ``Votation.n_rebels``
+    * ``InstitutionCharge`` rebellion and presence counters
+
+    Group votes and rebel flags are recomputed first, since the other counters
+    are counted from the rebel flags.
+
+    Counters can be recomputed incrementally, for the votations
+    of a single sitting or of a dates range; charges counters are recomputed
+    for all the charges that voted in those votations.
+    """
+    votations = _filter_votations(sitting, from_date, to_date)
+
+    update_group_vote_counters(sitting, from_date, to_date)
+    update_votation_counters(votations)
+
+    if sitting is None and from_date is None and to_date is None:
+        charges = InstitutionCharge.objects.all()
+    else:
+        charges = InstitutionCharge.objects.filter(chargevote__votation__in=votations).distinct()
+    update_charge_counters(charges)
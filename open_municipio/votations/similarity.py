@@ -0,0 +1,93 @@
+"""
+Voting similarity between charges ("who votes like whom").
+
+The agreement rate between two charges is the share of the votations where
+both expressed a yes, no or abstained vote, in which they voted the same way.
+
+Rates are computed from the vote matrix (see ``votations.matrix``), with
+matrix products over one-hot encodings of the votes, one block of rows
+at a time, so that memory stays bounded. Only the ``TOP_K`` most similar
+charges of each charge are stored, as ``ChargeSimilarity`` records.
+
+Since the agreement between two charges only changes when both vote in a new
+votation, after an import only the rows of the charges who voted in the
+imported sittings need to be recomputed.
+"""
+import numpy as np
+
+from django.db import transaction
+
+from open_municipio.votations.matrix import VOTE_CODES, VOTE_MASK, get_vote_matrix
+from open_municipio.votations.models import ChargeSimilarity, ChargeVote
+
+
+# number of similar charges stored for each charge
+TOP_K = 10
+
+# minimum number of common votations for a rate to be significant
+MIN_COMMON_VOTATIONS = 10
+
+# number of rows computed at once
+BLOCK_SIZE = 256
+
+
+def compute_similarities(matrix, charge_ids=None, k=TOP_K, block_size=BLOCK_SIZE):
+    """
+    Generate, for each of the given charges (all the charges in ``matrix``, by default),
+    the tuple ``(charge_id, [(similar_charge_id, agreement, n_votations), ...])``
+    of its top ``k`` most similar charges, sorted by descending agreement.
+    """
+    codes = matrix.votes & VOTE_MASK
+    choices = [
+        (codes == VOTE_CODES[v]).astype(np.float32)
+        for v in (ChargeVote.VOTES.yes, ChargeVote.VOTES.no, ChargeVote.VOTES.abstained)
+    ]
+    present = choices[0] + choices[1] + choices[2]
+
+    if charge_ids is None:
+        rows = np.arange(len(matrix.charge_ids))
+    else:
+        charge_ids = np.array(list(charge_ids), dtype=matrix.charge_ids.dtype)
+        rows = np.searchsorted(matrix.charge_ids, charge_ids[np.in1d(charge_ids, matrix.charge_ids)])
+
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        common = present[block].dot(present.T)
+        agree = sum(c[block].dot(c.T) for c in choices)
+        rates = np.where(common >= MIN_COMMON_VOTATIONS, agree / np.maximum(common, 1), -1)
+        # a charge is not similar to itself
+        rates[np.arange(len(block)), block] = -1
+
+        top = np.argsort(-rates, axis=1, kind='mergesort')[:, :k]
+        for (i, row) in enumerate(block):
+            yield int(matrix.charge_ids[row]), [
+                (int(matrix.charge_ids[j]), float(rates[i, j]), int(common[i, j]))
+                for j in top[i] if rates[i, j] >= 0
+            ]
+
+
+@transaction.commit_on_success
+def update_charge_similarities(charge_ids=None, matrix=None):
+    """
+    Recompute and store the similar charges of the given charges (all, by default).
+    """
+    matrix = matrix or get_vote_matrix()
+    if matrix is None:
+        return
+
+    similarities = ChargeSimilarity.objects.all()
+    if charge_ids is not None:
+        charge_ids = list(charge_ids)
+        similarities = similarities.filter(charge__in=charge_ids)
+    similarities.delete()
+
+    records = []
+    for (charge_id, similar) in compute_similarities(matrix, charge_ids):
+        for (rank, (similar_id, agreement, n_votations)) in enumerate(similar):
+            records.append(ChargeSimilarity(
+                charge_id=charge_id, similar_charge_id=similar_id, rank=rank + 1,
+                agreement=agreement, n_votations=n_votations
+            ))
+    # insert in batches, to stay within the DB limits on query parameters
+    for start in range(0, len(records), 100):
+        ChargeSimilarity.objects.bulk_create(records[start:start + 100])
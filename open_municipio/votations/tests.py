@@ -7,6 +7,8 @@ Replace this with more appropriate tests for your application.
 
 from django.test import TestCase
 
+from open_municipio.votations.models import ChargeVote, GroupVote
+
 
 class SimpleTest(TestCase):
     def test_basic_addition(self):
@@ -14,3 +16,65 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class GroupVoteTest(TestCase):
+    def group_vote(self, *votes):
+        gv = GroupVote()
+        for vote in votes:
+            gv.add_charge_vote(vote)
+        gv.compute_vote()
+        return gv
+
+    def test_counters(self):
+        gv = self.group_vote(ChargeVote.VOTES.yes, ChargeVote.VOTES.yes, ChargeVote.VOTES.no,
+                             ChargeVote.VOTES.abstained, ChargeVote.VOTES.absent)
+        self.assertEqual((gv.n_yes, gv.n_no, gv.n_abst, gv.n_presents, gv.n_absents), (2, 1, 1, 4, 1))
+
+    def test_many_votes_at_once(self):
+        gv = GroupVote()
+        gv.add_charge_vote(ChargeVote.VOTES.no, n=3)
+        self.assertEqual((gv.n_no, gv.n_presents), (3, 3))
+
+    def test_present_but_not_voting(self):
+        gv = self.group_vote(ChargeVote.VOTES.secret, ChargeVote.VOTES.canceled, ChargeVote.VOTES.pres)
+        self.assertEqual((gv.n_yes, gv.n_no, gv.n_abst, gv.n_presents, gv.n_absents), (0, 0, 0, 3, 0))
+        self.assertEqual(gv.vote, GroupVote.VOTES.noncomputable)
+
+    def test_untracked_vote_is_not_counted(self):
+        gv = self.group_vote(ChargeVote.VOTES.untracked)
+        self.assertEqual((gv.n_presents, gv.n_absents), (0, 0))
+
+    def test_majority(self):
+        gv = self.group_vote(ChargeVote.VOTES.no, ChargeVote.VOTES.no, ChargeVote.VOTES.yes,
+                             ChargeVote.VOTES.abstained)
+        self.assertEqual(gv.vote, GroupVote.VOTES.no)
+        self.assertEqual(gv.n_rebels, 2)
+
+    def test_tie_is_noncomputable(self):
+        gv = self.group_vote(ChargeVote.VOTES.yes, ChargeVote.VOTES.no, ChargeVote.VOTES.abstained)
+        self.assertEqual(gv.vote, GroupVote.VOTES.noncomputable)
+        gv = self.group_vote(ChargeVote.VOTES.yes, ChargeVote.VOTES.yes, ChargeVote.VOTES.abstained,
+                             ChargeVote.VOTES.abstained, ChargeVote.VOTES.no)
+        self.assertEqual(gv.vote, GroupVote.VOTES.noncomputable)
+
+    def test_all_absent_is_noncomputable(self):
+        gv = self.group_vote(ChargeVote.VOTES.absent, ChargeVote.VOTES.absent)
+        self.assertEqual(gv.vote, GroupVote.VOTES.noncomputable)
+
+    def test_rebel_votes(self):
+        gv = self.group_vote(ChargeVote.VOTES.yes, ChargeVote.VOTES.yes, ChargeVote.VOTES.no)
+        self.assertFalse(gv.is_rebel_vote(ChargeVote.VOTES.yes))
+        self.assertTrue(gv.is_rebel_vote(ChargeVote.VOTES.no))
+        self.assertTrue(gv.is_rebel_vote(ChargeVote.VOTES.abstained))
+
+    def test_not_voting_is_never_rebel(self):
+        gv = self.group_vote(ChargeVote.VOTES.yes, ChargeVote.VOTES.yes, ChargeVote.VOTES.no)
+        for vote in (ChargeVote.VOTES.secret, ChargeVote.VOTES.canceled, ChargeVote.VOTES.pres,
+                     ChargeVote.VOTES.absent, ChargeVote.VOTES.untracked):
+            self.assertFalse(gv.is_rebel_vote(vote))
+
+    def test_no_rebels_against_noncomputable_vote(self):
+        gv = self.group_vote(ChargeVote.VOTES.yes, ChargeVote.VOTES.no)
+        for vote in (ChargeVote.VOTES.yes, ChargeVote.VOTES.no, ChargeVote.VOTES.abstained):
+            self.assertFalse(gv.is_rebel_vote(vote))
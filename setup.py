@@ -31,6 +31,7 @@ setup(
         "sorl-thumbnail",
         "docutils",
         "django-tinymce",
+        "numpy",
     ],
     classifiers=['Development Status :: 4 - Beta',
                  'Environment :: Web Environment',